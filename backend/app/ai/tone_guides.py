@@ -1,4 +1,5 @@
 from dataclasses import asdict, dataclass
+from functools import lru_cache
 from typing import Dict, List, Optional
 
 from app.db.models import AnswerTone
@@ -187,12 +188,18 @@ def _localize_guide_to_it(guide: ToneGuide, tone: AnswerTone) -> ToneGuide:
     )
 
 
-def get_tone_guide(tone: AnswerTone, locale: Optional[str] = None) -> ToneGuide:
+@lru_cache(maxsize=None)
+def _tone_guide(tone: AnswerTone, italian: bool) -> ToneGuide:
     guide = TONE_GUIDES.get(tone) or TONE_GUIDES[AnswerTone.TECHNICAL]
-    if (locale or "").lower().startswith("it"):
+    if italian:
         return _localize_guide_to_it(guide, tone)
     return guide
 
 
+def get_tone_guide(tone: AnswerTone, locale: Optional[str] = None) -> ToneGuide:
+    """Tone guide for a locale. Memoized: callers share the instance and must not mutate it."""
+    return _tone_guide(tone, (locale or "").lower().startswith("it"))
+
+
 def list_tone_guides() -> List[Dict]:
     return [guide.to_public() for guide in TONE_GUIDES.values()]
@@ -18,6 +18,26 @@ class Settings(BaseSettings):
 
     openai_api_key: str = Field(default="", alias="OPENAI_API_KEY")
     openai_chat_model: str = Field(default="gpt-4o-mini", alias="OPENAI_CHAT_MODEL")
+    # Smaller model for LOW-accuracy generation and local-tier reranks; empty = openai_chat_model.
+    openai_fast_chat_model: str = Field(default="", alias="OPENAI_FAST_CHAT_MODEL")
+    # JSON overrides per route, e.g. {"generate.LOW": {"model": "gpt-4o-mini", "max_tokens": 500}}
+    chat_model_routes: str = Field(default="", alias="MODEL_ROUTES")
+    # Start generating from hybrid-ranked context while the LLM rerank runs (HIGH accuracy).
+    speculative_generation: bool = Field(default=False, alias="SPECULATIVE_GENERATION")
+    # Time budget for one Copilot answer; every model/embedding call gets a timeout from what is left.
+    copilot_deadline_s: float = Field(default=60.0, alias="COPILOT_DEADLINE_S")
+    # Fire one duplicate of a slow idempotent call (query embedding, rerank) after its p95 latency.
+    hedge_requests: bool = Field(default=True, alias="HEDGE_REQUESTS")
+    # Background ingestion: worker threads per process (0 = this process only enqueues) and attempts per job.
+    ingest_workers: int = Field(default=2, alias="INGEST_WORKERS")
+    ingest_max_attempts: int = Field(default=3, alias="INGEST_MAX_ATTEMPTS")
+    # PDF/DOCX/PPTX parsing runs in this many processes (0 = in the calling thread), each file
+    # limited to EXTRACT_TIMEOUT_S and each worker process to EXTRACT_MEMORY_MB (0 = unlimited).
+    extract_workers: int = Field(default=2, alias="EXTRACT_WORKERS")
+    extract_timeout_s: float = Field(default=120.0, alias="EXTRACT_TIMEOUT_S")
+    extract_memory_mb: int = Field(default=1024, alias="EXTRACT_MEMORY_MB")
+    # Prompt tokens for recent conversation turns; older turns are folded into Conversation.summary.
+    history_token_budget: int = Field(default=1500, alias="HISTORY_TOKEN_BUDGET")
     openai_embed_model: str = Field(default="text-embedding-3-small", alias="OPENAI_EMBED_MODEL")
     embedding_dim: int = Field(default=1536, alias="EMBEDDING_DIM")
 
@@ -80,6 +80,7 @@ DEFAULT_TAGS = [
 def init_db(db: Session):
     _sync_columns()
     Base.metadata.create_all(bind=engine)
+    _ensure_search_indexes()
 
     # Seed areas
     existing = {a.key: a for a in db.query(Area).all()}
@@ -132,6 +133,11 @@ def _sync_columns():
     add_column("chunks", "page INTEGER")
     add_column("chunks", "section VARCHAR(255)")
     add_column("chunks", "is_latest BOOLEAN NOT NULL DEFAULT 1")
+    add_column("chunks", "token_count INTEGER")
+    add_column("chunks", "content_hash VARCHAR(64)")
+    add_column("ingestion_jobs", "chunks_reused INTEGER")
+    add_column("document_versions", "content_hash VARCHAR(64)")
+    add_column("legal_examples", "content_hash VARCHAR(64)")
     add_column("access_requests", "decided_by_user_id INTEGER")
     add_column("access_requests", "decided_at DATETIME")
     add_column("access_requests", "decision_reason TEXT")
@@ -140,15 +146,33 @@ def _sync_columns():
     add_column("analytics_events", f"answer_tone VARCHAR(32) NOT NULL DEFAULT '{AnswerTone.C_EXECUTIVE.value}'")
     add_column("analytics_events", "tokens_in INTEGER")
     add_column("analytics_events", "tokens_out INTEGER")
+    add_column("analytics_events", "tokens_cached INTEGER")
     add_column("analytics_events", "latency_ms INTEGER")
+    add_column("analytics_events", "route VARCHAR(64)")
+    add_column("analytics_events", "model VARCHAR(128)")
     add_column("areas", "color VARCHAR(16)")
     add_column("conversations", "workspace_id INTEGER NOT NULL DEFAULT 1")
+    add_column("conversations", "summary TEXT")
+    add_column("conversations", "summary_through DATETIME")
     add_column("conversation_messages", "meta JSON")
 
     _migrate_analytics_enums(insp)
     _backfill_conversation_meta(insp)
 
 
+def _ensure_search_indexes():
+    # Lexical retrieval ranks with ts_rank on Postgres; without this index every question scans chunks.
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_chunks_content_fts "
+                "ON chunks USING GIN (to_tsvector('simple', content))"
+            )
+        )
+
+
 def _backfill_conversation_meta(insp):
     if not insp.has_table("conversation_messages"):
         return
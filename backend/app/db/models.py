@@ -85,6 +85,14 @@ class ContentSource(str, enum.Enum):
     MANUAL = "MANUAL"
 
 
+class IngestionStatus(str, enum.Enum):
+    QUEUED = "QUEUED"
+    EXTRACTING = "EXTRACTING"
+    EMBEDDING = "EMBEDDING"
+    INDEXED = "INDEXED"
+    FAILED = "FAILED"
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
@@ -203,6 +211,12 @@ class Document(Base):
         order_by="DocumentVersion.version.desc()",
         foreign_keys="DocumentVersion.document_id",
     )
+    ingestion_jobs = relationship(
+        "IngestionJob",
+        back_populates="document",
+        cascade="all, delete-orphan",
+        order_by="IngestionJob.id.desc()",
+    )
     latest_version_ref = relationship(
         "DocumentVersion",
         primaryjoin="Document.latest_version_id==DocumentVersion.id",
@@ -211,6 +225,22 @@ class Document(Base):
         foreign_keys="Document.latest_version_id",
     )
 
+    @property
+    def ingestion(self):
+        """Latest ingestion job (the upload or version being indexed, or the last one that ran)."""
+        return self.ingestion_jobs[0] if self.ingestion_jobs else None
+
+
+class Blob(Base):
+    """An uploaded file, stored once per content; ref_count counts the versions and legal examples using it."""
+
+    __tablename__ = "blobs"
+    sha256 = Column(String(64), primary_key=True)
+    storage_path = Column(String, nullable=False)  # stored name in the uploads dir, or Supabase object path
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=utcnow, nullable=False)
+
 
 class DocumentVersion(Base):
     __tablename__ = "document_versions"
@@ -218,6 +248,7 @@ class DocumentVersion(Base):
     document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
     version = Column(Integer, nullable=False)
     file_path = Column(String, nullable=False)
+    content_hash = Column(String(64), ForeignKey("blobs.sha256"), nullable=True, index=True)
     original_name = Column(String, nullable=False)
     mime_type = Column(String, default="", nullable=False)
     created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -244,6 +275,8 @@ class Chunk(Base):
     content = Column(Text, nullable=False)
     page = Column(Integer, nullable=True)
     section = Column(String, nullable=True)
+    token_count = Column(Integer, nullable=True)  # embed-model tokens, set at ingest for context packing
+    content_hash = Column(String(64), nullable=True)  # sha256 of content; unchanged chunks carry over to new versions
 
     # Vector mapping
     vector_id = Column(Integer, nullable=True)  # position inside FAISS index
@@ -259,6 +292,58 @@ class Chunk(Base):
     version = relationship("DocumentVersion", back_populates="chunks", foreign_keys=[version_id])
 
 
+class IngestionJob(Base):
+    """One document version to extract, chunk, embed and index; claimed by the ingestion workers."""
+
+    __tablename__ = "ingestion_jobs"
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
+    version_id = Column(Integer, ForeignKey("document_versions.id"), nullable=False)
+    status = Column(String, default=IngestionStatus.QUEUED.value, nullable=False, index=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    chunks_total = Column(Integer, nullable=True)
+    chunks_reused = Column(Integer, nullable=True)  # carried over unchanged from the previous version
+    error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, default=utcnow, nullable=False)
+    locked_by = Column(String, nullable=True)  # worker that claimed the current attempt
+    locked_at = Column(DateTime, nullable=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=utcnow, nullable=False)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+    document = relationship("Document", back_populates="ingestion_jobs")
+    version = relationship("DocumentVersion")
+
+
+class BatchQAJob(Base):
+    """Questions answered in the background (POST /copilot/batch); answers are BatchQAResult rows."""
+
+    __tablename__ = "batch_qa_jobs"
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(String, default="queued", nullable=False)  # queued, retrieving, answering, done, failed
+    total = Column(Integer, nullable=False)
+    completed = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow, nullable=False)  # heartbeat of the running job
+    finished_at = Column(DateTime, nullable=True, index=True)
+
+    results = relationship("BatchQAResult", cascade="all, delete-orphan", passive_deletes=True)
+
+
+class BatchQAResult(Base):
+    __tablename__ = "batch_qa_results"
+    id = Column(Integer, primary_key=True)  # completion order
+    job_id = Column(String, ForeignKey("batch_qa_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    question_index = Column(Integer, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=utcnow, nullable=False)
+
+
 class AnalyticsEvent(Base):
     __tablename__ = "analytics_events"
     id = Column(Integer, primary_key=True)
@@ -272,7 +357,12 @@ class AnalyticsEvent(Base):
     answer_tone = Column(String, default=AnswerTone.C_EXECUTIVE.value, nullable=False)
     tokens_in = Column(Integer, nullable=True)
     tokens_out = Column(Integer, nullable=True)
+    # Prompt tokens served from the provider's prompt cache (part of tokens_in).
+    tokens_cached = Column(Integer, nullable=True)
     latency_ms = Column(Integer, nullable=True)
+    # Set on "model_call" events: routing key (e.g. "generate.LOW") and the model it resolved to.
+    route = Column(String, nullable=True)
+    model = Column(String, nullable=True)
 
 
 class ConversationRole(str, enum.Enum):
@@ -292,6 +382,9 @@ class Conversation(Base):
     created_at = Column(DateTime, default=utcnow, nullable=False)
     updated_at = Column(DateTime, default=utcnow, onupdate=utcnow, nullable=False)
     deleted_at = Column(DateTime, nullable=True)
+    # Rolling summary of every message up to summary_through (created_at of the last one folded in).
+    summary = Column(Text, nullable=True)
+    summary_through = Column(DateTime, nullable=True)
 
     area = relationship("Area")
     creator = relationship("User")
@@ -629,6 +722,7 @@ class LegalExample(Base):
     mime_type = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
     storage_path = Column(String, nullable=False)
+    content_hash = Column(String(64), ForeignKey("blobs.sha256"), nullable=True, index=True)
 
     uploaded_by = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     uploaded_at = Column(DateTime, default=utcnow, nullable=False)
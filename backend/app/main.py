@@ -7,6 +7,8 @@ from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.db.session import SessionLocal
 from app.db.init_db import init_db
+from app.services.circuit_breaker import provider_breaker
+from app.services.ingest_queue import start_ingestion_workers
 
 from app.routers import (
     auth,
@@ -49,6 +51,7 @@ def startup():
         logger.exception("Startup DB init failed (continuing without DB)")
     finally:
         db.close()
+    start_ingestion_workers()
 
 
 # ---------- Routers ----------
@@ -91,13 +94,15 @@ def ready():
     Optional readiness check:
     - returns ok if DB connection works
     - returns degraded if DB is unavailable
+    - reports the LLM provider circuit breaker; an open breaker only degrades answers
+      to the extractive path, so it does not change status
     """
     db: Session = SessionLocal()
     try:
         db.execute("SELECT 1")
-        return {"status": "ok", "db": "ok"}
+        return {"status": "ok", "db": "ok", "llm": provider_breaker.state}
     except Exception:
         logger.exception("Readiness DB check failed")
-        return {"status": "degraded", "db": "unavailable"}
+        return {"status": "degraded", "db": "unavailable", "llm": provider_breaker.state}
     finally:
         db.close()
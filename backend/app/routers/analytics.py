@@ -1,7 +1,7 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy import func
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
 
 from app.db.models import AnalyticsEvent, User, Document, AccuracyLevel, AnswerTone
@@ -15,6 +15,7 @@ from app.schemas.analytics import (
     UnansweredRow,
     QuestionsSummary,
     QuestionsTrends,
+    ModelRouteRow,
 )
 from app.utils.permissions import get_user_allowed_area_ids
 from app.utils.date_ranges import resolve_date_range, to_utc_range
@@ -337,3 +338,54 @@ def questions_trends(
         by_accuracy=[{"date": r[0], "accuracy_level": r[1], "count": int(r[2])} for r in accuracy_rows],
         by_tone=[{"date": r[0], "answer_tone": r[1], "count": int(r[2])} for r in tone_rows],
     )
+
+
+@router.get("/model-routes", response_model=list[ModelRouteRow])
+def model_routes(
+    range: str = Query("7d"),
+    start_date: str | None = Query(None),
+    end_date: str | None = Query(None),
+    db: Session = Depends(get_db),
+    user: User = Depends(super_admin_user),
+):
+    """
+    Per-route latency and token usage of model calls, for tuning MODEL_ROUTES. Cache columns
+    cover calls whose provider reported prompt-cache usage.
+    """
+    start_ts, end_ts = _resolve_range(range, start_date, end_date)
+    rows = (
+        db.query(
+            AnalyticsEvent.route,
+            AnalyticsEvent.model,
+            func.count(AnalyticsEvent.id),
+            func.sum(case((AnalyticsEvent.event_type == "model_call_failed", 1), else_=0)),
+            func.avg(AnalyticsEvent.latency_ms),
+            func.avg(AnalyticsEvent.tokens_in),
+            func.avg(AnalyticsEvent.tokens_out),
+            func.sum(AnalyticsEvent.tokens_cached),
+            func.sum(case((AnalyticsEvent.tokens_cached.isnot(None), AnalyticsEvent.tokens_in), else_=0)),
+            func.avg(case((AnalyticsEvent.tokens_cached > 0, AnalyticsEvent.latency_ms))),
+            func.avg(case((AnalyticsEvent.tokens_cached == 0, AnalyticsEvent.latency_ms))),
+        )
+        .filter(AnalyticsEvent.event_type.in_(["model_call", "model_call_failed"]))
+        .filter(AnalyticsEvent.created_at >= start_ts)
+        .filter(AnalyticsEvent.created_at <= end_ts)
+        .group_by(AnalyticsEvent.route, AnalyticsEvent.model)
+        .order_by(AnalyticsEvent.route)
+        .all()
+    )
+    return [
+        ModelRouteRow(
+            route=r[0] or "",
+            model=r[1] or "",
+            calls=int(r[2]),
+            failures=int(r[3] or 0),
+            avg_latency_ms=float(r[4]) if r[4] is not None else None,
+            avg_tokens_in=float(r[5]) if r[5] is not None else None,
+            avg_tokens_out=float(r[6]) if r[6] is not None else None,
+            cached_token_ratio=round(float(r[7]) / float(r[8]), 4) if r[7] is not None and r[8] else None,
+            avg_latency_ms_cache_hit=float(r[9]) if r[9] is not None else None,
+            avg_latency_ms_cache_miss=float(r[10]) if r[10] is not None else None,
+        )
+        for r in rows
+    ]
@@ -1,19 +1,29 @@
+import json
+import logging
 import time
 from typing import List, Optional
+
+import anyio
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from app.ai.tone_guides import get_tone_guide, list_tone_guides
-from app.db.session import get_db
+from app.db.session import SessionLocal, get_db
 from app.db.models import Area, Conversation, ConversationMessage, ConversationRole, User, AnalyticsEvent, utcnow
 from app.core.security import decode_token
-from app.schemas.copilot import CopilotAskIn, CopilotAskOut, ToneGuideOut
-from app.services.rag import answer_with_rag
+from app.schemas.copilot import CopilotAskIn, CopilotAskOut, CopilotBatchIn, CopilotBatchJobOut, ToneGuideOut
+from app.services.batch_qa import get_job, job_events, job_view, submit_batch
+from app.services.conversation_memory import HISTORY_MESSAGE_CHARS, load_history, schedule_summary_refresh
+from app.services.deadlines import request_deadline
+from app.services.rag import answer_with_rag_async, stream_answer_with_rag
 from app.utils.permissions import get_allowed_area_ids, require_area_access
 from app.schemas.copilot import MatchOut
 
 router = APIRouter(prefix="/copilot", tags=["copilot"])
+logger = logging.getLogger(__name__)
 bearer = HTTPBearer()
 
 def current_user(creds: HTTPAuthorizationCredentials = Depends(bearer), db: Session = Depends(get_db)) -> User:
@@ -31,13 +41,34 @@ def list_tones(_: User = Depends(current_user)):
     return list_tone_guides()
 
 
-@router.post("/ask", response_model=CopilotAskOut)
-def ask(data: CopilotAskIn, request: Request, db: Session = Depends(get_db), user: User = Depends(current_user)):
+def _resolve_locale(data: CopilotAskIn, request: Request) -> str:
     accept_language = request.headers.get("accept-language") or ""
     locale = data.locale or (accept_language.split(",")[0].split("-")[0].strip().lower() if accept_language else None) or "en"
-    if locale not in ("en", "it"):
-        locale = "en"
+    return locale if locale in ("en", "it") else "en"
 
+
+def _followup_pool(db: Session, conversation: Conversation) -> Optional[dict]:
+    """The candidate pool stored with the conversation's latest answer, for follow-up reuse."""
+    last_answer = (
+        db.query(ConversationMessage)
+        .filter(ConversationMessage.conversation_id == conversation.id)
+        .filter(ConversationMessage.role == ConversationRole.ASSISTANT.value)
+        .filter(ConversationMessage.deleted_at.is_(None))
+        .order_by(ConversationMessage.created_at.desc())
+        .first()
+    )
+    meta = ((last_answer.meta or {}).get("meta") or {}) if last_answer else {}
+    pool = meta.get("followup_pool")
+    return pool if isinstance(pool, dict) and pool.get("chunk_ids") else None
+
+
+def _start_turn(data: CopilotAskIn, db: Session, user: User, locale: str):
+    """
+    Resolve the conversation and area scope, load history (summary + unsummarized turns;
+    rag trims it to HISTORY_TOKEN_BUDGET) and the previous answer's candidate pool, and
+    commit the user message.
+    Returns (conversation, target_area_ids, history_payload, user_message, followup).
+    """
     allowed = set(get_allowed_area_ids(db, user, require_manage=False))
     conversation: Optional[Conversation] = None
     target_area_ids: list[int] = []
@@ -96,19 +127,8 @@ def ask(data: CopilotAskIn, request: Request, db: Session = Depends(get_db), use
         db.commit()
         db.refresh(conversation)
 
-    history_messages = (
-        db.query(ConversationMessage)
-        .filter(ConversationMessage.conversation_id == conversation.id)
-        .filter(ConversationMessage.deleted_at.is_(None))
-        .order_by(ConversationMessage.created_at.desc())
-        .limit(11)
-        .all()
-    )
-    history_payload = []
-    for m in reversed(history_messages):
-        content = (m.content or "")[:2000]
-        if content:
-            history_payload.append({"role": m.role, "content": content})
+    history_payload = load_history(db, conversation)
+    followup = _followup_pool(db, conversation) if data.conversation_id else None
 
     now = utcnow()
     user_message = ConversationMessage(
@@ -125,36 +145,45 @@ def ask(data: CopilotAskIn, request: Request, db: Session = Depends(get_db), use
     )
     db.add(user_message)
 
-    if (not conversation.title or conversation.title.strip().lower() == "new chat") and len(history_messages) == 0:
+    if (not conversation.title or conversation.title.strip().lower() == "new chat") and not history_payload:
         snippet = (data.query or "New chat").strip()
         conversation.title = (snippet[:77] + "...") if len(snippet) > 80 else (snippet or "New chat")
 
     conversation.updated_at = now
     db.add(conversation)
-    db.flush()
-    history_payload.append({"role": user_message.role, "content": user_message.content[:2000]})
+    # Committed before any model call, so the pooled connection is not held while answering.
+    db.commit()
+    history_payload.append({"role": ConversationRole.USER.value, "content": data.query[:HISTORY_MESSAGE_CHARS]})
+    return conversation, target_area_ids, history_payload, user_message, followup
 
-    start_time = time.time()
-    rag_result = answer_with_rag(
-        db,
-        data.query,
-        target_area_ids,
-        top_k=max(1, min(12, data.top_k)),
-        accuracy_level=data.accuracy_level,
-        answer_tone=data.answer_tone,
-        locale=locale,
-        chat_history=history_payload,
-    )
-    latency_ms = int((time.time() - start_time) * 1000)
+
+def _record_answer(
+    db: Session,
+    data: CopilotAskIn,
+    user: User,
+    conversation: Conversation,
+    target_area_ids: list[int],
+    rag_result: dict,
+    latency_ms: int,
+    locale: str,
+    user_message_id: Optional[str] = None,
+) -> Optional[ConversationMessage]:
+    """
+    Write analytics events and the assistant message for a finished answer, then commit.
+    When user_message_id is given and there is no answer text at all, the failure is
+    recorded on that user message (meta.answer_error) instead and None is returned.
+    """
     usage = rag_result.get("usage") or {}
     tokens_in = usage.get("prompt_tokens")
     tokens_out = usage.get("completion_tokens")
+    tokens_cached = usage.get("cached_tokens")
     meta = rag_result.get("meta") or {}
     meta.setdefault("accuracy_level", data.accuracy_level.value)
     meta.setdefault("answer_tone", data.answer_tone.value)
     meta["latency_ms"] = latency_ms
     meta["tokens_in"] = tokens_in
     meta["tokens_out"] = tokens_out
+    meta["tokens_cached"] = tokens_cached
     meta["conversation_id"] = conversation.id
     areas = db.query(Area).filter(Area.id.in_(target_area_ids)).all() if target_area_ids else []
     meta["areas"] = [{"id": a.id, "name": a.name, "color": a.color} for a in areas]
@@ -174,10 +203,29 @@ def ask(data: CopilotAskIn, request: Request, db: Session = Depends(get_db), use
                 answer_tone=data.answer_tone.value,
                 tokens_in=tokens_in,
                 tokens_out=tokens_out,
+                tokens_cached=tokens_cached,
                 latency_ms=latency_ms,
             )
         )
 
+    for call in meta.get("model_calls") or []:
+        db.add(
+            AnalyticsEvent(
+                event_type="model_call" if call.get("ok") else "model_call_failed",
+                user_id=user.id,
+                area_id=target_area_ids[0] if target_area_ids else None,
+                created_at=utcnow(),
+                accuracy_level=data.accuracy_level.value,
+                answer_tone=data.answer_tone.value,
+                tokens_in=call.get("tokens_in"),
+                tokens_out=call.get("tokens_out"),
+                tokens_cached=call.get("tokens_cached"),
+                latency_ms=call.get("latency_ms"),
+                route=call.get("route"),
+                model=call.get("model"),
+            )
+        )
+
     matches = rag_result.get("matches", [])
     best_score = rag_result.get("best_score", 0.0)
     if not matches or best_score < 0.25:
@@ -194,6 +242,17 @@ def ask(data: CopilotAskIn, request: Request, db: Session = Depends(get_db), use
                 )
             )
 
+    if user_message_id is not None and not rag_result.get("answer"):
+        question = db.get(ConversationMessage, user_message_id)
+        question.meta = dict(
+            question.meta or {},
+            answer_error={"reason": meta.get("error", "generation_failed"), "latency_ms": latency_ms},
+        )
+        db.add(question)
+        db.commit()
+        rag_result["meta"] = meta
+        return None
+
     sources = rag_result.get("sources", matches)
     evidence_level = meta.get("evidence_level")
     assistant_message = ConversationMessage(
@@ -217,9 +276,29 @@ def ask(data: CopilotAskIn, request: Request, db: Session = Depends(get_db), use
     db.add(assistant_message)
     db.add(conversation)
     db.commit()
-    db.refresh(user_message)
     db.refresh(assistant_message)
+    rag_result["meta"] = meta
+    schedule_summary_refresh(conversation.id)
+    return assistant_message
+
 
+def _finish_ask(
+    db: Session,
+    data: CopilotAskIn,
+    user: User,
+    conversation: Conversation,
+    target_area_ids: list[int],
+    rag_result: dict,
+    latency_ms: int,
+    locale: str,
+    user_message: ConversationMessage,
+) -> CopilotAskOut:
+    """Persist the answer and build the response; touches expired ORM rows, so it runs off the loop."""
+    assistant_message = _record_answer(db, data, user, conversation, target_area_ids, rag_result, latency_ms, locale)
+    db.refresh(user_message)
+
+    matches = rag_result.get("matches", [])
+    sources = rag_result.get("sources", matches)
     return CopilotAskOut(
         answer=assistant_message.content,
         matches=[MatchOut(**m) for m in matches],
@@ -227,8 +306,210 @@ def ask(data: CopilotAskIn, request: Request, db: Session = Depends(get_db), use
         accuracy_level=data.accuracy_level,
         answer_tone=data.answer_tone,
         best_score=rag_result.get("best_score"),
-        meta=meta,
+        meta=rag_result["meta"],
         conversation_id=conversation.id,
         message_id=assistant_message.id,
         user_message_id=user_message.id,
     )
+
+
+@router.post("/ask", response_model=CopilotAskOut)
+async def ask(data: CopilotAskIn, request: Request, db: Session = Depends(get_db), user: User = Depends(current_user)):
+    """
+    Async route: only the short DB sections run on the threadpool, so a question waiting on
+    the model holds no worker thread. The session is never used by two threads at once.
+    The COPILOT_DEADLINE_S budget starts here and bounds every model/embedding call.
+    """
+    deadline = request_deadline()
+    locale = _resolve_locale(data, request)
+    conversation, target_area_ids, history_payload, user_message, followup = await run_in_threadpool(
+        _start_turn, data, db, user, locale
+    )
+
+    start_time = time.time()
+    rag_result = await answer_with_rag_async(
+        db,
+        data.query,
+        target_area_ids,
+        top_k=max(1, min(12, data.top_k)),
+        accuracy_level=data.accuracy_level,
+        answer_tone=data.answer_tone,
+        locale=locale,
+        chat_history=history_payload,
+        deadline=deadline,
+        followup=followup,
+    )
+    latency_ms = int((time.time() - start_time) * 1000)
+    return await run_in_threadpool(
+        _finish_ask, db, data, user, conversation, target_area_ids, rag_result, latency_ms, locale, user_message
+    )
+
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+@router.post("/ask/stream")
+def ask_stream(data: CopilotAskIn, request: Request, db: Session = Depends(get_db), user: User = Depends(current_user)):
+    """
+    Server-Sent Events variant of /ask. Events: "start" (conversation and user message ids),
+    "sources" (sources + meta, as soon as retrieval and rerank finish), "token" (answer
+    deltas), "done" (assistant message id and final meta) and "error". The assistant
+    message and analytics rows are written when the stream completes or the client
+    disconnects (partial answer, meta.interrupted). A stream cut off before any answer
+    text stores no assistant message; the user message gets meta.answer_error instead.
+    """
+    deadline = request_deadline()
+    locale = _resolve_locale(data, request)
+    conversation, target_area_ids, history_payload, user_message, followup = _start_turn(data, db, user, locale)
+    conversation_id, user_message_id, user_id = conversation.id, user_message.id, user.id
+
+    def events():
+        # The request-scoped session is closed before the body streams, so the stream owns one.
+        stream_db = SessionLocal()
+        start_time = time.time()
+        parts: list[str] = []
+        first_token_ms: Optional[int] = None
+        partial: dict = {}
+        result: Optional[dict] = None
+        failed = False
+        try:
+            yield _sse("start", {"conversation_id": conversation_id, "user_message_id": user_message_id})
+            for event, payload in stream_answer_with_rag(
+                stream_db,
+                data.query,
+                target_area_ids,
+                top_k=max(1, min(12, data.top_k)),
+                accuracy_level=data.accuracy_level,
+                answer_tone=data.answer_tone,
+                locale=locale,
+                chat_history=history_payload,
+                deadline=deadline,
+                followup=followup,
+            ):
+                if event == "sources":
+                    partial = payload
+                elif event == "token":
+                    if first_token_ms is None:
+                        first_token_ms = int((time.time() - start_time) * 1000)
+                    parts.append(payload["text"])
+                elif event == "done":
+                    result = payload
+                    continue  # sent after persisting, with message ids
+                yield _sse(event, payload)
+        except Exception:
+            logger.exception("Copilot stream failed")
+            failed = True
+            yield _sse("error", {"detail": "Answer generation failed"})
+        finally:
+            interrupted = result is None
+            if interrupted:
+                result = {
+                    "answer": "".join(parts).strip(),
+                    "sources": partial.get("sources", []),
+                    "matches": partial.get("sources", []),
+                    "best_score": max((s["score"] for s in partial.get("sources", [])), default=0.0),
+                    "meta": dict(
+                        partial.get("meta") or {},
+                        interrupted=True,
+                        error="generation_failed" if failed else "cancelled",
+                    ),
+                }
+            result["meta"]["ttft_ms"] = first_token_ms
+            try:
+                assistant_message = _record_answer(
+                    stream_db,
+                    data,
+                    stream_db.get(User, user_id),
+                    stream_db.get(Conversation, conversation_id),
+                    target_area_ids,
+                    result,
+                    int((time.time() - start_time) * 1000),
+                    locale,
+                    user_message_id=user_message_id if interrupted else None,
+                )
+                if assistant_message is not None and not interrupted:
+                    yield _sse("done", {"message_id": assistant_message.id, "conversation_id": conversation_id, "meta": result["meta"]})
+            finally:
+                stream_db.close()
+
+    async def event_stream():
+        # Step the blocking generator off the event loop. On disconnect the response task is
+        # cancelled; closing the generator (shielded) runs its persistence block.
+        gen = events()
+        try:
+            while True:
+                chunk = await run_in_threadpool(next, gen, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(gen.close)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/batch", response_model=CopilotBatchJobOut, status_code=status.HTTP_202_ACCEPTED)
+def submit_batch_questions(
+    data: CopilotBatchIn, request: Request, db: Session = Depends(get_db), user: User = Depends(current_user)
+):
+    """
+    Answer up to 500 questions as one background job (regression checks, FAQ generation).
+    All questions share one embedding pass and one vector search; answers are generated with
+    bounded concurrency. Poll GET /copilot/batch/{job_id} or follow /events. Batch answers
+    are not stored as conversations.
+    """
+    allowed = set(get_allowed_area_ids(db, user, require_manage=False))
+    area_ids = data.area_ids or list(allowed)
+    if any(aid not in allowed for aid in area_ids) and not user.is_super_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    if not area_ids:
+        raise HTTPException(status_code=400, detail="area_ids must not be empty")
+    return submit_batch(
+        user.id,
+        data.questions,
+        area_ids,
+        data.accuracy_level,
+        data.answer_tone,
+        _resolve_locale(data, request),
+        top_k=max(1, min(12, data.top_k)),
+    )
+
+
+def _batch_job(job_id: str, user: User) -> dict:
+    job = get_job(job_id)
+    if job is None or (job["user_id"] != user.id and not user.is_admin_role):
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+
+@router.get("/batch/{job_id}", response_model=CopilotBatchJobOut)
+def get_batch_job(job_id: str, user: User = Depends(current_user)):
+    return job_view(_batch_job(job_id, user))
+
+
+@router.get("/batch/{job_id}/events")
+def batch_job_events(job_id: str, user: User = Depends(current_user)):
+    """
+    Server-Sent Events for a batch job: "result" per answered question (completion order),
+    "progress" with counts, and a final "done". Reconnecting replays the answers so far.
+    """
+    job = _batch_job(job_id, user)
+
+    def events():
+        for item in job_events(job):
+            if item is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield _sse(*item)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -2,7 +2,7 @@ import os
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy import func
 from sqlalchemy.orm import Session
@@ -15,16 +15,17 @@ from app.db.models import (
     User,
     Document,
     DocumentVersion,
-    Chunk,
     AnalyticsEvent,
+    IngestionJob,
     utcnow,
 )
 from app.core.security import decode_token
 from app.core.config import settings
-from app.schemas.document import DocumentOut, DocumentDetailOut
-from app.utils.files import save_upload_bytes, file_path
+from app.schemas.document import DocumentOut, DocumentDetailOut, IngestionJobOut
+from app.utils.files import file_path
 from app.utils.permissions import require_area_access, get_allowed_area_ids
-from app.services.ingest import ingest_document
+from app.services.blobs import release_blob, store_blob
+from app.services.ingest_queue import TERMINAL, enqueue_ingestion, job_events
 from app.services.supabase_storage import SupabaseStorageError, create_signed_download_url
 
 router = APIRouter(prefix="/documents", tags=["documents"])
@@ -113,6 +114,39 @@ def list_documents(
     return query.all()
 
 
+def _ingestion_job(db: Session, user: User, job_id: int) -> IngestionJob:
+    job = db.get(IngestionJob, job_id)
+    if not job or not job.document:
+        raise HTTPException(status_code=404, detail="Not found")
+    require_area_access(db, user, job.document.area_id, require_manage=False)
+    return job
+
+
+@router.get("/ingestion-jobs/{job_id}", response_model=IngestionJobOut)
+def get_ingestion_job(job_id: int, db: Session = Depends(get_db), user: User = Depends(current_user)):
+    return _ingestion_job(db, user, job_id)
+
+
+@router.get("/ingestion-jobs/{job_id}/events")
+def ingestion_job_events(job_id: int, db: Session = Depends(get_db), user: User = Depends(current_user)):
+    _ingestion_job(db, user, job_id)
+
+    def gen():
+        for progress in job_events(job_id):
+            if progress is None:
+                yield ": keep-alive\n\n"
+                continue
+            payload = IngestionJobOut.model_validate(progress).model_dump(mode="json")
+            event = "done" if progress["status"] in TERMINAL else "progress"
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    return StreamingResponse(
+        gen(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/{doc_id}", response_model=DocumentDetailOut)
 def get_document(doc_id: int, db: Session = Depends(get_db), user: User = Depends(current_user)):
     doc = db.get(Document, doc_id)
@@ -141,9 +175,10 @@ async def upload_document(
 
     file_bytes = await file.read()
     try:
-        stored_name = save_upload_bytes(file_bytes, file.filename, file.content_type or "application/octet-stream")
+        blob = store_blob(db, file_bytes, file.filename, file.content_type or "application/octet-stream")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    stored_name = blob.storage_path
 
     doc = Document(
         area_id=area_id,
@@ -163,6 +198,7 @@ async def upload_document(
         document_id=doc.id,
         version=1,
         file_path=stored_name,
+        content_hash=blob.sha256,
         original_name=file.filename,
         mime_type=file.content_type or "",
         created_by=user.id,
@@ -177,8 +213,8 @@ async def upload_document(
     db.commit()
     db.refresh(doc)
 
-    ingest_document(db, doc, version, file_bytes)
-
+    enqueue_ingestion(db, doc, version, user.id)
+    db.refresh(doc)
     return doc
 
 
@@ -198,15 +234,17 @@ async def upload_version(
 
     file_bytes = await file.read()
     try:
-        stored_name = save_upload_bytes(file_bytes, file.filename, file.content_type or "application/octet-stream")
+        blob = store_blob(db, file_bytes, file.filename, file.content_type or "application/octet-stream")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    stored_name = blob.storage_path
 
     next_version = (doc.latest_version or 1) + 1
     version = DocumentVersion(
         document_id=doc.id,
         version=next_version,
         file_path=stored_name,
+        content_hash=blob.sha256,
         original_name=file.filename,
         mime_type=file.content_type or "",
         created_by=user.id,
@@ -215,9 +253,7 @@ async def upload_version(
     db.commit()
     db.refresh(version)
 
-    # Mark previous chunks as non-latest
-    db.query(Chunk).filter(Chunk.document_id == doc.id).update({"is_latest": False})
-
+    # Previous chunks stay searchable until the new version is indexed.
     doc.latest_version = next_version
     doc.latest_version_id = version.id
     doc.filename = stored_name
@@ -227,8 +263,8 @@ async def upload_version(
     db.commit()
     db.refresh(doc)
 
-    ingest_document(db, doc, version, file_bytes)
-
+    enqueue_ingestion(db, doc, version, user.id)
+    db.refresh(doc)
     return doc
 
 
@@ -269,10 +305,18 @@ def delete_document(doc_id: int, db: Session = Depends(get_db), user: User = Dep
     if not doc:
         raise HTTPException(status_code=404, detail="Not found")
     require_area_access(db, user, doc.area_id, require_manage=True)
+    if doc.deleted_at:
+        return {"status": "deleted", "id": doc.id}
 
+    # The versions' files can no longer be downloaded; drop their blob references.
+    hashes = [v.content_hash for v in doc.versions if v.content_hash]
+    for v in doc.versions:
+        v.content_hash = None
     doc.deleted_at = utcnow()
     db.add(doc)
     db.commit()
+    for sha in hashes:
+        release_blob(db, sha)
     return {"status": "deleted", "id": doc.id}
 
 
@@ -52,6 +52,7 @@ from app.schemas.legal_examples import (
     LegalTemplateGenerateWithExamplesIn,
     LegalTemplateGenerateWithExamplesOut,
 )
+from app.utils.files import file_path
 from app.utils.permissions import (
     require_legal_approve,
     require_legal_delete,
@@ -59,14 +60,13 @@ from app.utils.permissions import (
     require_legal_template_admin,
     require_legal_view,
 )
-from app.utils.text_extract import extract_text_from_bytes
+from app.services.blobs import release_blob, store_blob
+from app.services.extraction import extract_text
 from app.services.supabase_storage import (
     SupabaseStorageError,
-    build_legal_example_object_path,
     create_signed_download_url,
     delete_object,
     download_bytes,
-    upload_bytes,
 )
 
 
@@ -830,6 +830,11 @@ async def upload_examples(
         if len(data) > max_bytes:
             raise HTTPException(status_code=400, detail=f"File too large: {original}")
 
+        try:
+            blob = store_blob(db, data, original, f.content_type or "application/octet-stream")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
         ex = LegalExample(
             title=(title.strip() if title and title.strip() else original),
             document_type=document_type.strip(),
@@ -839,7 +844,8 @@ async def upload_examples(
             file_name=original,
             mime_type=f.content_type or "application/octet-stream",
             file_size=len(data),
-            storage_path="",
+            storage_path=blob.storage_path if settings.storage_provider == "supabase" else file_path(blob.storage_path),
+            content_hash=blob.sha256,
             uploaded_by=user.id,
             status=LegalExampleStatus.UPLOADED.value,
             tags=tags_list,
@@ -848,20 +854,6 @@ async def upload_examples(
         db.commit()
         db.refresh(ex)
 
-        if settings.storage_provider == "supabase":
-            try:
-                object_path = build_legal_example_object_path(ex.id, original)
-                upload_bytes(object_path=object_path, data=data, content_type=ex.mime_type)
-                ex.storage_path = object_path
-            except SupabaseStorageError as e:
-                raise HTTPException(status_code=500, detail=str(e))
-        else:
-            os.makedirs(_example_dir(ex.id), exist_ok=True)
-            stored = os.path.join(_example_dir(ex.id), original)
-            with open(stored, "wb") as fp:
-                fp.write(data)
-            ex.storage_path = stored
-
         ex.status = LegalExampleStatus.EXTRACTING.value
         db.add(ex)
         _audit(db, actor_id=user.id, action="example_uploaded", metadata={"example_id": ex.id, "file_name": original})
@@ -869,7 +861,17 @@ async def upload_examples(
         db.refresh(ex)
 
         try:
-            text = extract_text_from_bytes(data, original)
+            # Same bytes already extracted for another example: reuse its text.
+            cached = (
+                db.query(LegalExample.extracted_text)
+                .filter(
+                    LegalExample.content_hash == blob.sha256,
+                    LegalExample.id != ex.id,
+                    LegalExample.status == LegalExampleStatus.READY.value,
+                )
+                .first()
+            )
+            text = cached[0] if cached and cached[0] else extract_text(data, original)
             if not text.strip():
                 ex.status = LegalExampleStatus.FAILED.value
                 ex.error_message = "NO_TEXT_FOUND"
@@ -1047,10 +1049,13 @@ def delete_example(example_id: str, db: Session = Depends(get_db), user: User =
     if not ex:
         raise HTTPException(status_code=404, detail="Example not found")
     path = ex.storage_path
+    sha = ex.content_hash
     db.delete(ex)
     _audit(db, actor_id=user.id, action="example_deleted", metadata={"example_id": example_id})
     db.commit()
-    if settings.storage_provider == "supabase":
+    if sha:
+        release_blob(db, sha)
+    elif settings.storage_provider == "supabase":
         if path:
             try:
                 delete_object(object_path=path)
@@ -1089,7 +1094,7 @@ def retry_extraction(example_id: str, db: Session = Depends(get_db), user: User
         with open(ex.storage_path, "rb") as fp:
             data = fp.read()
     try:
-        text = extract_text_from_bytes(data, ex.file_name)
+        text = extract_text(data, ex.file_name)
         if not text.strip():
             ex.status = LegalExampleStatus.FAILED.value
             ex.error_message = "NO_TEXT_FOUND"
@@ -1136,10 +1141,6 @@ def _template_out(t: LegalTemplate) -> LegalTemplateOut:
     )
 
 
-def _example_dir(example_id: str) -> str:
-    return os.path.join(settings.data_dir, "legal_examples", example_id)
-
-
 def _sanitize_filename(name: str) -> str:
     base = os.path.basename(name or "example")
     base = re.sub(r"[^a-zA-Z0-9\\-_. ]+", "", base).strip()
@@ -66,3 +66,17 @@ class ToneTrendPoint(BaseModel):
 class QuestionsTrends(BaseModel):
     by_accuracy: List[AccuracyTrendPoint]
     by_tone: List[ToneTrendPoint]
+
+
+class ModelRouteRow(BaseModel):
+    route: str
+    model: str
+    calls: int
+    failures: int
+    avg_latency_ms: Optional[float]
+    avg_tokens_in: Optional[float]
+    avg_tokens_out: Optional[float]
+    # Share of prompt tokens served from the provider prompt cache, and latency with vs without a cache hit.
+    cached_token_ratio: Optional[float] = None
+    avg_latency_ms_cache_hit: Optional[float] = None
+    avg_latency_ms_cache_miss: Optional[float] = None
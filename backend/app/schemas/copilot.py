@@ -76,6 +76,33 @@ class CopilotAskIn(BaseModel):
         return self
 
 
+class CopilotBatchIn(BaseModel):
+    questions: List[str] = Field(min_length=1, max_length=500)
+    area_ids: List[int] = Field(default_factory=list)
+    locale: Optional[str] = None
+    top_k: int = 6
+    accuracy_level: AccuracyLevel = AccuracyLevel.MEDIUM
+    answer_tone: AnswerTone = AnswerTone.C_EXECUTIVE
+
+    @model_validator(mode="after")
+    def normalize(self):
+        self.questions = [q.strip() for q in self.questions if q and q.strip()]
+        if not self.questions:
+            raise ValueError("questions must not be empty")
+        self.locale = _normalize_locale(self.locale)
+        return self
+
+
+class CopilotBatchJobOut(BaseModel):
+    job_id: str
+    status: str
+    total: int
+    completed: int
+    failed: int
+    error: Optional[str] = None
+    results: Optional[List[dict]] = None
+
+
 class Highlight(BaseModel):
     start: int
     end: int
@@ -102,6 +129,9 @@ class CopilotMeta(BaseModel):
     evidence_level: Optional[str] = None
     latency_ms: Optional[int] = None
     timings: Optional[dict] = None
+    pipeline: Optional[dict] = None
+    context: Optional[dict] = None
+    model_calls: Optional[list] = None
     tone_reference: Optional[str] = None
     tone_preview: Optional[str] = None
     confidence_percent: Optional[int] = None
@@ -109,6 +139,9 @@ class CopilotMeta(BaseModel):
     confidence_explanation: Optional[str] = None
     tokens_in: Optional[int] = None
     tokens_out: Optional[int] = None
+    tokens_cached: Optional[int] = None
+    degraded: Optional[bool] = None
+    degraded_reason: Optional[str] = None
     conversation_id: Optional[str] = None
     accuracy_percent: Optional[int] = None
     areas: Optional[list[dict]] = None
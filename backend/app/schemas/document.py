@@ -38,5 +38,21 @@ class DocumentOut(BaseModel):
             return []
 
 
+class IngestionJobOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    document_id: int
+    version_id: int
+    status: str
+    attempts: int
+    chunks_total: Optional[int] = None
+    chunks_reused: Optional[int] = None
+    error: Optional[str] = None
+    next_attempt_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
 class DocumentDetailOut(DocumentOut):
     versions: List[DocumentVersionOut]
+    ingestion: Optional[IngestionJobOut] = None
@@ -0,0 +1,221 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from app.db.models import AccuracyLevel, AnswerTone, BatchQAJob, BatchQAResult, utcnow
+from app.db.session import SessionLocal
+from app.services.rag import answer_with_rag, retrieve_candidates_batch
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_QUESTIONS = 500
+# Answers generated at once across all batch jobs; interactive /copilot/ask traffic is not counted.
+BATCH_CONCURRENCY = 8
+# Finished jobs are kept this long for polling and late event-stream clients.
+BATCH_JOB_TTL_S = 3600
+
+# Jobs not finished whose heartbeat is older than this were cut off by a restart.
+BATCH_STALE_AFTER_S = 600
+TERMINAL = ("done", "failed")
+
+_job_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="batch-qa")
+_answer_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch-qa-answer")
+
+
+def _purge_expired(db: Session) -> None:
+    cutoff = utcnow() - timedelta(seconds=BATCH_JOB_TTL_S)
+    expired = select(BatchQAJob.id).where(BatchQAJob.finished_at < cutoff)
+    db.execute(delete(BatchQAResult).where(BatchQAResult.job_id.in_(expired)))
+    db.execute(delete(BatchQAJob).where(BatchQAJob.finished_at < cutoff))
+    db.commit()
+
+
+def _update(job_id: str, **fields: Any) -> None:
+    with SessionLocal() as db:
+        db.execute(update(BatchQAJob).where(BatchQAJob.id == job_id).values(updated_at=utcnow(), **fields))
+        db.commit()
+
+
+def _item(index: int, question: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    meta = result.get("meta") or {}
+    return {
+        "index": index,
+        "question": question,
+        "answer": result["answer"],
+        "sources": result["sources"],
+        "best_score": result["best_score"],
+        "evidence_level": meta.get("evidence_level"),
+        "confidence_percent": meta.get("confidence_percent"),
+        "degraded": meta.get("degraded"),
+        "usage": result.get("usage"),
+    }
+
+
+def _run_job(
+    job_id: str,
+    questions: List[str],
+    area_ids: List[int],
+    accuracy_level: AccuracyLevel,
+    answer_tone: AnswerTone,
+    locale: str,
+    top_k: int,
+) -> None:
+    _update(job_id, status="retrieving", started_at=utcnow())
+    db = SessionLocal()
+    try:
+        pools = retrieve_candidates_batch(db, questions, area_ids, vec_top_k=max(20, top_k * 3))
+    except Exception:
+        logger.exception("Batch QA job %s failed during retrieval", job_id)
+        _update(job_id, status="failed", error="Retrieval failed", finished_at=utcnow())
+        return
+    finally:
+        db.close()
+
+    _update(job_id, status="answering")
+    futures = {
+        _answer_executor.submit(
+            answer_with_rag,
+            None,
+            question,
+            area_ids,
+            top_k=top_k,
+            accuracy_level=accuracy_level,
+            answer_tone=answer_tone,
+            locale=locale,
+            candidates=pool,
+        ): index
+        for index, (question, pool) in enumerate(zip(questions, pools))
+    }
+    with SessionLocal() as db:
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                item = _item(index, questions[index], future.result())
+            except Exception:
+                logger.warning("Batch QA job %s: question %s failed", job_id, index, exc_info=True)
+                item = {"index": index, "question": questions[index], "error": "Answer generation failed"}
+            # The answer and the counters land together, so readers never see one without the other.
+            db.add(BatchQAResult(job_id=job_id, question_index=index, payload=item))
+            db.execute(
+                update(BatchQAJob)
+                .where(BatchQAJob.id == job_id)
+                .values(
+                    completed=BatchQAJob.completed + 1,
+                    failed=BatchQAJob.failed + int("error" in item),
+                    updated_at=utcnow(),
+                )
+            )
+            db.commit()
+    _update(job_id, status="done", finished_at=utcnow())
+
+
+def submit_batch(
+    user_id: int,
+    questions: List[str],
+    area_ids: List[int],
+    accuracy_level: AccuracyLevel,
+    answer_tone: AnswerTone,
+    locale: str,
+    top_k: int = 6,
+) -> Dict[str, Any]:
+    """
+    Store a batch QA job and start it on this process; returns its public view. The job
+    and its answers live in the DB, so any worker can serve job_view/job_events.
+    """
+    with SessionLocal() as db:
+        _purge_expired(db)
+        job = BatchQAJob(user_id=user_id, status="queued", total=len(questions))
+        db.add(job)
+        db.commit()
+        view = _progress(job)
+    _job_executor.submit(_run_job, view["job_id"], questions, area_ids, accuracy_level, answer_tone, locale, top_k)
+    return view
+
+
+def _progress(job: BatchQAJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "completed": job.completed,
+        "failed": job.failed,
+        "error": job.error,
+    }
+
+
+def _load(db: Session, job_id: str) -> Optional[BatchQAJob]:
+    # A job whose process died mid-run would otherwise stay "answering" forever.
+    cutoff = utcnow() - timedelta(seconds=BATCH_STALE_AFTER_S)
+    res = db.execute(
+        update(BatchQAJob)
+        .where(BatchQAJob.id == job_id, BatchQAJob.status.notin_(TERMINAL), BatchQAJob.updated_at < cutoff)
+        .values(status="failed", error="Interrupted before finishing", finished_at=utcnow())
+    )
+    if res.rowcount:
+        db.commit()
+    return db.get(BatchQAJob, job_id)
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Progress counts of a job plus its user_id, or None."""
+    with SessionLocal() as db:
+        job = _load(db, job_id)
+        return {**_progress(job), "user_id": job.user_id} if job is not None else None
+
+
+def job_view(job: Dict[str, Any], include_results: bool = True) -> Dict[str, Any]:
+    view = {k: v for k, v in job.items() if k != "user_id"}
+    if include_results:
+        with SessionLocal() as db:
+            rows = (
+                db.query(BatchQAResult.payload)
+                .filter(BatchQAResult.job_id == job["job_id"])
+                .order_by(BatchQAResult.question_index.asc())
+                .all()
+            )
+        view["results"] = [payload for (payload,) in rows]
+    return view
+
+
+def job_events(job: Dict[str, Any], poll_s: float = 1.0, heartbeat_s: float = 15.0) -> Iterator[Any]:
+    """
+    Yields ("progress", counts) on every status change and ("result", item) per answered
+    question in completion order, then ("done", counts). None marks an idle heartbeat.
+    Read from the DB, so it works whichever process runs the job; a client connecting late
+    first receives everything answered so far.
+    """
+    last_result_id = 0
+    last = None
+    idle_since = time.monotonic()
+    while True:
+        with SessionLocal() as db:
+            row = _load(db, job["job_id"])
+            if row is None:
+                return
+            progress = _progress(row)
+            new_items = (
+                db.query(BatchQAResult.id, BatchQAResult.payload)
+                .filter(BatchQAResult.job_id == row.id, BatchQAResult.id > last_result_id)
+                .order_by(BatchQAResult.id.asc())
+                .all()
+            )
+        if new_items:
+            last_result_id = new_items[-1][0]
+            for _, payload in new_items:
+                yield "result", payload
+        if progress["status"] in TERMINAL:
+            yield "done", progress
+            return
+        if progress != last:
+            last = progress
+            idle_since = time.monotonic()
+            yield "progress", progress
+        elif not new_items and time.monotonic() - idle_since >= heartbeat_s:
+            idle_since = time.monotonic()
+            yield None
+        time.sleep(poll_s)
@@ -0,0 +1,51 @@
+import hashlib
+import logging
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.models import Blob
+from app.utils.files import delete_stored, save_blob_bytes
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def store_blob(db: Session, data: bytes, original_name: str, content_type: str) -> Blob:
+    """
+    The Blob for data with one more reference taken, committed. The bytes are written to
+    storage only the first time this content is seen; later uploads cost the hash.
+    """
+    sha = content_hash(data)
+    for _ in range(2):
+        res = db.execute(update(Blob).where(Blob.sha256 == sha).values(ref_count=Blob.ref_count + 1))
+        if res.rowcount == 1:
+            db.commit()
+            return db.get(Blob, sha, populate_existing=True)
+        stored = save_blob_bytes(data, sha, original_name, content_type)
+        db.add(Blob(sha256=sha, storage_path=stored, size=len(data), ref_count=1))
+        try:
+            db.commit()
+            return db.get(Blob, sha)
+        except IntegrityError:
+            # A concurrent upload of the same content created the row first; take a reference on it.
+            db.rollback()
+    raise RuntimeError(f"Could not store blob {sha}")
+
+
+def release_blob(db: Session, sha: str) -> None:
+    """Drop one reference (committed); the stored file is deleted with the last one."""
+    db.execute(update(Blob).where(Blob.sha256 == sha, Blob.ref_count > 0).values(ref_count=Blob.ref_count - 1))
+    blob = db.get(Blob, sha, populate_existing=True)
+    stored = blob.storage_path if blob is not None else None
+    res = db.execute(delete(Blob).where(Blob.sha256 == sha, Blob.ref_count <= 0))
+    db.commit()
+    if res.rowcount and stored:
+        try:
+            delete_stored(stored)
+        except Exception:
+            logger.warning("Could not delete stored blob %s", sha, exc_info=True)
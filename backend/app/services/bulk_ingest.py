@@ -0,0 +1,407 @@
+"""
+Bulk ingestion of a directory tree, one Area per top-level folder (documents/sales/... ->
+area "sales"). Files flow through overlapping stages joined by bounded queues:
+
+  scan (read + hash) -> extract + chunk (threads over the extraction pool)
+    -> embed (batched across files) -> write (one session: blob, document, version, chunks)
+
+A JSONL manifest next to the tree records each file's hash and document as it is
+registered and indexed, so an interrupted run resumes where it stopped. Files whose size
+and mtime match the manifest are skipped without being read; the others are hashed and
+skipped when the hash is unchanged. A changed file becomes a new version of its document.
+"""
+
+import json
+import logging
+import mimetypes
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from app.db.models import Area, Chunk, Document, DocumentVersion, IngestionJob, IngestionStatus, utcnow
+from app.services.blobs import content_hash, store_blob
+from app.services.ingest import (
+    INGEST_EMBED_BATCH,
+    find_indexed_copy,
+    iter_file_chunks,
+    iter_indexed_chunks,
+    store_chunks,
+)
+from app.services.rag import embed_texts
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".bulk_ingest_manifest.jsonl"
+REGISTERED = "registered"
+INDEXED = "indexed"
+FAILED = "failed"
+
+# Sentinel closing a stage's input queue.
+_DONE = object()
+
+
+class Manifest:
+    """Append-only JSONL of {"path", "sha256", "status", ...}; the last line per path wins."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a line cut short by an interruption
+                        continue
+                    self.entries[entry["path"]] = entry
+        self._lock = threading.Lock()
+        self._fp = open(path, "a", encoding="utf-8")
+
+    def get(self, rel: str) -> Optional[dict]:
+        return self.entries.get(rel)
+
+    def record(self, rel: str, **fields) -> None:
+        entry = {"path": rel, **fields, "at": utcnow().isoformat()}
+        with self._lock:
+            self.entries[rel] = entry
+            self._fp.write(json.dumps(entry) + "\n")
+            self._fp.flush()
+
+    def close(self) -> None:
+        self._fp.close()
+
+
+class _Task:
+    __slots__ = ("rel", "name", "area_id", "data", "sha", "stat", "entry", "chunks", "to_embed")
+
+    def __init__(self, rel: str, name: str, area_id: int, data: bytes, sha: str, stat: os.stat_result, entry: Optional[dict]):
+        self.rel = rel
+        self.name = name
+        self.area_id = area_id
+        self.data = data
+        self.sha = sha
+        self.stat = stat
+        self.entry = entry or {}
+        self.chunks: List[Dict[str, object]] = []
+        # chunks that are neither copied with their embedding nor already in the document
+        self.to_embed: List[Dict[str, object]] = []
+
+
+def iter_tree(root: str) -> Iterator[str]:
+    """Relative paths of the files under root, sorted, skipping hidden files and folders."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if not name.startswith("."):
+                yield os.path.relpath(os.path.join(dirpath, name), root)
+
+
+def _latest_hashes(db: Session, document_id: int) -> Set[str]:
+    rows = db.query(Chunk.content_hash).filter(Chunk.document_id == document_id, Chunk.is_latest.is_(True))
+    return {h for (h,) in rows if h}
+
+
+def run_bulk_ingest(
+    root: str,
+    user_id: int,
+    session_factory: Callable[[], Session],
+    manifest_path: Optional[str] = None,
+    area_map: Optional[Dict[str, str]] = None,
+    extract_threads: int = 4,
+    embed_threads: int = 2,
+    queue_size: int = 32,
+    on_progress: Optional[Callable[[Dict[str, int]], None]] = None,
+    progress_every_s: float = 10.0,
+) -> Dict[str, int]:
+    """
+    Ingest every file under root into the Area named by its top-level folder (area_map
+    renames folders to area keys; files in other folders are skipped). Returns counts:
+    scanned, unchanged, skipped, indexed, failed, chunks, embedded, reused.
+    """
+    area_map = area_map or {}
+    manifest = Manifest(manifest_path or os.path.join(root, MANIFEST_NAME))
+    stats = dict.fromkeys(("scanned", "unchanged", "skipped", "indexed", "failed", "chunks", "embedded", "reused"), 0)
+    stats_lock = threading.Lock()
+    stop = threading.Event()
+    vector_lock = threading.Lock()
+
+    def count(**deltas: int) -> None:
+        with stats_lock:
+            for key, value in deltas.items():
+                stats[key] += value
+
+    def fail(task: _Task, error: Exception) -> None:
+        logger.warning("Bulk ingest of %s failed: %s", task.rel, error)
+        entry = manifest.get(task.rel) or {}
+        manifest.record(
+            task.rel,
+            sha256=task.sha,
+            status=FAILED,
+            error=str(error)[:500],
+            document_id=entry.get("document_id"),
+            version_id=entry.get("version_id"),
+        )
+        count(failed=1)
+
+    with session_factory() as db:
+        areas = {a.key: a.id for a in db.query(Area).all()}
+
+    to_extract: "queue.Queue" = queue.Queue(queue_size)
+    to_embed: "queue.Queue" = queue.Queue(queue_size)
+    to_write: "queue.Queue" = queue.Queue(queue_size)
+
+    def scan() -> None:
+        unknown: Set[str] = set()
+        try:
+            for rel in iter_tree(root):
+                if stop.is_set():
+                    return
+                if os.path.abspath(os.path.join(root, rel)) == os.path.abspath(manifest.path):
+                    continue
+                count(scanned=1)
+                folder = rel.split(os.sep, 1)[0] if os.sep in rel else ""
+                area_id = areas.get(area_map.get(folder, folder))
+                if area_id is None:
+                    if folder not in unknown:
+                        unknown.add(folder)
+                        logger.warning("Skipping folder %r: no area with that key", folder or ".")
+                    count(skipped=1)
+                    continue
+                path = os.path.join(root, rel)
+                stat = os.stat(path)
+                entry = manifest.get(rel)
+                indexed = entry is not None and entry.get("status") == INDEXED
+                if indexed and (entry.get("size"), entry.get("mtime_ns")) == (stat.st_size, stat.st_mtime_ns):
+                    count(unchanged=1)
+                    continue
+                with open(path, "rb") as f:
+                    data = f.read()
+                sha = content_hash(data)
+                if indexed and entry.get("sha256") == sha:
+                    # touched but not changed: remember the new mtime so the next run skips the read
+                    manifest.record(rel, **{**entry, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+                    count(unchanged=1)
+                    continue
+                if not data:
+                    count(skipped=1)
+                    continue
+                to_extract.put(_Task(rel, os.path.basename(rel), area_id, data, sha, stat, entry))
+        finally:
+            for _ in range(extract_threads):
+                to_extract.put(_DONE)
+
+    def extract() -> None:
+        with session_factory() as db:
+            while True:
+                task = to_extract.get()
+                if task is _DONE:
+                    return
+                if stop.is_set():
+                    continue
+                try:
+                    source = find_indexed_copy(db, task.sha)
+                    if source is not None:
+                        task.chunks = list(iter_indexed_chunks(db, source))
+                    else:
+                        task.chunks = list(iter_file_chunks(task.data, task.name))
+                    if not task.chunks:
+                        raise ValueError("no text found")
+                    known = _latest_hashes(db, task.entry["document_id"]) if task.entry.get("document_id") else set()
+                    db.rollback()
+                    task.to_embed = [
+                        c
+                        for c in task.chunks
+                        if c.get("embedding") is None and content_hash(str(c["text"]).encode("utf-8")) not in known
+                    ]
+                except Exception as e:
+                    db.rollback()
+                    fail(task, e)
+                    continue
+                to_embed.put(task)
+
+    def embed() -> None:
+        with session_factory() as db:
+            done = False
+            while not done:
+                task = to_embed.get()
+                if task is _DONE:
+                    return
+                # Fill one embedding batch from whatever files are ready.
+                group = [task]
+                while sum(len(t.to_embed) for t in group) < INGEST_EMBED_BATCH:
+                    try:
+                        more = to_embed.get_nowait()
+                    except queue.Empty:
+                        break
+                    if more is _DONE:
+                        done = True
+                        break
+                    group.append(more)
+                if stop.is_set():
+                    continue
+                try:
+                    pending = [c for t in group for c in t.to_embed]
+                    _embed_chunks(db, pending, vector_lock)
+                    count(embedded=len(pending))
+                except Exception as e:
+                    db.rollback()
+                    for t in group:
+                        fail(t, e)
+                    continue
+                for t in group:
+                    to_write.put(t)
+
+    def write() -> None:
+        with session_factory() as db:
+            while True:
+                task = to_write.get()
+                if task is _DONE:
+                    return
+                if stop.is_set():
+                    continue
+                try:
+                    result = _write_task(db, task, user_id, manifest)
+                except Exception as e:
+                    db.rollback()
+                    fail(task, e)
+                    continue
+                count(indexed=1, chunks=result["chunks"], reused=len(task.chunks) - len(task.to_embed))
+
+    def start(target: Callable[[], None], n: int, name: str) -> List[threading.Thread]:
+        threads = [threading.Thread(target=target, name=f"bulk-{name}-{i}", daemon=True) for i in range(n)]
+        for t in threads:
+            t.start()
+        return threads
+
+    def join(threads: List[threading.Thread]) -> None:
+        for t in threads:
+            while t.is_alive():
+                t.join(progress_every_s)
+                if on_progress and t.is_alive():
+                    with stats_lock:
+                        on_progress(dict(stats))
+
+    started = time.monotonic()
+    writer = start(write, 1, "write")
+    embedders = start(embed, embed_threads, "embed")
+    extractors = start(extract, extract_threads, "extract")
+    scanner = start(scan, 1, "scan")
+    try:
+        join(scanner + extractors)
+        for _ in embedders:
+            to_embed.put(_DONE)
+        join(embedders)
+        to_write.put(_DONE)
+        join(writer)
+    except KeyboardInterrupt:
+        # In-flight files are not in the manifest as indexed; the next run picks them up.
+        stop.set()
+        raise
+    finally:
+        manifest.close()
+    logger.info("Bulk ingest of %s finished in %.0fs: %s", root, time.monotonic() - started, stats)
+    return stats
+
+
+def _embed_chunks(db: Session, chunks: List[Dict[str, object]], vector_lock: threading.Lock) -> None:
+    """One embedding call for chunks of several files; each gets its embedding and vector_id."""
+    if not chunks:
+        return
+    vectors, store = embed_texts(db, [str(c["text"]) for c in chunks])
+    norms = (vectors**2).sum(axis=1, keepdims=True) ** 0.5
+    vectors_norm = (vectors / (norms + 1e-12)).astype("float32")
+    vector_ids = None
+    if store is not None:
+        # FAISS positions are handed out in order; one add at a time.
+        with vector_lock:
+            vector_ids = store.add_vectors(vectors_norm)
+    for i, chunk in enumerate(chunks):
+        chunk["embedding"] = vectors_norm[i]
+        chunk["vector_id"] = vector_ids[i] if vector_ids is not None else None
+
+
+def _register(db: Session, task: _Task, user_id: int) -> tuple:
+    """
+    (document, version) for the file: the version registered by an interrupted or failed run, a new
+    version of the document the file was indexed as before, or a new document.
+    """
+    entry = task.entry
+    doc = db.get(Document, entry["document_id"]) if entry.get("document_id") else None
+    if doc is not None and doc.deleted_at is not None:
+        doc = None
+    if doc is not None and entry.get("status") in (REGISTERED, FAILED) and entry.get("sha256") == task.sha:
+        version = db.get(DocumentVersion, entry.get("version_id"))
+        if version is not None and version.id == doc.latest_version_id:
+            return doc, version
+
+    mime_type = mimetypes.guess_type(task.name)[0] or "application/octet-stream"
+    blob = store_blob(db, task.data, task.name, mime_type)
+    if doc is None:
+        doc = Document(
+            area_id=task.area_id,
+            title=os.path.splitext(task.name)[0],
+            filename=blob.storage_path,
+            original_name=task.name,
+            mime_type=mime_type,
+            created_by=user_id,
+            latest_version=0,
+        )
+        db.add(doc)
+        db.flush()
+    version = DocumentVersion(
+        document_id=doc.id,
+        version=(doc.latest_version or 0) + 1,
+        file_path=blob.storage_path,
+        content_hash=blob.sha256,
+        original_name=task.name,
+        mime_type=mime_type,
+        created_by=user_id,
+    )
+    db.add(version)
+    db.flush()
+    doc.latest_version = version.version
+    doc.latest_version_id = version.id
+    doc.filename = blob.storage_path
+    doc.original_name = task.name
+    doc.mime_type = mime_type
+    db.commit()
+    return doc, version
+
+
+def _write_task(db: Session, task: _Task, user_id: int, manifest: Manifest) -> Dict[str, int]:
+    doc, version = _register(db, task, user_id)
+    manifest.record(task.rel, sha256=task.sha, status=REGISTERED, document_id=doc.id, version_id=version.id)
+    started = utcnow()
+    result = store_chunks(db, doc, version, task.chunks)
+    # Finished job row, so the document shows as indexed like an upload would.
+    db.add(
+        IngestionJob(
+            document_id=doc.id,
+            version_id=version.id,
+            status=IngestionStatus.INDEXED.value,
+            attempts=1,
+            chunks_total=result["chunks"],
+            chunks_reused=result["reused"],
+            locked_by="bulk-ingest",
+            created_by=user_id,
+            created_at=started,
+            finished_at=utcnow(),
+        )
+    )
+    db.commit()
+    manifest.record(
+        task.rel,
+        sha256=task.sha,
+        status=INDEXED,
+        document_id=doc.id,
+        version_id=version.id,
+        chunks=result["chunks"],
+        size=task.stat.st_size,
+        mtime_ns=task.stat.st_mtime_ns,
+    )
+    return result
@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError, OpenAI
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+
+# Outcomes older than this do not count towards tripping.
+BREAKER_WINDOW_S = 60.0
+BREAKER_MIN_CALLS = 10
+BREAKER_FAILURE_RATE = 0.5
+# A call is "slow" once it used this share of its own timeout; enough slow calls trip the breaker too.
+BREAKER_SLOW_FRACTION = 0.75
+BREAKER_SLOW_RATE = 0.5
+BREAKER_COOLDOWN_S = 30.0
+BREAKER_PROBE_INTERVAL_S = 10.0
+PROBE_TIMEOUT_S = 5.0
+
+
+def is_provider_failure(exc: BaseException) -> bool:
+    """
+    Whether an error says the provider is unhealthy: timeouts, connection errors, 429 and
+    5xx. Other 4xx (an oversized input, a bad request) come from a provider that answered.
+    """
+    if isinstance(exc, (APITimeoutError, APIConnectionError, TimeoutError)):
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    Trips on the error rate or the slow-call rate of recent provider calls. While open,
+    allow() is False, so callers skip the provider entirely; a background thread probes it
+    after a cooldown and closes the breaker on the first successful probe.
+    """
+
+    def __init__(self, name: str, probe: Callable[[], None]):
+        self.name = name
+        self.probe = probe
+        self._lock = threading.Lock()
+        self._outcomes: Deque[Tuple[float, bool, bool]] = deque()  # (at, ok, slow)
+        self._state = CLOSED
+        self._opened_at: Optional[float] = None
+        self._trips = 0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        return self._state == CLOSED
+
+    def record(self, ok: bool, latency_s: float, timeout_s: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._state != CLOSED:
+                return  # outcomes of calls that started before the trip change nothing
+            self._outcomes.append((now, ok, latency_s >= BREAKER_SLOW_FRACTION * timeout_s))
+            while self._outcomes and now - self._outcomes[0][0] > BREAKER_WINDOW_S:
+                self._outcomes.popleft()
+            total = len(self._outcomes)
+            if total < BREAKER_MIN_CALLS:
+                return
+            failures = sum(1 for _, call_ok, _ in self._outcomes if not call_ok)
+            slow = sum(1 for _, _, call_slow in self._outcomes if call_slow)
+            if failures / total < BREAKER_FAILURE_RATE and slow / total < BREAKER_SLOW_RATE:
+                return
+            self._state = OPEN
+            self._opened_at = now
+            self._trips += 1
+            self._outcomes.clear()
+        logger.warning("Circuit %s opened (failures=%s slow=%s of %s calls)", self.name, failures, slow, total)
+        threading.Thread(target=self._probe_until_closed, name=f"breaker-{self.name}", daemon=True).start()
+
+    def record_error(self, exc: BaseException, latency_s: float, timeout_s: float) -> None:
+        """record() for a call that raised; only provider failures count against the provider."""
+        self.record(not is_provider_failure(exc), latency_s, timeout_s)
+
+    def _probe_until_closed(self) -> None:
+        time.sleep(BREAKER_COOLDOWN_S)
+        while True:
+            try:
+                self.probe()
+            except Exception:
+                logger.info("Circuit %s probe failed; staying open", self.name, exc_info=True)
+                time.sleep(BREAKER_PROBE_INTERVAL_S)
+                continue
+            self.reset()
+            logger.warning("Circuit %s closed after a successful probe", self.name)
+            return
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._opened_at = None
+            self._outcomes.clear()
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "state": self._state,
+                "open_for_s": round(time.monotonic() - self._opened_at, 1) if self._opened_at else None,
+                "recent_calls": len(self._outcomes),
+                "trips": self._trips,
+            }
+
+
+def _probe_openai() -> None:
+    """Cheapest round trip that exercises the provider: a one-word embedding."""
+    client = OpenAI(api_key=settings.openai_api_key)
+    client.embeddings.create(model=settings.openai_embed_model, input=["ping"], timeout=PROBE_TIMEOUT_S)
+
+
+provider_breaker = CircuitBreaker("openai", probe=_probe_openai)
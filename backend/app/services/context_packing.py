@@ -0,0 +1,111 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from app.db.models import AccuracyLevel
+from app.utils.term_matcher import TermMatcher
+from app.utils.tokenization import estimate_tokens
+
+# Prompt tokens available for retrieved context, per accuracy level.
+CONTEXT_TOKEN_BUDGET = {
+    AccuracyLevel.HIGH: 6000,
+    AccuracyLevel.MEDIUM: 3500,
+    AccuracyLevel.LOW: 2000,
+}
+MIN_EXCERPT_TOKENS = 80  # stop packing once less than this is left
+NEIGHBOR_SENTENCES = 1  # context kept around each matching sentence
+ELISION = "…"
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+@dataclass
+class PackedBlock:
+    index: int  # 1-based position in top_context, so [n] citations line up with sources
+    candidate: Dict[str, Any]
+    text: str
+    tokens: int
+    trimmed: bool
+
+
+def _chunk_tokens(cand: Dict[str, Any], model: Optional[str]) -> int:
+    # Stored at ingest; only legacy rows without a count are tokenized here.
+    count = cand.get("token_count")
+    return int(count) if count else estimate_tokens(cand.get("chunk_text") or "", model=model)
+
+
+def _focused_sentences(sentences: List[str], matcher: TermMatcher) -> List[int]:
+    """Indices of sentences with a query-term hit, plus their neighbours."""
+    keep: set[int] = set()
+    for i, sentence in enumerate(sentences):
+        if matcher.score(sentence) > 0:
+            keep.update(range(max(0, i - NEIGHBOR_SENTENCES), min(len(sentences), i + NEIGHBOR_SENTENCES + 1)))
+    return sorted(keep)
+
+
+def _render(sentences: List[str], indices: List[int]) -> str:
+    """Join kept sentences, marking every omitted run (including head and tail) with ELISION."""
+    parts: List[str] = []
+    prev = -1
+    for i in indices:
+        if i != prev + 1:
+            parts.append(ELISION)
+        parts.append(sentences[i])
+        prev = i
+    if prev != len(sentences) - 1:
+        parts.append(ELISION)
+    return " ".join(parts)
+
+
+def _excerpt(text: str, total_tokens: int, matcher: TermMatcher, max_tokens: int) -> tuple[str, int, bool]:
+    """
+    Query-focused excerpt of one chunk within max_tokens. Token cost of the excerpt is
+    prorated from the chunk's stored count by character share (no re-tokenization).
+    """
+    if total_tokens <= max_tokens and matcher.score(text) == 0:
+        return text, total_tokens, False
+    sentences = [s.strip() for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+    if not sentences:
+        return "", 0, True
+    chars_per_token = max(1.0, len(text) / max(1, total_tokens))
+
+    indices = _focused_sentences(sentences, matcher) or list(range(len(sentences)))
+    kept: List[int] = []
+    used_chars = 0
+    for i in indices:
+        cost = len(sentences[i]) + 1
+        if (used_chars + cost) / chars_per_token > max_tokens:
+            break
+        kept.append(i)
+        used_chars += cost
+    if len(kept) == len(sentences):
+        return text, total_tokens, False
+    if not kept:
+        return "", 0, True
+    excerpt = _render(sentences, kept)
+    return excerpt, min(int(len(excerpt) / chars_per_token) + 1, total_tokens), True
+
+
+def pack_context(
+    candidates: List[Dict[str, Any]],
+    matcher: TermMatcher,
+    budget_tokens: int,
+    model: Optional[str] = None,
+) -> List[PackedBlock]:
+    """
+    Fit ranked chunks into budget_tokens, keeping only query-relevant sentences
+    (with neighbours) of each chunk. Higher-ranked chunks are packed first.
+    """
+    blocks: List[PackedBlock] = []
+    remaining = budget_tokens
+    for index, cand in enumerate(candidates, start=1):
+        if remaining < MIN_EXCERPT_TOKENS:
+            break
+        text = cand.get("chunk_text") or ""
+        total = _chunk_tokens(cand, model)
+        excerpt, tokens, trimmed = _excerpt(text, total, matcher, remaining)
+        if not excerpt:
+            continue
+        blocks.append(PackedBlock(index=index, candidate=cand, text=excerpt, tokens=tokens, trimmed=trimmed))
+        remaining -= tokens
+    return blocks
@@ -0,0 +1,168 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+from openai import OpenAI
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import Conversation, ConversationMessage
+from app.db.session import SessionLocal
+from app.services.circuit_breaker import provider_breaker
+from app.services.model_routing import SUMMARIZE, chat_completion
+from app.utils.tokenization import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+HISTORY_MESSAGE_CHARS = 2000
+# Unsummarized messages loaded per turn; the token budget trims further.
+HISTORY_SCAN_LIMIT = 40
+# Per-message framing the provider adds on top of the content tokens.
+MESSAGE_OVERHEAD_TOKENS = 4
+# A refresh folds old turns until the recent ones fit in this share of the budget, so the
+# summary is rewritten every few turns instead of after every answer.
+SUMMARY_KEEP_FRACTION = 0.5
+# Cap on message tokens folded per refresh; a long backlog catches up over several turns.
+SUMMARY_INPUT_TOKENS = 4000
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="conv-summary")
+_pending_lock = threading.Lock()
+_pending: Set[str] = set()
+
+
+def _message_tokens(content: str) -> int:
+    return estimate_tokens(content, model=settings.openai_chat_model) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _recent_start(contents: List[str], budget: int) -> int:
+    """Index of the oldest message in the newest run of contents that fits in budget; the last one always fits."""
+    used = 0
+    start = len(contents)
+    for idx in range(len(contents) - 1, -1, -1):
+        used += _message_tokens(contents[idx])
+        if used > budget and start < len(contents):
+            break
+        start = idx
+    return start
+
+
+def trim_history(history: List[Dict[str, str]], budget: Optional[int] = None) -> List[Dict[str, str]]:
+    """
+    The newest turns of history that fit in budget tokens (HISTORY_TOKEN_BUDGET by default),
+    oldest first. A leading summary (system) message is always kept; its size is bounded by
+    the summarize route's max_tokens instead.
+    """
+    budget = settings.history_token_budget if budget is None else budget
+    summary = [m for m in history[:1] if m.get("role") == "system"]
+    turns = []
+    for msg in history[len(summary):]:
+        content = (msg.get("content") or "").strip()[:HISTORY_MESSAGE_CHARS]
+        if content:
+            turns.append({"role": msg.get("role"), "content": content})
+    start = _recent_start([t["content"] for t in turns], budget)
+    return summary + turns[start:]
+
+
+def load_history(db: Session, conversation: Conversation) -> List[Dict[str, str]]:
+    """The conversation summary (as a system message) and the messages after it, oldest first."""
+    query = (
+        db.query(ConversationMessage)
+        .filter(ConversationMessage.conversation_id == conversation.id)
+        .filter(ConversationMessage.deleted_at.is_(None))
+    )
+    if conversation.summary_through is not None:
+        query = query.filter(ConversationMessage.created_at > conversation.summary_through)
+    rows = query.order_by(ConversationMessage.created_at.desc()).limit(HISTORY_SCAN_LIMIT).all()
+
+    history = [{"role": "system", "content": f"{SUMMARY_PREFIX}\n{conversation.summary}"}] if conversation.summary else []
+    for m in reversed(rows):
+        content = (m.content or "")[:HISTORY_MESSAGE_CHARS]
+        if content:
+            history.append({"role": m.role, "content": content})
+    return history
+
+
+def _summary_messages(summary: Optional[str], folded: List[ConversationMessage]) -> List[Dict[str, str]]:
+    prompt = (
+        "You maintain the running summary of a conversation between a user and a knowledge-base "
+        "assistant. Merge the new messages into the summary. Keep facts, names, numbers, decisions "
+        "and open questions the user may refer back to; drop greetings and source lists. "
+        "Reply with the updated summary only, in the language of the conversation, in at most 200 words."
+    )
+    transcript = "\n\n".join(f"{m.role}: {(m.content or '')[:HISTORY_MESSAGE_CHARS]}" for m in folded)
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": f"Summary so far:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+    ]
+
+
+def refresh_summary(conversation_id: str) -> None:
+    """
+    Fold the oldest unsummarized messages into Conversation.summary once the recent ones no
+    longer fit the history budget. Uses its own session. Without an API key, or while the
+    provider breaker is open, it does nothing and trim_history alone bounds the prompt.
+    """
+    if not settings.openai_api_key or not provider_breaker.allow():
+        return
+    db = SessionLocal()
+    try:
+        conversation = db.get(Conversation, conversation_id)
+        if conversation is None or conversation.deleted_at is not None:
+            return
+        query = (
+            db.query(ConversationMessage)
+            .filter(ConversationMessage.conversation_id == conversation.id)
+            .filter(ConversationMessage.deleted_at.is_(None))
+        )
+        if conversation.summary_through is not None:
+            query = query.filter(ConversationMessage.created_at > conversation.summary_through)
+        rows = query.order_by(ConversationMessage.created_at.asc()).all()
+        contents = [(m.content or "")[:HISTORY_MESSAGE_CHARS] for m in rows]
+        if _recent_start(contents, settings.history_token_budget) == 0:
+            return
+
+        keep_from = _recent_start(contents, int(settings.history_token_budget * SUMMARY_KEEP_FRACTION))
+        folded: List[ConversationMessage] = []
+        used = 0
+        for m, content in zip(rows[:keep_from], contents[:keep_from]):
+            used += _message_tokens(content)
+            if folded and used > SUMMARY_INPUT_TOKENS:
+                break
+            folded.append(m)
+
+        resp = chat_completion(
+            OpenAI(api_key=settings.openai_api_key),
+            SUMMARIZE,
+            messages=_summary_messages(conversation.summary, folded),
+            temperature=0,
+        )
+        summary = (resp.choices[0].message.content or "").strip()
+        if not summary:
+            return
+        conversation.summary = summary
+        conversation.summary_through = folded[-1].created_at
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.warning("Conversation summary refresh failed for %s", conversation_id, exc_info=True)
+    finally:
+        db.close()
+
+
+def _refresh_then_release(conversation_id: str) -> None:
+    try:
+        refresh_summary(conversation_id)
+    finally:
+        with _pending_lock:
+            _pending.discard(conversation_id)
+
+
+def schedule_summary_refresh(conversation_id: str) -> None:
+    """Run refresh_summary in the background; a refresh already queued for the conversation covers this one."""
+    with _pending_lock:
+        if conversation_id in _pending:
+            return
+        _pending.add(conversation_id)
+    _summary_executor.submit(_refresh_then_release, conversation_id)
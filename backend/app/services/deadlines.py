@@ -0,0 +1,197 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+# A call is not started with less than this left of the request budget.
+MIN_CALL_TIMEOUT_S = 0.5
+# Hedging needs a latency history per key before its p95 means anything.
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+# Never hedge sooner than this, even when the p95 is tiny (e.g. cached provider responses).
+HEDGE_MIN_DELAY_MS = 50
+
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="rag-hedge")
+_latency_lock = threading.Lock()
+_latencies: Dict[str, Deque[int]] = {}
+_hedge_stats: Dict[str, int] = {"hedged": 0, "hedge_won": 0, "discarded_calls": 0, "discarded_ms": 0}
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request budget ran out before a model or embedding call could start."""
+
+
+@dataclass(frozen=True)
+class Deadline:
+    """Per-request time budget; every model and embedding call derives its timeout from it."""
+
+    expires_at: float  # time.monotonic()
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+def request_deadline() -> Deadline:
+    return Deadline.after(settings.copilot_deadline_s)
+
+
+def call_timeout(cap_s: float, deadline: Optional[Deadline]) -> float:
+    """
+    Timeout for one call: the route's own cap, shortened to what is left of the request
+    budget. Raises DeadlineExceeded instead of starting a call that cannot finish.
+    """
+    if deadline is None:
+        return cap_s
+    left = deadline.remaining()
+    if left < MIN_CALL_TIMEOUT_S:
+        raise DeadlineExceeded(f"request deadline exceeded ({left:.2f}s left)")
+    return min(cap_s, left)
+
+
+def observe_latency(key: str, latency_ms: int) -> None:
+    with _latency_lock:
+        _latencies.setdefault(key, deque(maxlen=HEDGE_WINDOW)).append(latency_ms)
+
+
+def hedge_delay_ms(key: str) -> Optional[int]:
+    """p95 latency of recent successful calls for key, or None while there is too little history."""
+    with _latency_lock:
+        samples = sorted(_latencies.get(key) or ())
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return max(HEDGE_MIN_DELAY_MS, samples[min(len(samples) - 1, math.ceil(0.95 * len(samples)) - 1)])
+
+
+def _count_discarded(records: List[Dict[str, Any]]) -> None:
+    with _latency_lock:
+        for record in records:
+            _hedge_stats["discarded_calls"] += 1
+            _hedge_stats["discarded_ms"] += record.get("latency_ms") or 0
+
+
+def _settle(
+    winner: int,
+    records: List[List[Dict[str, Any]]],
+    calls: Optional[List[Dict[str, Any]]],
+    hedged: bool,
+) -> None:
+    if hedged:
+        with _latency_lock:
+            _hedge_stats["hedged"] += 1
+            _hedge_stats["hedge_won"] += int(winner == 1)
+    if calls is not None:
+        calls.extend(dict(r, hedged=True) if hedged else r for r in records[winner])
+
+
+def _timed(key: str, fn: Callable[[List[Dict[str, Any]]], T], record: List[Dict[str, Any]]) -> T:
+    start = time.perf_counter()
+    result = fn(record)
+    observe_latency(key, int((time.perf_counter() - start) * 1000))
+    return result
+
+
+def hedged_call(
+    key: str,
+    attempt: Callable[[List[Dict[str, Any]]], T],
+    calls: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+) -> T:
+    """
+    Run an idempotent call, firing one duplicate if it has not answered after the key's
+    p95 latency. The first success wins; the loser cannot be interrupted, so its result is
+    dropped and its cost is counted in hedge_stats() when it finishes.
+    attempt(record) appends its call record to record; the winner's lands in calls.
+    """
+    records: List[List[Dict[str, Any]]] = [[], []]
+    delay = hedge_delay_ms(key) if settings.hedge_requests else None
+    if delay is None or (deadline is not None and deadline.remaining() * 1000 <= delay + MIN_CALL_TIMEOUT_S * 1000):
+        try:
+            return _timed(key, attempt, records[0])
+        finally:
+            _settle(0, records, calls, hedged=False)
+
+    futures: List[Future] = [_hedge_executor.submit(_timed, key, attempt, records[0])]
+    done, _ = wait(futures, timeout=delay / 1000)
+    if not done:
+        futures.append(_hedge_executor.submit(_timed, key, attempt, records[1]))
+    pending = set(futures)
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                winner = futures.index(future)
+                for loser in pending:
+                    loser.add_done_callback(lambda _, r=records[1 - winner]: _count_discarded(r))
+                _settle(winner, records, calls, hedged=len(futures) > 1)
+                return future.result()
+            error = future.exception()
+    _settle(len(futures) - 1, records, calls, hedged=len(futures) > 1)
+    raise error  # type: ignore[misc]
+
+
+async def hedged_call_async(
+    key: str,
+    attempt: Callable[[List[Dict[str, Any]]], Awaitable[T]],
+    calls: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+) -> T:
+    """hedged_call for coroutines; the losing attempt is cancelled instead of left running."""
+    records: List[List[Dict[str, Any]]] = [[], []]
+
+    async def timed(record: List[Dict[str, Any]]) -> T:
+        start = time.perf_counter()
+        result = await attempt(record)
+        observe_latency(key, int((time.perf_counter() - start) * 1000))
+        return result
+
+    delay = hedge_delay_ms(key) if settings.hedge_requests else None
+    if delay is None or (deadline is not None and deadline.remaining() * 1000 <= delay + MIN_CALL_TIMEOUT_S * 1000):
+        try:
+            return await timed(records[0])
+        finally:
+            _settle(0, records, calls, hedged=False)
+
+    tasks = [asyncio.ensure_future(timed(records[0]))]
+    done, _ = await asyncio.wait(tasks, timeout=delay / 1000)
+    if not done:
+        tasks.append(asyncio.ensure_future(timed(records[1])))
+    pending = set(tasks)
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = tasks.index(task)
+                    _settle(winner, records, calls, hedged=len(tasks) > 1)
+                    return task.result()
+                error = task.exception()
+    finally:
+        for task in pending:
+            task.add_done_callback(lambda _, r=records[tasks.index(task)]: _count_discarded(r))
+            task.cancel()
+    _settle(len(tasks) - 1, records, calls, hedged=len(tasks) > 1)
+    raise error  # type: ignore[misc]
+
+
+def hedge_stats() -> Dict[str, Any]:
+    """Process-wide hedging counters: how often a duplicate fired, won, and what the losers cost."""
+    with _latency_lock:
+        stats = dict(_hedge_stats)
+        stats["p95_ms"] = {}
+    for key in list(_latencies):
+        stats["p95_ms"][key] = hedge_delay_ms(key)
+    return stats
@@ -18,6 +18,7 @@ from app.db.models import (
     Tag,
     TagCategory,
 )
+from app.services.model_routing import DRAFT, chat_completion
 
 logger = logging.getLogger(__name__)
 
@@ -374,12 +375,7 @@ def generate_draft(
         try:
             client = _client()
             messages = _build_prompt(objective, context, tag_filters, ranked_sources)
-            resp = client.chat.completions.create(
-                model=settings.openai_chat_model,
-                messages=messages,
-                temperature=0.2,
-                max_tokens=700,
-            )
+            resp = chat_completion(client, DRAFT, messages=messages, temperature=0.2)
             draft_text = resp.choices[0].message.content or ""
         except Exception:
             logger.exception("Draft generation failed; returning fallback.")
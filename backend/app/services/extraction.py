@@ -0,0 +1,157 @@
+import logging
+import multiprocessing
+import resource
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Any, Callable, Deque, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.text_extract import extract_pdf_pages, is_plain_text, iter_text_segments, pdf_page_count
+
+logger = logging.getLogger(__name__)
+
+# PDFs are split into page ranges of this size, extracted in parallel across the pool.
+PDF_PAGES_PER_TASK = 25
+# Page ranges submitted ahead of the consumer, per worker; bounds the text held in memory.
+PDF_RANGES_IN_FLIGHT = 2
+# Extra wait on top of the file timeout before a stuck worker is killed with its pool.
+KILL_GRACE_S = 5.0
+
+_pool_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class ExtractionLimitExceeded(Exception):
+    """A file hit the extraction timeout or memory limit; retrying will not help."""
+
+
+def _init_worker(memory_mb: int) -> None:
+    # Parsing must not take the worker down with SIGINT meant for the server.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):  # e.g. macOS refuses RLIMIT_AS; the timeout still applies
+            logger.warning("Could not cap extraction worker memory at %s MB", memory_mb)
+
+
+def _on_alarm(signum: int, frame: Any) -> None:
+    raise ExtractionLimitExceeded("extraction timed out")
+
+
+def _run_limited(timeout_s: float, fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    fn(*args) in a pool worker's main thread, interrupted after timeout_s. The parsers are
+    pure Python, so the alarm lands between bytecodes and the worker survives.
+    """
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, max(timeout_s, 0.01))
+    try:
+        return fn(*args)
+    except MemoryError:
+        raise ExtractionLimitExceeded(f"extraction exceeded {settings.extract_memory_mb} MB")
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.extract_workers,
+                # spawn: forking a process that runs request and ingestion threads can copy held locks.
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(settings.extract_memory_mb,),
+            )
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Kill a pool whose worker is stuck or died; the next extraction starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _page_ranges(pages: int, per_task: Optional[int] = None) -> List[Tuple[int, int]]:
+    per_task = per_task or PDF_PAGES_PER_TASK
+    return [(start, min(start + per_task, pages)) for start in range(0, pages, per_task)]
+
+
+def _segment_list(data: bytes, filename: str) -> List[str]:
+    return list(iter_text_segments(data, filename))
+
+
+def iter_text(data: bytes, filename: str, timeout_s: Optional[float] = None) -> Iterator[str]:
+    """
+    iter_text_segments run in the extraction process pool, so CPU-bound parsing does not
+    hold the server's GIL. PDF page ranges run in parallel and are yielded in order while
+    later ranges are still parsing; at most PDF_RANGES_IN_FLIGHT ranges per worker are
+    extracted ahead of the consumer. DOCX/PPTX files arrive in one piece.
+
+    Plain text is read in-process; with EXTRACT_WORKERS=0 everything is. The timeout
+    (EXTRACT_TIMEOUT_S) counts time spent waiting on the pool, not time the consumer spends
+    between segments. Raises ExtractionLimitExceeded past it or past EXTRACT_MEMORY_MB.
+    """
+    if settings.extract_workers <= 0 or is_plain_text(filename):
+        yield from iter_text_segments(data, filename)
+        return
+    timeout_s = settings.extract_timeout_s if timeout_s is None else timeout_s
+    spent = 0.0
+    pool = _get_pool()
+
+    def submit(fn: Callable[..., Any], *args: Any) -> Future:
+        return pool.submit(_run_limited, max(timeout_s - spent, 0.01), fn, *args)
+
+    def wait(future: Future) -> Any:
+        nonlocal spent
+        started = time.monotonic()
+        try:
+            return future.result(timeout=max(timeout_s - spent, 0) + KILL_GRACE_S)
+        finally:
+            spent += time.monotonic() - started
+
+    pending: Deque[Future] = deque()
+    try:
+        if not filename.lower().endswith(".pdf"):
+            yield from wait(submit(_segment_list, data, filename))
+            return
+        ranges = iter(_page_ranges(wait(submit(pdf_page_count, data))))
+        for start, stop in islice(ranges, settings.extract_workers * PDF_RANGES_IN_FLIGHT):
+            pending.append(submit(extract_pdf_pages, data, start, stop))
+        while pending:
+            pages = wait(pending.popleft())
+            for start, stop in islice(ranges, 1):
+                pending.append(submit(extract_pdf_pages, data, start, stop))
+            yield from (page for page in pages if page)
+    except FutureTimeout:
+        logger.warning("Extraction of %s did not stop at its timeout; restarting the pool", filename)
+        _discard_pool(pool)
+        raise ExtractionLimitExceeded("extraction timed out")
+    except BrokenProcessPool:
+        # A worker died, usually killed by the OS for memory; the file may still succeed alone.
+        _discard_pool(pool)
+        raise RuntimeError(f"extraction worker crashed on {filename}")
+    finally:
+        # Also runs when the consumer stops early or fails.
+        for future in pending:
+            future.cancel()
+
+
+def extract_text(data: bytes, filename: str, timeout_s: Optional[float] = None) -> str:
+    """The whole text of a file via iter_text, segments separated by blank lines."""
+    return "\n\n".join(iter_text(data, filename, timeout_s=timeout_s))
@@ -1,56 +1,337 @@
+import hashlib
+import io
+import logging
+import struct
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import insert, or_
 from sqlalchemy.orm import Session
-from app.db.models import Document, DocumentVersion, Chunk
-from app.utils.text_extract import extract_text_from_bytes
-from app.utils.chunking import chunk_text
-from app.services.rag import embed_texts
+from app.db.models import Document, DocumentVersion, Chunk, IngestionStatus, Vector, utcnow
+from app.utils.chunking import iter_chunks
+from app.services.extraction import iter_text
+from app.services.rag import EMBED_MAX_BATCH_SIZE, embed_texts
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+# Chunks embedded and flushed together while extraction continues.
+INGEST_EMBED_BATCH = EMBED_MAX_BATCH_SIZE
+# Chunk ids per IN (...) when hashing legacy chunks or retiring previous ones.
+RETIRE_BATCH = 500
+
+
+def _retire_older_versions(db: Session, doc: Document, version: DocumentVersion) -> None:
+    db.query(Chunk).filter(
+        Chunk.document_id == doc.id,
+        or_(Chunk.version_id.is_(None), Chunk.version_id != version.id),
+    ).update({"is_latest": False}, synchronize_session=False)
+
+
+def _batches(items: Iterable[Dict[str, object]], size: int) -> Iterator[List[Dict[str, object]]]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _previous_chunks(db: Session, doc: Document) -> Dict[str, Deque[int]]:
+    """content_hash -> ids of the document's current latest chunks with that content, in chunk order."""
+    rows = (
+        db.query(Chunk.id, Chunk.content_hash)
+        .filter(Chunk.document_id == doc.id, Chunk.is_latest.is_(True))
+        .order_by(Chunk.chunk_index.asc())
+        .all()
+    )
+    hashes = dict(rows)
+    # Chunks ingested before content_hash existed are hashed from their content.
+    legacy = [cid for cid, chunk_hash in rows if chunk_hash is None]
+    for start in range(0, len(legacy), RETIRE_BATCH):
+        for cid, content in db.query(Chunk.id, Chunk.content).filter(Chunk.id.in_(legacy[start : start + RETIRE_BATCH])):
+            hashes[cid] = _content_hash(content)
+    previous: Dict[str, Deque[int]] = defaultdict(deque)
+    for cid, _ in rows:
+        previous[hashes[cid]].append(cid)
+    return previous
+
+
+def find_indexed_copy(db: Session, content_hash: Optional[str], exclude_version_id: Optional[int] = None) -> Optional[int]:
+    """
+    Id of an indexed version with this file content (the latest version of a live document,
+    with latest chunks), whose chunk set can be copied instead of re-ingested.
+    """
+    if not content_hash:
+        return None
+    indexed = db.query(Chunk.id).filter(Chunk.version_id == DocumentVersion.id, Chunk.is_latest.is_(True)).exists()
+    query = (
+        db.query(DocumentVersion.id)
+        .join(Document, Document.latest_version_id == DocumentVersion.id)
+        .filter(DocumentVersion.content_hash == content_hash, Document.deleted_at.is_(None), indexed)
+    )
+    if exclude_version_id is not None:
+        query = query.filter(DocumentVersion.id != exclude_version_id)
+    row = query.order_by(DocumentVersion.id.desc()).first()
+    return row[0] if row else None
+
+
+def iter_indexed_chunks(db: Session, source_version_id: int) -> Iterator[Dict[str, object]]:
+    """The source version's latest chunks as chunk dicts carrying their embedding and vector_id, paged by chunk_index."""
+    last_index = -1
+    while True:
+        rows = (
+            db.query(Chunk.chunk_index, Chunk.content, Chunk.section, Chunk.token_count, Chunk.embedding, Chunk.vector_id)
+            .filter(Chunk.version_id == source_version_id, Chunk.is_latest.is_(True), Chunk.chunk_index > last_index)
+            .order_by(Chunk.chunk_index.asc())
+            .limit(RETIRE_BATCH)
+            .all()
+        )
+        if not rows:
+            return
+        for row in rows:
+            yield {
+                "text": row.content,
+                "heading_path": row.section or "",
+                "token_count": row.token_count,
+                "embedding": row.embedding,
+                "vector_id": row.vector_id,
+            }
+        last_index = rows[-1].chunk_index
+
+
+def _store_batch(
+    db: Session,
+    doc: Document,
+    version: DocumentVersion,
+    batch: List[Dict[str, object]],
+    first_index: int,
+    previous: Dict[str, Deque[int]],
+) -> int:
+    """
+    Persist one batch of chunks as new rows of version. A chunk whose content matches a
+    latest chunk of the previous version copies that row's embedding and vector_id, and
+    chunks copied from another document (see iter_indexed_chunks) carry theirs; only the
+    others are embedded. The previous rows stay as they are, so older versions keep their
+    chunks. Returns how many were not embedded.
+    """
+    matched = []
+    copied = []
+    fresh = []
+    for i, chunk in enumerate(batch):
+        chunk_hash = _content_hash(chunk["text"])
+        fields = {
+            "version_id": version.id,
+            "chunk_index": first_index + i,
+            "section": chunk.get("heading_path") or None,
+            "token_count": chunk["token_count"],
+            "content_hash": chunk_hash,
+        }
+        ids = previous.get(chunk_hash)
+        if ids:
+            matched.append((ids.popleft(), chunk, fields))
+        elif chunk.get("embedding") is not None:
+            copied.append((chunk, fields))
+        else:
+            fresh.append((chunk, fields))
+    if matched:
+        stored = {
+            row.id: row
+            for row in db.query(Chunk.id, Chunk.embedding, Chunk.vector_id).filter(
+                Chunk.id.in_([cid for cid, _, _ in matched])
+            )
+        }
+        for cid, chunk, fields in matched:
+            copied.append(({**chunk, "embedding": stored[cid].embedding, "vector_id": stored[cid].vector_id}, fields))
+
+    base = {"document_id": doc.id, "area_id": doc.area_id, "page": None, "is_latest": True, "created_at": utcnow()}
+    rows = [
+        {
+            **base,
+            **fields,
+            "content": chunk["text"],
+            "vector_id": chunk.get("vector_id"),
+            "embedding": chunk["embedding"],
+        }
+        for chunk, fields in copied
+    ]
+    if fresh:
+        vectors, store = embed_texts(db, [chunk["text"] for chunk, _ in fresh])
+
+        # Always persist embeddings to DB (JSON for SQLite; pgvector for Postgres).
+        norms = (vectors**2).sum(axis=1, keepdims=True) ** 0.5
+        norms = (norms + 1e-12)
+        vectors_norm = (vectors / norms).astype("float32")
+
+        vector_ids = None
+        if store is not None:
+            vector_ids = store.add_vectors(vectors_norm)
+
+        for i, (chunk, fields) in enumerate(fresh):
+            rows.append(
+                {
+                    **base,
+                    **fields,
+                    "content": chunk["text"],
+                    "vector_id": vector_ids[i] if vector_ids is not None else None,
+                    "embedding": vectors_norm[i],
+                }
+            )
+    if rows:
+        _insert_chunks(db, rows)
+    return len(copied)
+
+
+# Column order of the binary COPY into chunks; id is left to its sequence.
+_COPY_COLUMNS = (
+    ("document_id", "int4"),
+    ("area_id", "int4"),
+    ("version_id", "int4"),
+    ("chunk_index", "int4"),
+    ("content", "text"),
+    ("page", "int4"),
+    ("section", "text"),
+    ("token_count", "int4"),
+    ("content_hash", "text"),
+    ("vector_id", "int4"),
+    ("embedding", "vector"),
+    ("is_latest", "bool"),
+    ("created_at", "timestamp"),
+)
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+def _copy_field(kind: str, value) -> bytes:
+    if value is None:
+        return struct.pack("!i", -1)
+    if kind == "int4":
+        data = struct.pack("!i", int(value))
+    elif kind == "text":
+        data = str(value).encode("utf-8")
+    elif kind == "bool":
+        data = b"\x01" if value else b"\x00"
+    elif kind == "timestamp":
+        # timestamp without time zone holding UTC, as microseconds since 2000-01-01
+        data = struct.pack("!q", (value - _PG_EPOCH) // timedelta(microseconds=1))
+    else:
+        # pgvector's binary format: dimensions, unused, then big-endian float4s
+        vector = np.asarray(value, dtype=">f4")
+        data = struct.pack("!hh", vector.shape[0], 0) + vector.tobytes()
+    return struct.pack("!i", len(data)) + data
+
+
+def _copy_payload(rows: List[Dict[str, object]]) -> bytes:
+    out = [b"PGCOPY\n\xff\r\n\x00", struct.pack("!ii", 0, 0)]
+    field_count = struct.pack("!h", len(_COPY_COLUMNS))
+    for row in rows:
+        out.append(field_count)
+        out.extend(_copy_field(kind, row[name]) for name, kind in _COPY_COLUMNS)
+    out.append(struct.pack("!h", -1))
+    return b"".join(out)
+
 
-def ingest_document(db: Session, doc: Document, version: DocumentVersion, file_bytes: bytes) -> int:
+def _insert_chunks(db: Session, rows: List[Dict[str, object]]) -> None:
     """
-    Extract -> chunk -> embed -> store vectors -> persist chunk.vector_id
-    Returns number of chunks created.
+    Insert chunk rows in the session's transaction without the ORM unit of work: one binary
+    COPY on Postgres with pgvector (psycopg2), one executemany everywhere else.
     """
-    text = extract_text_from_bytes(file_bytes, version.original_name)
-    chunks = chunk_text(
-        text,
-        source_name=version.original_name,
+    pgvector = db.get_bind().dialect.name == "postgresql" and Vector is not None
+    if pgvector:
+        cursor = db.connection().connection.dbapi_connection.cursor()
+        try:
+            if hasattr(cursor, "copy_expert"):
+                columns = ", ".join(name for name, _ in _COPY_COLUMNS)
+                cursor.copy_expert(
+                    f"COPY chunks ({columns}) FROM STDIN WITH (FORMAT BINARY)", io.BytesIO(_copy_payload(rows))
+                )
+                return
+        finally:
+            cursor.close()
+    else:
+        # The JSON column takes lists.
+        for row in rows:
+            if isinstance(row["embedding"], np.ndarray):
+                row["embedding"] = row["embedding"].tolist()
+    db.execute(insert(Chunk), rows)
+
+
+def iter_file_chunks(file_bytes: bytes, filename: str) -> Iterator[Dict[str, object]]:
+    """Chunks of one file as ingest stores them, streamed from extraction."""
+    return iter_chunks(
+        iter_text(file_bytes, filename),
         max_tokens=1200,
         overlap_tokens=150,
         token_model=settings.openai_embed_model,
     )
 
-    if not chunks:
-        return 0
-
-    payloads = [c["text"] for c in chunks]
-    vectors, store = embed_texts(db, payloads)
-
-    # Always persist embeddings to DB (JSON for SQLite; pgvector for Postgres).
-    norms = (vectors**2).sum(axis=1, keepdims=True) ** 0.5
-    norms = (norms + 1e-12)
-    vectors_norm = vectors / norms
-
-    vector_ids = None
-    if store is not None:
-        vector_ids = store.add_vectors(vectors_norm)
-
-    for i, chunk in enumerate(chunks):
-        vid = vector_ids[i] if vector_ids is not None else None
-        embedding = vectors_norm[i].astype("float32").tolist()
-        db.add(
-            Chunk(
-                document_id=doc.id,
-                version_id=version.id,
-                area_id=doc.area_id,
-                chunk_index=i,
-                content=chunk["text"],
-                section=chunk.get("heading_path") or None,
-                vector_id=vid,
-                embedding=embedding,
-                is_latest=True,
-            )
-        )
 
+def store_chunks(
+    db: Session,
+    doc: Document,
+    version: DocumentVersion,
+    chunks: Iterable[Dict[str, object]],
+    on_stage: Optional[Callable[[IngestionStatus, Optional[int]], None]] = None,
+) -> Dict[str, int]:
+    """
+    Make chunks the latest chunk set of doc, as rows of version, and commit. Every
+    INGEST_EMBED_BATCH chunks are embedded and flushed (see _store_batch); chunks of older
+    versions stop being latest in the same commit, so search never sees a document without
+    chunks while a new version is indexed.
+    on_stage(EMBEDDING, None) is called before the first batch is stored.
+    Returns {"chunks", "reused", "embedded"} counts.
+    """
+    previous = _previous_chunks(db, doc)
+    # Every previous latest chunk is retired, copied or not, including any of this same version.
+    retired = [cid for ids in previous.values() for cid in ids]
+    count = 0
+    reused = 0
+    for batch in _batches(chunks, INGEST_EMBED_BATCH):
+        if count == 0 and on_stage:
+            # Progress commits happen only here, before any chunk is flushed.
+            on_stage(IngestionStatus.EMBEDDING, None)
+        reused += _store_batch(db, doc, version, batch, count, previous)
+        count += len(batch)
+
+    for start in range(0, len(retired), RETIRE_BATCH):
+        db.query(Chunk).filter(Chunk.id.in_(retired[start : start + RETIRE_BATCH])).update(
+            {"is_latest": False}, synchronize_session=False
+        )
+    _retire_older_versions(db, doc, version)
     db.commit()
-    return len(chunks)
+    logger.info("Ingested document %s v%s: %s chunks, %s reused", doc.id, version.version, count, reused)
+    return {"chunks": count, "reused": reused, "embedded": count - reused}
+
+
+def ingest_document(
+    db: Session,
+    doc: Document,
+    version: DocumentVersion,
+    file_bytes: bytes,
+    on_stage: Optional[Callable[[IngestionStatus, Optional[int]], None]] = None,
+) -> Dict[str, int]:
+    """
+    Extract -> chunk -> embed -> store vectors -> persist chunk.vector_id, streamed: pages
+    are chunked as they are extracted and stored in batches by store_chunks, so memory
+    stays bounded and embedding starts before extraction finishes.
+    Chunks whose content is unchanged from the current latest version reuse its embeddings
+    instead of being re-embedded (see _store_batch), and a file already indexed for another
+    document copies that document's chunks without extracting or embedding anything.
+    on_stage(status, chunk_count) is called as EXTRACTING and then EMBEDDING start.
+    Returns {"chunks", "reused", "embedded"} counts.
+    """
+    if on_stage:
+        on_stage(IngestionStatus.EXTRACTING, None)
+    source = find_indexed_copy(db, version.content_hash, exclude_version_id=version.id)
+    if source is not None:
+        logger.info("Document %s v%s has the same file as version %s; copying its chunks", doc.id, version.version, source)
+        chunks = iter_indexed_chunks(db, source)
+    else:
+        chunks = iter_file_chunks(file_bytes, version.original_name)
+    return store_chunks(db, doc, version, chunks, on_stage=on_stage)
@@ -0,0 +1,223 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import Document, DocumentVersion, IngestionJob, IngestionStatus, utcnow
+from app.db.session import SessionLocal
+from app.services.extraction import ExtractionLimitExceeded
+from app.services.ingest import ingest_document
+from app.services.supabase_storage import download_bytes
+from app.utils.files import file_path
+
+logger = logging.getLogger(__name__)
+
+# Retry n of a job waits INGEST_RETRY_BASE_S * 2**(n-1): 30s, 60s, 120s, ...
+INGEST_RETRY_BASE_S = 30.0
+# Idle workers look for due jobs this often; enqueue_ingestion wakes them straight away.
+INGEST_POLL_S = 2.0
+# An attempt still EXTRACTING/EMBEDDING after this long belongs to a dead worker and is requeued.
+INGEST_STALE_AFTER_S = 30 * 60
+STALE_CHECK_INTERVAL_S = 60.0
+
+RUNNING = (IngestionStatus.EXTRACTING.value, IngestionStatus.EMBEDDING.value)
+TERMINAL = (IngestionStatus.INDEXED.value, IngestionStatus.FAILED.value)
+
+_wakeup = threading.Event()
+_workers_lock = threading.Lock()
+_workers: List[threading.Thread] = []
+
+
+class PermanentIngestionError(Exception):
+    """A failure retrying cannot fix (document deleted, version superseded)."""
+
+
+def enqueue_ingestion(db: Session, doc: Document, version: DocumentVersion, user_id: Optional[int]) -> IngestionJob:
+    job = IngestionJob(document_id=doc.id, version_id=version.id, created_by=user_id, next_attempt_at=utcnow())
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _wakeup.set()
+    return job
+
+
+def _read_version_bytes(version: DocumentVersion) -> bytes:
+    if settings.storage_provider == "supabase":
+        return download_bytes(object_path=version.file_path)
+    with open(file_path(version.file_path), "rb") as f:
+        return f.read()
+
+
+def requeue_stale_jobs(db: Session) -> int:
+    cutoff = utcnow() - timedelta(seconds=INGEST_STALE_AFTER_S)
+    res = db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.status.in_(RUNNING), IngestionJob.locked_at < cutoff)
+        .values(status=IngestionStatus.QUEUED.value, locked_by=None, locked_at=None, next_attempt_at=utcnow())
+    )
+    db.commit()
+    if res.rowcount:
+        logger.warning("Requeued %s stale ingestion jobs", res.rowcount)
+    return res.rowcount
+
+
+def claim_next_job(db: Session, worker_id: str) -> Optional[IngestionJob]:
+    """
+    Oldest due QUEUED job. The claim is a conditional UPDATE, so workers in any number of
+    processes never run the same attempt twice.
+    """
+    now = utcnow()
+    due = (
+        db.query(IngestionJob.id)
+        .filter(IngestionJob.status == IngestionStatus.QUEUED.value)
+        .filter(IngestionJob.next_attempt_at <= now)
+        .order_by(IngestionJob.next_attempt_at.asc(), IngestionJob.id.asc())
+        .limit(5)
+        .all()
+    )
+    for (job_id,) in due:
+        res = db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job_id, IngestionJob.status == IngestionStatus.QUEUED.value)
+            .values(
+                status=IngestionStatus.EXTRACTING.value,
+                locked_by=worker_id,
+                locked_at=now,
+                attempts=IngestionJob.attempts + 1,
+            )
+        )
+        db.commit()
+        if res.rowcount == 1:
+            return db.get(IngestionJob, job_id)
+    return None
+
+
+def _fail_attempt(db: Session, job: IngestionJob, error: Exception) -> None:
+    job.error = f"{type(error).__name__}: {error}"[:2000]
+    job.locked_by = None
+    job.locked_at = None
+    if isinstance(error, (PermanentIngestionError, ExtractionLimitExceeded)) or job.attempts >= settings.ingest_max_attempts:
+        job.status = IngestionStatus.FAILED.value
+        job.finished_at = utcnow()
+    else:
+        job.status = IngestionStatus.QUEUED.value
+        job.next_attempt_at = utcnow() + timedelta(seconds=INGEST_RETRY_BASE_S * 2 ** (job.attempts - 1))
+    db.commit()
+
+
+def run_job(db: Session, job: IngestionJob) -> None:
+    """One attempt of a claimed job: INDEXED on success, else requeued with backoff or FAILED."""
+    job_id = job.id
+
+    def on_stage(status: IngestionStatus, chunks: Optional[int]) -> None:
+        job.status = status.value
+        if chunks is not None:
+            job.chunks_total = chunks
+        db.commit()
+
+    try:
+        doc = db.get(Document, job.document_id)
+        version = db.get(DocumentVersion, job.version_id)
+        if doc is None or version is None or doc.deleted_at is not None:
+            raise PermanentIngestionError("document or version no longer exists")
+        if doc.latest_version_id not in (None, version.id):
+            raise PermanentIngestionError(f"superseded by version {doc.latest_version}")
+        result = ingest_document(db, doc, version, _read_version_bytes(version), on_stage=on_stage)
+    except Exception as e:
+        logger.warning("Ingestion job %s attempt failed", job_id, exc_info=True)
+        db.rollback()
+        _fail_attempt(db, db.get(IngestionJob, job_id), e)
+        return
+    job.status = IngestionStatus.INDEXED.value
+    job.chunks_total = result["chunks"]
+    job.chunks_reused = result["reused"]
+    job.error = None
+    job.locked_by = None
+    job.locked_at = None
+    job.finished_at = utcnow()
+    db.commit()
+
+
+def _worker_loop(worker_id: str) -> None:
+    last_stale_check = 0.0
+    while True:
+        db = SessionLocal()
+        try:
+            if time.monotonic() - last_stale_check > STALE_CHECK_INTERVAL_S:
+                last_stale_check = time.monotonic()
+                requeue_stale_jobs(db)
+            job = claim_next_job(db, worker_id)
+            if job is not None:
+                run_job(db, job)
+                continue
+        except Exception:
+            logger.exception("Ingestion worker %s failed", worker_id)
+        finally:
+            db.close()
+        _wakeup.wait(INGEST_POLL_S)
+        _wakeup.clear()
+
+
+def start_ingestion_workers(count: Optional[int] = None) -> int:
+    """Start INGEST_WORKERS daemon worker threads once per process; returns how many run."""
+    count = settings.ingest_workers if count is None else count
+    with _workers_lock:
+        if not _workers:
+            prefix = f"{socket.gethostname()}:{os.getpid()}"
+            for i in range(count):
+                thread = threading.Thread(
+                    target=_worker_loop, args=(f"{prefix}:{i}",), name=f"ingest-worker-{i}", daemon=True
+                )
+                thread.start()
+                _workers.append(thread)
+        return len(_workers)
+
+
+def job_progress(job: IngestionJob) -> Dict[str, object]:
+    return {
+        "id": job.id,
+        "document_id": job.document_id,
+        "version_id": job.version_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "chunks_total": job.chunks_total,
+        "chunks_reused": job.chunks_reused,
+        "error": job.error,
+        "next_attempt_at": job.next_attempt_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def job_events(job_id: int, poll_s: float = 1.0, heartbeat_s: float = 15.0) -> Iterator[Optional[Dict[str, object]]]:
+    """
+    Progress of an ingestion job, read from the DB so it works whichever process runs the
+    job: a dict on every change (the last one terminal), None as an idle heartbeat.
+    """
+    last = None
+    idle_since = time.monotonic()
+    while True:
+        db = SessionLocal()
+        try:
+            job = db.get(IngestionJob, job_id)
+            progress = job_progress(job) if job is not None else None
+        finally:
+            db.close()
+        if progress is None:
+            return
+        if progress != last:
+            last = progress
+            idle_since = time.monotonic()
+            yield progress
+            if progress["status"] in TERMINAL:
+                return
+        elif time.monotonic() - idle_since >= heartbeat_s:
+            idle_since = time.monotonic()
+            yield None
+        time.sleep(poll_s)
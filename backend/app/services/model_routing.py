@@ -0,0 +1,263 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+from openai import AsyncOpenAI, OpenAI
+
+from app.core.config import settings
+from app.db.models import AccuracyLevel
+from app.services.circuit_breaker import provider_breaker
+from app.services.deadlines import Deadline, call_timeout, hedged_call, hedged_call_async
+
+logger = logging.getLogger(__name__)
+
+GENERATE = "generate"
+RERANK = "rerank"
+DRAFT = "draft"
+SUMMARIZE = "summarize"
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    model: str
+    max_tokens: int
+    timeout_s: float
+
+
+def _default_routes() -> Dict[str, ModelRoute]:
+    chat = settings.openai_chat_model
+    fast = settings.openai_fast_chat_model or chat
+    return {
+        f"{GENERATE}.{AccuracyLevel.HIGH.value}": ModelRoute(chat, 1200, 60.0),
+        f"{GENERATE}.{AccuracyLevel.MEDIUM.value}": ModelRoute(chat, 900, 45.0),
+        f"{GENERATE}.{AccuracyLevel.LOW.value}": ModelRoute(fast, 600, 30.0),
+        f"{RERANK}.{AccuracyLevel.HIGH.value}": ModelRoute(chat, 150, 15.0),
+        f"{RERANK}.{AccuracyLevel.MEDIUM.value}": ModelRoute(fast, 150, 10.0),
+        f"{RERANK}.{AccuracyLevel.LOW.value}": ModelRoute(fast, 150, 10.0),
+        DRAFT: ModelRoute(chat, 700, 45.0),
+        SUMMARIZE: ModelRoute(fast, 400, 30.0),
+    }
+
+
+def _overrides() -> Dict[str, Dict[str, Any]]:
+    raw = (settings.chat_model_routes or "").strip()
+    if not raw:
+        return {}
+    try:
+        data = json.loads(raw)
+        return data if isinstance(data, dict) else {}
+    except ValueError:
+        logger.warning("MODEL_ROUTES is not valid JSON; using default routes")
+        return {}
+
+
+def route_key(task: str, accuracy_level: Optional[AccuracyLevel] = None) -> str:
+    return f"{task}.{accuracy_level.value}" if accuracy_level is not None else task
+
+
+def resolve_route(task: str, accuracy_level: Optional[AccuracyLevel] = None) -> ModelRoute:
+    """
+    Model, max_tokens and timeout for a task (generate/rerank/draft/summarize) at an accuracy level.
+    MODEL_ROUTES (JSON, e.g. {"generate.LOW": {"model": "gpt-4o-mini"}}) overrides single fields.
+    """
+    key = route_key(task, accuracy_level)
+    routes = _default_routes()
+    route = routes.get(key) or routes.get(task) or ModelRoute(settings.openai_chat_model, 800, 45.0)
+    override = _overrides().get(key)
+    if isinstance(override, dict):
+        fields = {k: override[k] for k in ("model", "max_tokens", "timeout_s") if k in override}
+        route = ModelRoute(**{**asdict(route), **fields})
+    return route
+
+
+def cached_tokens(usage: Any) -> Optional[int]:
+    """Prompt tokens the provider served from its prompt cache, when the usage block reports them."""
+    value = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) if usage else None
+    return value if isinstance(value, int) else None
+
+
+def _call_record(
+    task: str, accuracy_level: Optional[AccuracyLevel], route: ModelRoute, start: float, usage: Any, ok: bool
+) -> Dict[str, Any]:
+    return {
+        "route": route_key(task, accuracy_level),
+        "model": route.model,
+        "latency_ms": int((time.perf_counter() - start) * 1000),
+        "tokens_in": getattr(usage, "prompt_tokens", None) if usage else None,
+        "tokens_out": getattr(usage, "completion_tokens", None) if usage else None,
+        "tokens_cached": cached_tokens(usage),
+        "ok": ok,
+    }
+
+
+def chat_completion(
+    client: OpenAI,
+    task: str,
+    accuracy_level: Optional[AccuracyLevel] = None,
+    *,
+    messages: List[Dict[str, str]],
+    calls: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+    hedge: bool = False,
+    **kwargs: Any,
+):
+    """
+    Routed chat completion. When calls is given, one record per call is appended with
+    route, model, latency_ms and token usage (also on failure, with ok=False).
+    The route timeout is shortened to what is left of deadline; hedge=True (idempotent
+    calls only) may fire a duplicate request, see hedged_call. Every outcome feeds
+    provider_breaker; client errors (4xx other than 429) count as the provider answering.
+    """
+    route = resolve_route(task, accuracy_level)
+
+    def attempt(record: List[Dict[str, Any]]):
+        timeout = call_timeout(route.timeout_s, deadline)
+        start = time.perf_counter()
+        resp = None
+        error: Optional[BaseException] = None
+        try:
+            resp = client.chat.completions.create(
+                model=route.model,
+                messages=messages,
+                max_tokens=route.max_tokens,
+                timeout=timeout,
+                **kwargs,
+            )
+            return resp
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            usage = getattr(resp, "usage", None) if resp is not None else None
+            record.append(_call_record(task, accuracy_level, route, start, usage, resp is not None))
+            if error is not None:
+                provider_breaker.record_error(error, time.perf_counter() - start, timeout)
+            else:
+                provider_breaker.record(resp is not None, time.perf_counter() - start, timeout)
+
+    if hedge:
+        return hedged_call(route_key(task, accuracy_level), attempt, calls, deadline)
+    return attempt(calls if calls is not None else [])
+
+
+async def chat_completion_async(
+    client: AsyncOpenAI,
+    task: str,
+    accuracy_level: Optional[AccuracyLevel] = None,
+    *,
+    messages: List[Dict[str, str]],
+    calls: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+    hedge: bool = False,
+    **kwargs: Any,
+):
+    """
+    chat_completion on an AsyncOpenAI client. A cancelled call is recorded with ok=False
+    and whatever latency it had accumulated, but is not held against provider_breaker.
+    """
+    route = resolve_route(task, accuracy_level)
+
+    async def attempt(record: List[Dict[str, Any]]):
+        timeout = call_timeout(route.timeout_s, deadline)
+        start = time.perf_counter()
+        resp = None
+        cancelled = False
+        error: Optional[BaseException] = None
+        try:
+            resp = await client.chat.completions.create(
+                model=route.model,
+                messages=messages,
+                max_tokens=route.max_tokens,
+                timeout=timeout,
+                **kwargs,
+            )
+            return resp
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            usage = getattr(resp, "usage", None) if resp is not None else None
+            record.append(_call_record(task, accuracy_level, route, start, usage, resp is not None))
+            if error is not None:
+                provider_breaker.record_error(error, time.perf_counter() - start, timeout)
+            elif not cancelled:
+                provider_breaker.record(resp is not None, time.perf_counter() - start, timeout)
+
+    if hedge:
+        return await hedged_call_async(route_key(task, accuracy_level), attempt, calls, deadline)
+    return await attempt(calls if calls is not None else [])
+
+
+def chat_completion_stream(
+    client: OpenAI,
+    task: str,
+    accuracy_level: Optional[AccuracyLevel] = None,
+    *,
+    messages: List[Dict[str, str]],
+    calls: Optional[List[Dict[str, Any]]] = None,
+    usage_out: Optional[Dict[str, Any]] = None,
+    deadline: Optional[Deadline] = None,
+    **kwargs: Any,
+) -> Iterator[str]:
+    """
+    Routed streaming chat completion yielding content deltas. The call record (see
+    chat_completion) is appended when the stream ends or is closed early, with
+    ttft_ms added; provider usage is copied into usage_out when reported.
+    Streams are never hedged: a duplicate would double the visible output. The breaker
+    sees the time to first token, and a consumer closing the stream is not a failure.
+    """
+    route = resolve_route(task, accuracy_level)
+    timeout = call_timeout(route.timeout_s, deadline)
+    start = time.perf_counter()
+    ttft_ms: Optional[int] = None
+    usage = None
+    completed = False
+    error: Optional[BaseException] = None
+    stream = None
+    try:
+        stream = client.chat.completions.create(
+            model=route.model,
+            messages=messages,
+            max_tokens=route.max_tokens,
+            timeout=timeout,
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs,
+        )
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            for choice in getattr(chunk, "choices", None) or []:
+                delta = getattr(choice.delta, "content", None)
+                if delta:
+                    if ttft_ms is None:
+                        ttft_ms = int((time.perf_counter() - start) * 1000)
+                    yield delta
+        completed = True
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None and not completed:
+            close()
+        if usage_out is not None and usage is not None:
+            usage_out.update(
+                prompt_tokens=getattr(usage, "prompt_tokens", None),
+                completion_tokens=getattr(usage, "completion_tokens", None),
+                total_tokens=getattr(usage, "total_tokens", None),
+                cached_tokens=cached_tokens(usage),
+            )
+        if calls is not None:
+            calls.append(dict(_call_record(task, accuracy_level, route, start, usage, completed), ttft_ms=ttft_ms))
+        waited_s = ttft_ms / 1000 if ttft_ms is not None else time.perf_counter() - start
+        if error is not None:
+            provider_breaker.record_error(error, waited_s, timeout)
+        else:
+            provider_breaker.record(True, waited_s, timeout)
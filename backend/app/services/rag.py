@@ -1,20 +1,39 @@
+import asyncio
 import hashlib
 import json
 import logging
 import os
 import re
+import threading
 import time
-from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
+import anyio
 import numpy as np
-from openai import BadRequestError, OpenAI
-from sqlalchemy import or_
+from openai import AsyncOpenAI, BadRequestError, OpenAI, OpenAIError
+from sqlalchemy import case, func, literal, or_
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
-from app.db.models import AccuracyLevel, AnswerTone, Chunk, Document
+from app.db.models import AccuracyLevel, AnswerTone, Area, Chunk, Document
+from app.services.circuit_breaker import provider_breaker
+from app.services.context_packing import CONTEXT_TOKEN_BUDGET, pack_context
+from app.services.conversation_memory import trim_history
+from app.services.deadlines import Deadline, call_timeout, hedged_call, hedged_call_async, request_deadline
+from app.services.model_routing import (
+    GENERATE,
+    cached_tokens,
+    chat_completion,
+    chat_completion_async,
+    chat_completion_stream,
+)
+from app.services.reranking import LocalReranker, get_reranker
 from app.services.vector_store import build_vector_store_if_needed
 from app.ai.tone_guides import get_tone_guide
+from app.utils.term_matcher import TermMatcher, matcher_for_terms
 from app.utils.tokenization import estimate_tokens, split_text_into_token_chunks
 
 logger = logging.getLogger(__name__)
@@ -22,15 +41,81 @@ logger = logging.getLogger(__name__)
 VECTOR_WEIGHT = 0.7
 KEYWORD_WEIGHT = 0.3
 RETRIEVAL_CACHE_TTL = 45  # seconds
+AREA_CACHE_TTL = 300  # seconds
 EMBED_CACHE_PATH = os.path.join(settings.data_dir, "embed_cache.json")
 MIN_GROUNDED_SCORE = 0.25
 MAX_CHUNKS_PER_DOCUMENT = 3
+# MMR relevance/diversity trade-off: HIGH favours the strongest evidence, LOW favours coverage.
+MMR_LAMBDA = {AccuracyLevel.HIGH: 0.8, AccuracyLevel.MEDIUM: 0.7, AccuracyLevel.LOW: 0.6}
+GENERATION_TEMPERATURE = {AccuracyLevel.HIGH: 0.15, AccuracyLevel.MEDIUM: 0.25, AccuracyLevel.LOW: 0.35}
 EMBED_MAX_TOKENS_PER_REQUEST = 250_000  # safety buffer under provider limit
 EMBED_MAX_INPUT_TOKENS = 1_500
 EMBED_MAX_BATCH_SIZE = 64
+EMBED_TIMEOUT_S = 30.0  # per embeddings request; shortened further by a request deadline
+# Provider failures that degrade an answer to the extractive path instead of failing the request.
+PROVIDER_ERRORS = (OpenAIError, TimeoutError)
+LEXICAL_SCAN_LIMIT = 200  # SQL-ranked rows pulled before term-coverage ranking
+FTS_CONFIG = "simple"  # matches the ix_chunks_content_fts expression index (see init_db)
+# English + Italian function words; they match nearly every chunk and carry no signal.
+STOPWORDS = frozenset(
+    """
+    the and for are but not you all any can had her was one our out has have how its
+    may who why what when where which with this that these those from into about than
+    then them they their there does did your yours will would should could been being
+    per con del della delle dei degli che chi come cosa dove quando quale quali sono
+    una uno gli nel nella nei sul sulla alla alle anche non più tra fra suo sua questo questa
+    """.split()
+)
+
+
+@dataclass(frozen=True)
+class RerankGate:
+    """
+    Thresholds (on hybrid_score) that decide whether the rerank stage can change the outcome.
+    - ungrounded_below: best hybrid under this answers "not enough info" straight away
+    - decisive_margin: a top-1 vs top-2 gap at least this large skips the rerank
+    """
+    ungrounded_below: float
+    decisive_margin: float
+
+
+# hybrid_score floor is ~0.35 for an unrelated chunk (cosine 0 normalizes to 0.5 * VECTOR_WEIGHT),
+# so "ungrounded" only fires when retrieval found essentially nothing. Every level sits above
+# that floor (LOW just barely), otherwise its gate could never fire with embeddings on.
+RERANK_GATES = {
+    AccuracyLevel.HIGH: RerankGate(ungrounded_below=0.38, decisive_margin=0.25),
+    AccuracyLevel.MEDIUM: RerankGate(ungrounded_below=0.36, decisive_margin=0.15),
+    AccuracyLevel.LOW: RerankGate(ungrounded_below=0.355, decisive_margin=0.10),
+}
+
+# Follow-up turns re-score the previous turn's candidate pool (kept on the assistant message
+# meta) and only run full retrieval when fewer than FOLLOWUP_MIN_COVERED of those chunks
+# reach FOLLOWUP_MIN_SCORE on the new question, well above the ~0.35 unrelated floor.
+FOLLOWUP_POOL_SIZE = 30
+FOLLOWUP_MIN_SCORE = 0.5
+FOLLOWUP_MIN_COVERED = 3
 
 _embed_cache: Dict[str, List[float]] = {}
 _retrieval_cache: Dict[str, Dict[str, Any]] = {}
+_area_cache: Dict[str, Any] = {"ts": 0.0, "areas": {}}
+# One vector stage per in-flight question: sized to anyio's default worker pool (40 threads),
+# which runs the sync routes and the offloaded DB sections of the async /copilot path, so
+# vector stages never queue behind each other.
+RETRIEVAL_WORKERS = 40
+_retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="rag-retrieval")
+_generation_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-speculative")
+_speculation_lock = threading.Lock()
+# Strong references to in-flight async speculative generations (the loop only keeps weak ones).
+_speculation_tasks: Set["asyncio.Task[Any]"] = set()
+_speculation_stats: Dict[str, int] = {
+    "attempted": 0,
+    "confirmed": 0,
+    "saved_ms": 0,
+    "discarded_calls": 0,
+    "discarded_ms": 0,
+    "discarded_tokens_in": 0,
+    "discarded_tokens_out": 0,
+}
 
 
 if os.path.exists(EMBED_CACHE_PATH):
@@ -56,25 +141,14 @@ def _client() -> OpenAI:
     return OpenAI(api_key=settings.openai_api_key)
 
 
-def normalize_query(query: str) -> str:
-    return re.sub(r"\s+", " ", (query or "").strip().lower())
+def _async_client() -> AsyncOpenAI:
+    if not settings.openai_api_key:
+        raise RuntimeError("OPENAI_API_KEY is required.")
+    return AsyncOpenAI(api_key=settings.openai_api_key)
 
 
-def _keyword_score(query_terms: List[str], text: str):
-    text_lower = text.lower()
-    score = 0
-    highlights = []
-    for term in query_terms:
-        if not term:
-            continue
-        term_lower = term.lower()
-        matches = [m for m in re.finditer(re.escape(term_lower), text_lower)]
-        if matches:
-            score += 1
-            for m in matches:
-                highlights.append({"start": m.start(), "end": m.end()})
-    denom = len(query_terms) or 1
-    return score / denom, highlights
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", (query or "").strip().lower())
 
 
 def _embed_cache_key(model: str, text: str) -> str:
@@ -115,7 +189,34 @@ def _plan_embedding_batches(
     return batches
 
 
-def _embed_with_retries(client: OpenAI, model: str, batch: List[Tuple[int, str, int]]):
+def _create_embeddings(
+    client: OpenAI, model: str, inputs: List[str], deadline: Optional[Deadline] = None, hedge: bool = False
+):
+    """One embeddings request; embeddings are idempotent, so a latency-critical one may be hedged."""
+
+    def attempt(_record: List[Dict[str, Any]]):
+        timeout = call_timeout(EMBED_TIMEOUT_S, deadline)
+        start = time.perf_counter()
+        try:
+            res = client.embeddings.create(model=model, input=inputs, timeout=timeout)
+        except Exception as e:
+            provider_breaker.record_error(e, time.perf_counter() - start, timeout)
+            raise
+        provider_breaker.record(True, time.perf_counter() - start, timeout)
+        return res
+
+    if hedge:
+        return hedged_call(f"embed.{model}", attempt, deadline=deadline)
+    return attempt([])
+
+
+def _embed_with_retries(
+    client: OpenAI,
+    model: str,
+    batch: List[Tuple[int, str, int]],
+    deadline: Optional[Deadline] = None,
+    hedge: bool = False,
+):
     """
     Returns list of (original_index, embedding_vector_list[float]).
     Retries by splitting the batch when token-per-request errors occur.
@@ -125,13 +226,13 @@ def _embed_with_retries(client: OpenAI, model: str, batch: List[Tuple[int, str,
 
     inputs = [t for _, t, _ in batch]
     try:
-        res = client.embeddings.create(model=model, input=inputs)
+        res = _create_embeddings(client, model, inputs, deadline, hedge)
         return [(idx, out.embedding) for (idx, _, _), out in zip(batch, res.data)]
     except BadRequestError as e:
         if _is_token_limit_error(e) and len(batch) > 1:
             mid = max(1, len(batch) // 2)
-            left = _embed_with_retries(client, model, batch[:mid])
-            right = _embed_with_retries(client, model, batch[mid:])
+            left = _embed_with_retries(client, model, batch[:mid], deadline)
+            right = _embed_with_retries(client, model, batch[mid:], deadline)
             return left + right
 
         # Single-input safety: if this still triggers a token error, split further and average.
@@ -148,7 +249,7 @@ def _embed_with_retries(client: OpenAI, model: str, batch: List[Tuple[int, str,
             part_vectors: List[np.ndarray] = []
             for sub_batch in _plan_embedding_batches([(0, p.text, p.est_tokens) for p in parts], max_items=EMBED_MAX_BATCH_SIZE, max_tokens=EMBED_MAX_TOKENS_PER_REQUEST):
                 sub_inputs = [t for _, t, _ in sub_batch]
-                sub_res = client.embeddings.create(model=model, input=sub_inputs)
+                sub_res = _create_embeddings(client, model, sub_inputs, deadline)
                 for out in sub_res.data:
                     part_vectors.append(np.array(out.embedding, dtype="float32"))
             avg = np.mean(np.vstack(part_vectors), axis=0)
@@ -157,7 +258,9 @@ def _embed_with_retries(client: OpenAI, model: str, batch: List[Tuple[int, str,
         raise
 
 
-def embed_texts(db: Session, texts: List[str]) -> Tuple[np.ndarray, Any]:
+def embed_texts(
+    db: Session, texts: List[str], deadline: Optional[Deadline] = None, hedge: bool = False
+) -> Tuple[np.ndarray, Any]:
     """
     Returns (vectors, store) with simple on-disk caching for unchanged chunks.
     """
@@ -202,7 +305,7 @@ def embed_texts(db: Session, texts: List[str]) -> Tuple[np.ndarray, Any]:
                 max_item,
             )
 
-            outs = _embed_with_retries(client, model, batch)
+            outs = _embed_with_retries(client, model, batch, deadline, hedge)
             emb_by_idx = {idx: emb for idx, emb in outs}
             for target_idx, raw_text, _ in batch:
                 embedding = emb_by_idx.get(target_idx)
@@ -226,228 +329,433 @@ def embed_texts(db: Session, texts: List[str]) -> Tuple[np.ndarray, Any]:
     return vectors_np, store
 
 
-def embed_query(db: Session, query: str):
-    vecs, store = embed_texts(db, [query])
+def embed_query(db: Session, query: str, deadline: Optional[Deadline] = None):
+    vecs, store = embed_texts(db, [query], deadline=deadline, hedge=True)
     return vecs[0:1], store
 
 
-def _get_chunks_for_vectors(db: Session, vector_ids: List[int], area_ids: List[int]) -> List[Chunk]:
-    if not vector_ids:
-        return []
+async def embed_query_async(client: AsyncOpenAI, query: str, deadline: Optional[Deadline] = None) -> np.ndarray:
+    """
+    Query embedding on an AsyncOpenAI client, sharing embed_texts' cache. Queries are
+    far below EMBED_MAX_INPUT_TOKENS, so there is no batching or splitting here.
+    """
+    model = settings.openai_embed_model
+    key = _embed_cache_key(model, query)
+    embedding = _embed_cache.get(key)
+    if not embedding:
+
+        async def attempt(_record: List[Dict[str, Any]]):
+            timeout = call_timeout(EMBED_TIMEOUT_S, deadline)
+            start = time.perf_counter()
+            try:
+                res = await client.embeddings.create(model=model, input=[query], timeout=timeout)
+            except Exception as e:
+                provider_breaker.record_error(e, time.perf_counter() - start, timeout)
+                raise
+            provider_breaker.record(True, time.perf_counter() - start, timeout)
+            return res
+
+        res = await hedged_call_async(f"embed.{model}", attempt, deadline=deadline)
+        embedding = _embed_cache[key] = res.data[0].embedding
+        await anyio.to_thread.run_sync(_persist_embed_cache)
+    return np.array([embedding], dtype="float32")
+
+
+def _query_terms(normalized: str) -> List[str]:
+    """Content terms of a normalized query; stopwords are dropped unless nothing else is left."""
+    terms = [t.strip("?!.:;\"'()") for t in re.split(r"[\s,]+", normalized)]
+    terms = [t for t in terms if len(t) > 2]
+    content = [t for t in terms if t not in STOPWORDS]
+    return content or terms
+
+
+def _retrieval_columns():
+    """Lean projection for retrieval: no embedding, no ORM entities to lazy-load."""
     return (
-        db.query(Chunk)
-        .join(Document, Document.id == Chunk.document_id)
-        .filter(Chunk.vector_id.in_(vector_ids))
+        Chunk.id,
+        Chunk.chunk_index,
+        Chunk.content,
+        Chunk.section,
+        Chunk.document_id,
+        Chunk.version_id,
+        Chunk.area_id,
+        Chunk.vector_id,
+        Chunk.token_count,
+        Document.title.label("document_title"),
+    )
+
+
+def _area_meta(db: Session, area_ids: List[int]) -> Dict[int, Tuple[str, Optional[str]]]:
+    """
+    In-memory map of area_id -> (name, color); refreshed on TTL expiry or
+    when an unknown id shows up.
+    """
+    global _area_cache
+    ids = set(area_ids)
+    expired = (time.time() - _area_cache["ts"]) >= AREA_CACHE_TTL
+    if expired or not ids <= _area_cache["areas"].keys():
+        rows = db.query(Area.id, Area.name, Area.color).all()
+        _area_cache = {"ts": time.time(), "areas": {aid: (name, color) for aid, name, color in rows}}
+    return _area_cache["areas"]
+
+
+def _candidate_from_row(row, areas: Dict[int, Tuple[str, Optional[str]]], vec_score: float, kw_score: float, hybrid: float) -> Dict[str, Any]:
+    area_name, area_color = areas.get(row.area_id, (None, None))
+    return {
+        "chunk_id": row.id,
+        "chunk_index": row.chunk_index,
+        "chunk_text": row.content,
+        "heading_path": row.section or "",
+        "token_count": row.token_count,
+        "document_id": row.document_id,
+        "document_title": row.document_title,
+        "version_id": row.version_id,
+        "area_id": row.area_id,
+        "area_name": area_name,
+        "area_color": area_color,
+        "vector_score": float(vec_score),
+        "keyword_score": float(kw_score),
+        "hybrid_score": float(hybrid),
+    }
+
+
+def _scoped_chunks(query, area_ids: List[int]):
+    return (
+        query.join(Document, Document.id == Chunk.document_id)
         .filter(Chunk.area_id.in_(area_ids))
         .filter(Chunk.is_latest.is_(True))
         .filter(Document.deleted_at.is_(None))
-        .all()
     )
 
 
-def retrieve_candidates(db: Session, query: str, area_ids: List[int], vec_top_k: int = 20) -> List[Dict[str, Any]]:
+def _lexical_stage(db: Session, matcher: TermMatcher, query_terms: List[str], area_ids: List[int], top_k: int) -> List[Tuple[Any, float]]:
     """
-    Stage 1 retrieval: vector search + lexical boost, area-scoped.
+    Lexical top-k, ranked in SQL before the LIMIT: ts_rank over the GIN-indexed
+    tsvector on Postgres, number of matched terms elsewhere. The pulled rows are
+    then re-ranked by term coverage. Returns (retrieval row, keyword_score) pairs, best first.
     """
-    normalized = normalize_query(query)
-    query_terms = [t.strip() for t in re.split(r"[\\s,]+", normalized) if len(t.strip()) > 2]
-
-    # If embeddings are unavailable, fall back to keyword-only retrieval.
-    if not settings.openai_api_key:
+    if not query_terms:
+        return []
+    base = _scoped_chunks(db.query(*_retrieval_columns()), area_ids)
+    if settings.is_postgres():
+        document = func.to_tsvector(FTS_CONFIG, Chunk.content)
+        tsquery = func.plainto_tsquery(FTS_CONFIG, query_terms[0])
+        for term in query_terms[1:]:
+            tsquery = tsquery.op("||")(func.plainto_tsquery(FTS_CONFIG, term))
+        ranked_query = base.filter(document.op("@@")(tsquery)).order_by(func.ts_rank(document, tsquery).desc())
+    else:
         keyword_filters = [Chunk.content.ilike(f"%{term}%") for term in query_terms]
-        ranked: List[Dict[str, Any]] = []
-        if keyword_filters:
-            fallbacks = (
-                db.query(Chunk)
-                .join(Document, Document.id == Chunk.document_id)
-                .filter(Chunk.area_id.in_(area_ids))
-                .filter(Chunk.is_latest.is_(True))
-                .filter(Document.deleted_at.is_(None))
-                .filter(or_(*keyword_filters))
-                .limit(max(10, vec_top_k))
-                .all()
-            )
-            for c in fallbacks:
-                kw_score, highlights = _keyword_score(query_terms, c.content)
-                ranked.append(
-                    {
-                        "chunk_id": c.id,
-                        "chunk_index": c.chunk_index,
-                        "chunk_text": c.content,
-                        "heading_path": c.section or "",
-                        "document_id": c.document_id,
-                        "document_title": c.document.title if c.document else None,
-                        "version_id": c.version_id,
-                        "area_id": c.area_id,
-                        "area_name": c.document.area.name if c.document and c.document.area else None,
-                        "area_color": c.document.area.color if c.document and c.document.area else None,
-                        "vector_score": 0.0,
-                        "keyword_score": float(kw_score),
-                        "hybrid_score": float(kw_score),
-                        "highlights": highlights,
-                    }
-                )
-            ranked.sort(key=lambda item: item["hybrid_score"], reverse=True)
-        return ranked
-
-    qvec, store = embed_query(db, normalized)
-    ranked: List[Dict[str, Any]] = []
+        matched_terms = sum((case((f, 1), else_=0) for f in keyword_filters), start=literal(0))
+        ranked_query = base.filter(or_(*keyword_filters)).order_by(matched_terms.desc())
+    rows = ranked_query.limit(LEXICAL_SCAN_LIMIT).all()
+    scored = [(row, matcher.score(row.content or "")) for row in rows]
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored[:top_k]
 
-    # Production: Postgres + pgvector
-    if store is None and settings.is_postgres():
-        q = np.array(qvec[0], dtype="float32")
-        q = q / (np.linalg.norm(q) + 1e-12)
-        q_list = q.tolist()
-
-        distance = Chunk.embedding.cosine_distance(q_list)  # type: ignore[attr-defined]
-        rows = (
-            db.query(Chunk, distance.label("distance"))
-            .join(Document, Document.id == Chunk.document_id)
-            .filter(Chunk.area_id.in_(area_ids))
-            .filter(Chunk.is_latest.is_(True))
-            .filter(Chunk.embedding.isnot(None))
-            .filter(Document.deleted_at.is_(None))
-            .order_by(distance.asc())
-            .limit(max(vec_top_k, 20))
-            .all()
-        )
 
-        for c, dist in rows:
-            # cosine_distance range is ~[0,2] when vectors are normalized; map to [0,1]
-            vec_score = float(max(0.0, min(1.0, 1.0 - (float(dist or 0.0) / 2.0))))
-            kw_score, highlights = _keyword_score(query_terms, c.content)
-            hybrid = VECTOR_WEIGHT * vec_score + KEYWORD_WEIGHT * kw_score
-            ranked.append(
-                {
-                    "chunk_id": c.id,
-                    "chunk_index": c.chunk_index,
-                    "chunk_text": c.content,
-                    "heading_path": c.section or "",
-                    "document_id": c.document_id,
-                    "document_title": c.document.title if c.document else None,
-                    "version_id": c.version_id,
-                    "area_id": c.area_id,
-                    "area_name": c.document.area.name if c.document and c.document.area else None,
-                    "area_color": c.document.area.color if c.document and c.document.area else None,
-                    "vector_score": float(vec_score),
-                    "keyword_score": float(kw_score),
-                    "hybrid_score": float(hybrid),
-                    "highlights": highlights,
-                }
-            )
+def _unit_query(qvec: np.ndarray) -> np.ndarray:
+    q = np.array(qvec[0], dtype="float32")
+    return q / (np.linalg.norm(q) + 1e-12)
+
+
+def _pg_vector_hits(
+    db: Session, q_list: List[float], area_ids: List[int], *, limit: Optional[int] = None, chunk_ids: Optional[List[int]] = None
+) -> Tuple[Dict[int, float], Dict[int, np.ndarray]]:
+    """
+    pgvector search returning (scores, vectors) keyed by chunk_id. Embeddings are
+    read only for these hits, for MMR diversification.
+    """
+    distance = Chunk.embedding.cosine_distance(q_list)  # type: ignore[attr-defined]
+    query = _scoped_chunks(db.query(Chunk.id, distance.label("distance"), Chunk.embedding), area_ids).filter(
+        Chunk.embedding.isnot(None)
+    )
+    if chunk_ids is not None:
+        query = query.filter(Chunk.id.in_(chunk_ids))
+    else:
+        query = query.order_by(distance.asc()).limit(limit)
+    scores: Dict[int, float] = {}
+    vectors: Dict[int, np.ndarray] = {}
+    for cid, dist, embedding in query.all():
+        # cosine_distance range is ~[0,2] when vectors are normalized; map to [0,1]
+        scores[cid] = float(max(0.0, min(1.0, 1.0 - (float(dist or 0.0) / 2.0))))
+        vectors[cid] = np.asarray(embedding, dtype="float32")
+    return scores, vectors
+
+
+def _faiss_hits(store: Any, hits: List[Tuple[int, float]]) -> Tuple[Dict[int, float], Dict[int, np.ndarray]]:
+    scores = {vid: max(0.0, (score + 1.0) / 2.0) for vid, score in hits}  # normalize cosine to 0..1
+    return scores, store.reconstruct_ids(list(scores))
+
+
+def _vector_stage(
+    db: Session,
+    normalized: str,
+    area_ids: List[int],
+    top_k: int,
+    submitted_at: float,
+    qvec: Optional[np.ndarray] = None,
+    deadline: Optional[Deadline] = None,
+) -> Dict[str, Any]:
+    """
+    Embed the query (unless qvec is given) and run the ANN search. Runs on the retrieval
+    executor, so it must not touch the caller's session: pgvector search opens its own.
+    Scores and hit vectors are keyed by chunk_id (pgvector) or vector_id (FAISS);
+    scores are normalized to 0..1. queue_ms is the time spent waiting for a worker.
+    """
+    start = time.time()
+    queue_ms = int((start - submitted_at) * 1000)
+    if qvec is None:
+        qvec, store = embed_query(db, normalized, deadline)
+    else:
+        store = build_vector_store_if_needed(db, dim=qvec.shape[1])
+    if store is None and settings.is_postgres():
+        with Session(bind=db.get_bind()) as own:
+            scores, vectors = _pg_vector_hits(own, _unit_query(qvec).tolist(), area_ids, limit=top_k)
+        key = "chunk_id"
     else:
         # Local dev: SQLite + FAISS
-        hits = store.search(qvec, top_k=max(vec_top_k, 20))  # type: ignore[union-attr]
-
-        score_by_vid = {vid: score for vid, score in hits}
-        vids = list(score_by_vid.keys())
-        chunks = _get_chunks_for_vectors(db, vids, area_ids)
-        for c in chunks:
-            vec_score = score_by_vid.get(c.vector_id, 0.0)
-            vec_score = max(0.0, (vec_score + 1.0) / 2.0)  # normalize cosine to 0..1
-            kw_score, highlights = _keyword_score(query_terms, c.content)
-            hybrid = VECTOR_WEIGHT * vec_score + KEYWORD_WEIGHT * kw_score
-            ranked.append(
-                {
-                    "chunk_id": c.id,
-                    "chunk_index": c.chunk_index,
-                    "chunk_text": c.content,
-                    "heading_path": c.section or "",
-                    "document_id": c.document_id,
-                    "document_title": c.document.title if c.document else None,
-                    "version_id": c.version_id,
-                    "area_id": c.area_id,
-                    "area_name": c.document.area.name if c.document and c.document.area else None,
-                    "area_color": c.document.area.color if c.document and c.document.area else None,
-                    "vector_score": float(vec_score),
-                    "keyword_score": float(kw_score),
-                    "hybrid_score": float(hybrid),
-                    "highlights": highlights,
-                }
-            )
+        scores, vectors = _faiss_hits(store, store.search(qvec, top_k=top_k))  # type: ignore[union-attr]
+        key = "vector_id"
+    return {
+        "qvec": qvec,
+        "store": store,
+        "key": key,
+        "scores": scores,
+        "vectors": vectors,
+        "ms": int((time.time() - start) * 1000),
+        "queue_ms": queue_ms,
+    }
+
+
+def retrieve_candidates(
+    db: Session,
+    query: str,
+    area_ids: List[int],
+    vec_top_k: int = 20,
+    timings: Optional[Dict[str, int]] = None,
+    qvec: Optional[np.ndarray] = None,
+    deadline: Optional[Deadline] = None,
+    use_vectors: Optional[bool] = None,
+    vector: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Stage 1 retrieval, area-scoped: the vector and lexical top-k stages run
+    concurrently and their union is ranked by the VECTOR_WEIGHT/KEYWORD_WEIGHT blend.
+    Hits found by only one stage get the other stage's score backfilled, so an
+    exact-term match the ANN search missed can still rank.
+    Per-stage timings are written into `timings` when provided. A precomputed query
+    embedding (qvec) skips the embedding call; otherwise it is bounded by deadline.
+    use_vectors=False runs the lexical stage alone (no API key, or the provider is down).
+    A vector stage computed up front (see retrieve_candidates_batch) replaces the executor one.
+    Highlights are not computed here; see `_with_highlights`.
+    """
+    normalized = normalize_query(query)
+    query_terms = _query_terms(normalized)
+    matcher = matcher_for_terms(query_terms)
+    top_k = max(vec_top_k, 20)
+    if use_vectors is None:
+        use_vectors = bool(settings.openai_api_key)
+
+    # Vector stage goes to the executor; the lexical stage runs here on the caller's session.
+    vector_future = (
+        _retrieval_executor.submit(_vector_stage, db, normalized, area_ids, top_k, time.time(), qvec, deadline)
+        if use_vectors and vector is None
+        else None
+    )
+    lexical_start = time.time()
+    lexical = _lexical_stage(db, matcher, query_terms, area_ids, top_k)
+    lexical_ms = int((time.time() - lexical_start) * 1000)
+    if vector_future is not None:
+        vector = vector_future.result()
+
+    kw_by_chunk = {row.id: score for row, score in lexical}
+    rows_by_id = {row.id: row for row, _ in lexical}
+    vec_scores: Dict[int, float] = dict(vector["scores"]) if vector else {}
+    vectors: Dict[int, np.ndarray] = dict(vector["vectors"]) if vector else {}
+
+    # Hydrate vector-only hits in one projected query; lexical hits are already rows.
+    hydrate_start = time.time()
+    id_filter = None
+    if vector and vector["key"] == "vector_id":
+        known_vids = {row.vector_id for row in rows_by_id.values()}
+        pending = [vid for vid in vec_scores if vid not in known_vids]
+        id_filter = Chunk.vector_id.in_(pending) if pending else None
+    elif vector:
+        pending = [cid for cid in vec_scores if cid not in rows_by_id]
+        id_filter = Chunk.id.in_(pending) if pending else None
+    if id_filter is not None:
+        for row in _scoped_chunks(db.query(*_retrieval_columns()), area_ids).filter(id_filter).all():
+            rows_by_id[row.id] = row
+    chunks = list(rows_by_id.values())
+    areas = _area_meta(db, [row.area_id for row in chunks]) if chunks else {}
+
+    def vec_key(c):
+        return c.vector_id if vector and vector["key"] == "vector_id" else c.id
+
+    # Backfill vector scores (and vectors) for lexical-only hits.
+    if vector:
+        missing = [c for c in chunks if vec_key(c) not in vec_scores and vec_key(c) is not None]
+        if missing and vector["key"] == "vector_id":
+            q = _unit_query(vector["qvec"])
+            for vid, vec in vector["store"].reconstruct_ids([c.vector_id for c in missing]).items():
+                vectors[vid] = vec
+                vec_scores[vid] = max(0.0, (float(np.dot(vec, q)) + 1.0) / 2.0)
+        elif missing:
+            scores, found = _pg_vector_hits(db, _unit_query(vector["qvec"]).tolist(), area_ids, chunk_ids=[c.id for c in missing])
+            vec_scores.update(scores)
+            vectors.update(found)
 
+    ranked: List[Dict[str, Any]] = []
+    for c in chunks:
+        kw_score = kw_by_chunk[c.id] if c.id in kw_by_chunk else matcher.score(c.content)
+        if vector:
+            vec_score = vec_scores.get(vec_key(c), 0.0)
+            hybrid = VECTOR_WEIGHT * vec_score + KEYWORD_WEIGHT * kw_score
+        else:
+            # Embeddings unavailable: keyword-only ranking.
+            vec_score, hybrid = 0.0, kw_score
+        cand = _candidate_from_row(c, areas, vec_score, kw_score, hybrid)
+        if vector and vec_key(c) in vectors:
+            cand["vector"] = vectors[vec_key(c)]
+        ranked.append(cand)
     ranked.sort(key=lambda item: item["hybrid_score"], reverse=True)
 
-    if ranked:
-        return ranked
-
-    # Fallback lexical search if vectors return nothing (rare / cold start)
-    keyword_filters = [Chunk.content.ilike(f"%{term}%") for term in query_terms]
-    if keyword_filters:
-        fallbacks = (
-            db.query(Chunk)
-            .join(Document, Document.id == Chunk.document_id)
-            .filter(Chunk.area_id.in_(area_ids))
-            .filter(Chunk.is_latest.is_(True))
-            .filter(Document.deleted_at.is_(None))
-            .filter(or_(*keyword_filters))
-            .limit(max(5, vec_top_k))
-            .all()
-        )
-        for c in fallbacks:
-            kw_score, highlights = _keyword_score(query_terms, c.content)
-            ranked.append(
-                {
-                    "chunk_id": c.id,
-                    "chunk_index": c.chunk_index,
-                    "chunk_text": c.content,
-                    "heading_path": c.section or "",
-                    "document_id": c.document_id,
-                    "document_title": c.document.title if c.document else None,
-                    "version_id": c.version_id,
-                    "area_id": c.area_id,
-                    "area_name": c.document.area.name if c.document and c.document.area else None,
-                    "area_color": c.document.area.color if c.document and c.document.area else None,
-                    "vector_score": 0.0,
-                    "keyword_score": float(kw_score),
-                    "hybrid_score": float(kw_score),
-                    "highlights": highlights,
-                }
-            )
-        ranked.sort(key=lambda item: item["hybrid_score"], reverse=True)
+    if timings is not None:
+        timings["lexical_ms"] = lexical_ms
+        timings["vector_ms"] = vector["ms"] if vector else 0
+        timings["vector_queue_ms"] = vector["queue_ms"] if vector else 0
+        timings["hydrate_ms"] = int((time.time() - hydrate_start) * 1000)
     return ranked
 
 
-def rerank_candidates(
-    client: OpenAI, query: str, candidates: List[Dict[str, Any]], target_n: int
-) -> Optional[Dict[int, float]]:
+def _vector_stages(
+    db: Session, qvecs: np.ndarray, store: Any, area_ids: List[int], top_k: int
+) -> List[Dict[str, Any]]:
+    """_vector_stage for a matrix of query embeddings: one FAISS search for all rows."""
+    start = time.time()
+    if store is None and settings.is_postgres():
+        # pgvector has no multi-query form; the ordered scans at least share one session.
+        hits = [_pg_vector_hits(db, _unit_query(qvecs[i : i + 1]).tolist(), area_ids, limit=top_k) for i in range(len(qvecs))]
+        key = "chunk_id"
+    else:
+        hits = [_faiss_hits(store, row) for row in store.search_many(qvecs, top_k=top_k)]
+        key = "vector_id"
+    ms = int((time.time() - start) * 1000 / max(1, len(qvecs)))
+    return [
+        {"qvec": qvecs[i : i + 1], "store": store, "key": key, "scores": scores, "vectors": vectors, "ms": ms, "queue_ms": 0}
+        for i, (scores, vectors) in enumerate(hits)
+    ]
+
+
+def retrieve_candidates_batch(
+    db: Session, queries: List[str], area_ids: List[int], vec_top_k: int = 20
+) -> List[List[Dict[str, Any]]]:
     """
-    Lightweight LLM reranker. Returns map of chunk_id -> score.
+    retrieve_candidates for many queries. All queries are embedded by embed_texts (planned
+    batches, shared cache) and searched in one multi-query vector search; the lexical stage
+    and hydration still run per query. Falls back to lexical-only retrieval when the
+    provider is unavailable.
     """
-    if not candidates:
-        return None
+    normalized = [normalize_query(q) for q in queries]
+    top_k = max(vec_top_k, 20)
+    stages: List[Optional[Dict[str, Any]]] = [None] * len(normalized)
+    if normalized and settings.openai_api_key and provider_breaker.allow():
+        try:
+            qvecs, store = embed_texts(db, normalized)
+            stages = list(_vector_stages(db, qvecs, store, area_ids, top_k))
+        except PROVIDER_ERRORS:
+            logger.warning("Batch query embedding failed; retrieving lexically", exc_info=True)
+    return [
+        retrieve_candidates(db, query, area_ids, vec_top_k=top_k, use_vectors=False, vector=stage)
+        for query, stage in zip(normalized, stages)
+    ]
+
+
+def rescore_candidates(
+    db: Session,
+    query: str,
+    chunk_ids: List[int],
+    area_ids: List[int],
+    qvec: Optional[np.ndarray] = None,
+    previous_query: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Hybrid scores for a known candidate pool (the previous turn's) without the ANN and
+    lexical searches. Keyword scoring also counts the previous question's terms, so an
+    instruction like "shorter please" still matches the evidence it refers to. Vector
+    scores use qvec, the follow-up's own embedding; without it, ranking is keyword-only.
+    Chunks that left the area scope or were re-ingested since are dropped.
+    """
+    normalized = normalize_query(query)
+    terms_text = f"{normalize_query(previous_query)} {normalized}" if previous_query else normalized
+    matcher = matcher_for_terms(_query_terms(terms_text))
+    rows = _scoped_chunks(db.query(*_retrieval_columns()), area_ids).filter(Chunk.id.in_(chunk_ids)).all()
+    if not rows:
+        return []
+    areas = _area_meta(db, [row.area_id for row in rows])
+
+    vec_scores: Dict[int, float] = {}
+    vectors: Dict[int, np.ndarray] = {}
+    if qvec is not None:
+        q = _unit_query(qvec)
+        store = build_vector_store_if_needed(db, dim=qvec.shape[1])
+        if store is None and settings.is_postgres():
+            vec_scores, vectors = _pg_vector_hits(db, q.tolist(), area_ids, chunk_ids=[row.id for row in rows])
+        elif store is not None:
+            by_vid = store.reconstruct_ids([row.vector_id for row in rows])
+            for row in rows:
+                if row.vector_id in by_vid:
+                    vectors[row.id] = by_vid[row.vector_id]
+                    vec_scores[row.id] = max(0.0, (float(np.dot(vectors[row.id], q)) + 1.0) / 2.0)
+
+    ranked: List[Dict[str, Any]] = []
+    for row in rows:
+        kw_score = matcher.score(row.content)
+        if qvec is not None:
+            vec_score = vec_scores.get(row.id, 0.0)
+            hybrid = VECTOR_WEIGHT * vec_score + KEYWORD_WEIGHT * kw_score
+        else:
+            vec_score, hybrid = 0.0, kw_score
+        cand = _candidate_from_row(row, areas, vec_score, kw_score, hybrid)
+        if row.id in vectors:
+            cand["vector"] = vectors[row.id]
+        ranked.append(cand)
+    ranked.sort(key=lambda item: item["hybrid_score"], reverse=True)
+    return ranked
 
-    snippets = []
-    for idx, cand in enumerate(candidates[: max(target_n * 2, target_n + 2)]):
-        text = cand["chunk_text"]
-        snippets.append(f"[{cand['chunk_id']}] {text[:400].strip()}")
 
-    prompt = (
-        "Rank the following snippets by relevance to the query. "
-        "Return a JSON array of objects with keys 'id' and 'score' (0-1). "
-        f"Keep only the top {target_n}."
+def _followup_candidates(
+    db: Session,
+    normalized_query: str,
+    followup: Dict[str, Any],
+    area_ids: List[int],
+    top_k: int,
+    qvec: Optional[np.ndarray],
+) -> Optional[List[Dict[str, Any]]]:
+    """The re-scored previous pool when it still covers the question, else None (run full retrieval)."""
+    rescored = rescore_candidates(
+        db, normalized_query, followup["chunk_ids"], area_ids, qvec=qvec, previous_query=followup.get("query")
     )
-    user_msg = f"Query: {query}\nSnippets:\n" + "\n\n".join(snippets)
+    covered = sum(1 for c in rescored if c["hybrid_score"] >= FOLLOWUP_MIN_SCORE)
+    return rescored if covered >= min(top_k, FOLLOWUP_MIN_COVERED) else None
 
-    try:
-        resp = client.chat.completions.create(
-            model=settings.openai_chat_model,
-            messages=[{"role": "system", "content": prompt}, {"role": "user", "content": user_msg}],
-            temperature=0,
-            max_tokens=150,
-        )
-        content = resp.choices[0].message.content or ""
-        match = re.search(r"\[.*\]", content, re.DOTALL)
-        data = json.loads(match.group(0) if match else content)
-        scores = {}
-        for item in data:
-            cid = int(item.get("id"))
-            score = float(item.get("score", 0))
-            scores[cid] = max(0.0, min(1.0, score))
-        return scores
-    except Exception:
-        logger.debug("Rerank failed; falling back to hybrid scores", exc_info=True)
-        return None
+
+def _rerank_gate(candidates: List[Dict[str, Any]], accuracy_level: AccuracyLevel) -> Dict[str, Any]:
+    """
+    Decide the pipeline path from hybrid scores alone:
+    "ungrounded" (skip rerank and generation), "decisive" (skip rerank) or "rerank".
+    """
+    gate = RERANK_GATES[accuracy_level]
+    scores = sorted((float(c.get("hybrid_score", 0.0)) for c in candidates), reverse=True)
+    best = scores[0] if scores else 0.0
+    margin = (scores[0] - scores[1]) if len(scores) > 1 else best
+    if not scores or best < gate.ungrounded_below:
+        path = "ungrounded"
+    elif margin >= gate.decisive_margin:
+        path = "decisive"
+    else:
+        path = "rerank"
+    return {"path": path, "best_hybrid": round(best, 4), "margin": round(margin, 4)}
 
 
 def _apply_rerank(candidates: List[Dict[str, Any]], rerank_scores: Optional[Dict[int, float]]) -> List[Dict[str, Any]]:
@@ -458,27 +766,62 @@ def _apply_rerank(candidates: List[Dict[str, Any]], rerank_scores: Optional[Dict
     return candidates
 
 
-def _dedupe_ranked(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    seen: set[str] = set()
-    per_doc: Dict[int, int] = {}
-    out: List[Dict[str, Any]] = []
+def _text_fingerprint(text: str) -> str:
+    norm = re.sub(r"\s+", " ", (text or "").strip().lower())
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()
 
-    def fp(text: str) -> str:
-        norm = re.sub(r"\s+", " ", (text or "").strip().lower())
-        return hashlib.sha1(norm.encode("utf-8")).hexdigest()
 
-    for cand in candidates:
-        doc_id = cand.get("document_id")
-        if isinstance(doc_id, int) and per_doc.get(doc_id, 0) >= MAX_CHUNKS_PER_DOCUMENT:
-            continue
-        fingerprint = fp(cand.get("chunk_text") or "")
+def _mmr_select(candidates: List[Dict[str, Any]], k: int, lambda_: float) -> List[Dict[str, Any]]:
+    """
+    Maximal Marginal Relevance over the candidates' (normalized) vectors:
+    greedily pick argmax(lambda * score - (1 - lambda) * max_sim_to_selected).
+    Exact-duplicate texts are dropped and MAX_CHUNKS_PER_DOCUMENT still applies.
+    Candidates without a vector (keyword-only retrieval) count as dissimilar to all.
+    """
+    if not candidates or k <= 0:
+        return []
+
+    eligible = np.ones(len(candidates), dtype=bool)
+    seen: set[str] = set()
+    for i, cand in enumerate(candidates):
+        fingerprint = _text_fingerprint(cand.get("chunk_text") or "")
         if fingerprint in seen:
-            continue
+            eligible[i] = False
         seen.add(fingerprint)
-        out.append(cand)
+
+    relevance = np.array([float(c.get("score", c.get("hybrid_score", 0.0))) for c in candidates], dtype="float32")
+    with_vec = [i for i, c in enumerate(candidates) if c.get("vector") is not None]
+    sim = np.zeros((len(candidates), len(candidates)), dtype="float32")
+    if len(with_vec) > 1:
+        mat = np.vstack([candidates[i]["vector"] for i in with_vec]).astype("float32")
+        mat /= np.linalg.norm(mat, axis=1, keepdims=True) + 1e-12
+        sim[np.ix_(with_vec, with_vec)] = mat @ mat.T
+
+    max_sim = np.zeros(len(candidates), dtype="float32")
+    per_doc: Dict[int, int] = {}
+    selected: List[Dict[str, Any]] = []
+    while len(selected) < k and eligible.any():
+        mmr = lambda_ * relevance - (1.0 - lambda_) * max_sim
+        idx = int(np.argmax(np.where(eligible, mmr, -np.inf)))
+        eligible[idx] = False
+        cand = candidates[idx]
+        doc_id = cand.get("document_id")
         if isinstance(doc_id, int):
+            if per_doc.get(doc_id, 0) >= MAX_CHUNKS_PER_DOCUMENT:
+                continue
             per_doc[doc_id] = per_doc.get(doc_id, 0) + 1
-    return out
+        selected.append(cand)
+        max_sim = np.maximum(max_sim, sim[idx])
+    return selected
+
+
+def _with_highlights(query: str, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Attach highlight spans, only for the candidates that survive into sources."""
+    matcher = matcher_for_terms(_query_terms(normalize_query(query)))
+    for cand in candidates:
+        if "highlights" not in cand:
+            cand["highlights"] = matcher.highlights(cand.get("chunk_text") or "")
+    return candidates
 
 
 def _render_sources_section(sources: List[Dict[str, Any]], locale: str = "en") -> str:
@@ -497,6 +840,15 @@ def _render_sources_section(sources: List[Dict[str, Any]], locale: str = "en") -
         lines.append(f"- {title} ({detail})")
     return "\n".join(lines)
 
+IT_HEADING_REPLACEMENTS = {
+    "Quick answer:": "Risposta rapida:",
+    "How to do it:": "Come fare:",
+    "Watch out for:": "Attenzione:",
+    "Next steps:": "Prossimi passi:",
+    "Sources:": "Fonti:",
+}
+
+
 def _enforce_localized_headings(answer: str, locale: str) -> str:
     """
     Post-process guardrail to avoid English section headings when locale=it.
@@ -507,20 +859,68 @@ def _enforce_localized_headings(answer: str, locale: str) -> str:
     if not (locale or "").lower().startswith("it"):
         return answer
 
-    replacements = {
-        "Quick answer:": "Risposta rapida:",
-        "How to do it:": "Come fare:",
-        "Watch out for:": "Attenzione:",
-        "Next steps:": "Prossimi passi:",
-        "Sources:": "Fonti:",
-    }
     out = answer
-    for src, dst in replacements.items():
+    for src, dst in IT_HEADING_REPLACEMENTS.items():
         out = re.sub(rf"(?m)^{re.escape(src)}\s*", dst + " ", out)
     return out
 
 
+class LocalizedHeadingStream:
+    """
+    Incremental _enforce_localized_headings for streamed answers. Text is passed through
+    as soon as it can no longer start an English heading; only a line-start prefix of one
+    is held back. Output matches the batch function applied to the stripped full answer.
+    """
+
+    def __init__(self, locale: str):
+        self.active = (locale or "").lower().startswith("it")
+        self._pending: Optional[str] = ""  # current line start, while it may still be a heading
+        self._skip_ws = True  # leading whitespace (strip) and whitespace after a rewritten heading
+
+    def feed(self, delta: str) -> str:
+        if not self.active:
+            if self._skip_ws:
+                delta = delta.lstrip()
+                self._skip_ws = not delta
+            return delta
+        out: List[str] = []
+        for ch in delta:
+            if self._skip_ws:
+                if ch.isspace():
+                    continue
+                self._skip_ws = False
+            if self._pending is None:
+                out.append(ch)
+                if ch == "\n":
+                    self._pending = ""
+                continue
+            self._pending += ch
+            replacement = IT_HEADING_REPLACEMENTS.get(self._pending)
+            if replacement is not None:
+                out.append(replacement + " ")
+                self._pending = None
+                self._skip_ws = True
+            elif not any(src.startswith(self._pending) for src in IT_HEADING_REPLACEMENTS):
+                out.append(self._pending)
+                self._pending = "" if ch == "\n" else None
+        return "".join(out)
+
+    def flush(self) -> str:
+        tail, self._pending = (self._pending or ""), None
+        return tail
+
+
+def _prompt_locale(locale: Optional[str]) -> str:
+    """Locale key for prompt assembly: every Italian variant shares one prefix, everything else English."""
+    return "it" if (locale or "").lower().startswith("it") else "en"
+
+
 def build_prompt_style(accuracy_level: AccuracyLevel, answer_tone: AnswerTone, locale: str = "en") -> str:
+    return _prompt_style(accuracy_level, answer_tone, _prompt_locale(locale))
+
+
+@lru_cache(maxsize=None)
+def _prompt_style(accuracy_level: AccuracyLevel, answer_tone: AnswerTone, locale: str) -> str:
     guide = get_tone_guide(answer_tone, locale=locale)
     if accuracy_level == AccuracyLevel.HIGH:
         accuracy_block = (
@@ -588,51 +988,332 @@ def _confidence_from_evidence(sources: List[Dict[str, Any]], best_score: Optiona
     return {"percent": percent, "label": label, "explanation": explanation}
 
 
-def answer_with_rag(
-    db: Session,
+def _hybrid_ranked(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    ranked = list(candidates)
+    for c in ranked:
+        c["score"] = c.get("hybrid_score", 0.0)
+    ranked.sort(key=lambda c: c.get("score", 0.0), reverse=True)
+    return ranked
+
+
+def system_prompt(accuracy_level: AccuracyLevel, answer_tone: AnswerTone, locale: str = "en") -> str:
+    """
+    Generation system message. It depends only on (accuracy, tone, locale), so it is built
+    once per combination and sent byte-identical, which lets provider prompt caching reuse it.
+    Ordered from the most shared text to the most specific: the preamble every request sends,
+    then accuracy and tone, then the locale rules.
+    """
+    return _system_prompt(accuracy_level, answer_tone, _prompt_locale(locale))
+
+
+@lru_cache(maxsize=None)
+def _system_prompt(accuracy_level: AccuracyLevel, answer_tone: AnswerTone, locale: str) -> str:
+    fmt = get_tone_guide(answer_tone, locale=locale).formatting
+    sources_label = "Fonti" if locale == "it" else "Sources"
+    language_rule = "Respond in Italian." if locale == "it" else "Respond in English."
+    heading_guard = ""
+    if locale == "it":
+        heading_guard = (
+            " Hard rule: section headings must be in Italian. "
+            "Do NOT use these English headings: Quick answer, How to do it, Watch out for, Next steps, Sources. "
+            "If you include those sections, use exactly: Risposta rapida:, Come fare:, Attenzione:, Prossimi passi:, Fonti:."
+        )
+    return (
+        "You are the Studio Knowledge Copilot. Use ONLY the provided context; do not invent facts. "
+        "If the question cannot be answered from context, say so clearly.\n"
+        + build_prompt_style(accuracy_level, answer_tone, locale=locale)
+        + f"\n{language_rule}{heading_guard} "
+        f"Use headings in this order: {', '.join(fmt.headings)}. "
+        f"Keep bullets to {fmt.max_bullets} or fewer, sentences {fmt.max_sentences} or fewer, and use {fmt.sentence_length}. "
+        f"Always end with a '{sources_label}' section listing the referenced docs/chunks."
+        f"\n\nAppend this final section:\n{sources_label}:\n- <document title> (chunk N)\n"
+    )
+
+
+def _build_messages(
     query: str,
-    area_ids: List[int],
-    top_k: int = 6,
-    accuracy_level: AccuracyLevel = AccuracyLevel.MEDIUM,
-    answer_tone: AnswerTone = AnswerTone.C_EXECUTIVE,
-    locale: str = "en",
-    chat_history: Optional[List[Dict[str, str]]] = None,
+    normalized_query: str,
+    top_context: List[Dict[str, Any]],
+    accuracy_level: AccuracyLevel,
+    answer_tone: AnswerTone,
+    locale: str,
+    chat_history: Optional[List[Dict[str, str]]],
+) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+    """
+    Generation messages for top_context (citation [n] is the n-th chunk) and context packing
+    stats: the memoized system_prompt first, then history (conversation summary and the turns
+    that fit HISTORY_TOKEN_BUDGET), then the question and its context, so the stable part of
+    the prompt is always its prefix.
+    """
+    budget = CONTEXT_TOKEN_BUDGET[accuracy_level]
+    packed = pack_context(
+        top_context,
+        matcher_for_terms(_query_terms(normalized_query)),
+        budget,
+        model=settings.openai_embed_model,
+    )
+    context_blocks = []
+    for block in packed:
+        c = block.candidate
+        heading_label = f" • {c['heading_path']}" if c.get("heading_path") else ""
+        context_blocks.append(
+            f"[{block.index}] Doc {c['document_title'] or c['document_id']} (v{c.get('version_id') or '-'})"
+            f"{heading_label} — chunk {c['chunk_index']}\n{block.text}"
+        )
+    context = "\n\n".join(context_blocks).strip() or "(no context retrieved)"
+    context_stats = {
+        "budget_tokens": budget,
+        "packed_tokens": sum(b.tokens for b in packed),
+        "chunks_packed": len(packed),
+        "chunks_trimmed": sum(1 for b in packed if b.trimmed),
+    }
+
+    user_msg = f"Question: {query}\n\nContext:\n{context}"
+
+    messages = [{"role": "system", "content": system_prompt(accuracy_level, answer_tone, locale)}]
+    for msg in trim_history(chat_history or []):
+        if msg["role"] in ("user", "assistant", "system"):
+            messages.append(msg)
+    messages.append({"role": "user", "content": user_msg})
+    return messages, context_stats
+
+
+def _generate(
+    client: OpenAI,
+    messages: List[Dict[str, str]],
+    accuracy_level: AccuracyLevel,
+    calls: List[Dict[str, Any]],
+    deadline: Optional[Deadline] = None,
+) -> Tuple[Any, int]:
+    gen_start = time.time()
+    resp = chat_completion(
+        client,
+        GENERATE,
+        accuracy_level,
+        messages=messages,
+        calls=calls,
+        deadline=deadline,
+        temperature=GENERATION_TEMPERATURE[accuracy_level],
+    )
+    return resp, int((time.time() - gen_start) * 1000)
+
+
+async def _generate_async(
+    client: AsyncOpenAI,
+    messages: List[Dict[str, str]],
+    accuracy_level: AccuracyLevel,
+    calls: List[Dict[str, Any]],
+    deadline: Optional[Deadline] = None,
+) -> Tuple[Any, int]:
+    gen_start = time.time()
+    resp = await chat_completion_async(
+        client,
+        GENERATE,
+        accuracy_level,
+        messages=messages,
+        calls=calls,
+        deadline=deadline,
+        temperature=GENERATION_TEMPERATURE[accuracy_level],
+    )
+    return resp, int((time.time() - gen_start) * 1000)
+
+
+def _speculation_draft(
+    query: str,
+    normalized_query: str,
+    candidates: List[Dict[str, Any]],
+    top_k: int,
+    accuracy_level: AccuracyLevel,
+    answer_tone: AnswerTone,
+    locale: str,
+    chat_history: Optional[List[Dict[str, str]]],
 ) -> Dict[str, Any]:
-    retrieval_start = time.time()
-    normalized_query = normalize_query(query)
-    accuracy_percent_map = {AccuracyLevel.HIGH: 92, AccuracyLevel.MEDIUM: 85, AccuracyLevel.LOW: 75}
-    accuracy_percent = accuracy_percent_map.get(accuracy_level, 85)
-    cache_key = f"{normalized_query}::{'|'.join(map(str, sorted(area_ids)))}::{accuracy_level.value}"
+    """
+    Speculative context and messages from the hybrid-ranked pool, built before the
+    reranker runs. Works on copies, so the rerank never rewrites the speculative
+    context behind its back. "future" is set by whoever launches the generation.
+    """
+    pool = _hybrid_ranked([dict(c) for c in candidates])
+    context = _with_highlights(normalized_query, _mmr_select(pool, top_k, MMR_LAMBDA[accuracy_level]))
+    messages, context_stats = _build_messages(
+        query, normalized_query, context, accuracy_level, answer_tone, locale, chat_history
+    )
+    return {
+        "context": context,
+        "messages": messages,
+        "context_stats": context_stats,
+        "calls": [],
+        "future": None,
+        "confirmed": False,
+        "saved_ms": 0,
+    }
+
+
+def _start_speculation(
+    client: OpenAI, speculation: Dict[str, Any], accuracy_level: AccuracyLevel, deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """Start generating a _speculation_draft while the reranker runs."""
+    speculation["future"] = _generation_executor.submit(
+        _generate, client, speculation["messages"], accuracy_level, speculation["calls"], deadline
+    )
+    return speculation
+
 
+def _start_speculation_async(
+    client: AsyncOpenAI, speculation: Dict[str, Any], accuracy_level: AccuracyLevel, deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """_start_speculation as an asyncio task; a rejected task is cancelled for real."""
+    task = asyncio.ensure_future(
+        _generate_async(client, speculation["messages"], accuracy_level, speculation["calls"], deadline)
+    )
+    _speculation_tasks.add(task)
+    task.add_done_callback(_speculation_tasks.discard)
+    # A rejected task's failure is never awaited; retrieve it so asyncio does not log it.
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    speculation["future"] = task
+    return speculation
+
+
+def _confirm_speculation(
+    speculation: Dict[str, Any], top_context: List[Dict[str, Any]], ranked: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Keep the speculative answer when every reranked chunk is already in its context.
+    The speculative order is returned so [n] citations still match the prompt, with
+    each chunk's score taken from the reranked pool.
+    """
+    speculative_ids = {c["chunk_id"] for c in speculation["context"]}
+    if top_context and {c["chunk_id"] for c in top_context} <= speculative_ids:
+        speculation["confirmed"] = True
+        reranked = {c["chunk_id"]: c for c in ranked}
+        for cand in speculation["context"]:
+            source = reranked[cand["chunk_id"]]
+            cand["score"] = source["score"]
+            cand["rerank_score"] = source.get("rerank_score")
+        return speculation["context"]
+    speculation["future"].cancel()  # no-op once running; the result is simply dropped
+    return top_context
+
+
+def _count_discarded(calls: List[Dict[str, Any]]) -> None:
+    with _speculation_lock:
+        for call in calls:
+            _speculation_stats["discarded_calls"] += 1
+            _speculation_stats["discarded_ms"] += call.get("latency_ms") or 0
+            _speculation_stats["discarded_tokens_in"] += call.get("tokens_in") or 0
+            _speculation_stats["discarded_tokens_out"] += call.get("tokens_out") or 0
+
+
+def _record_speculation(speculation: Dict[str, Any], generation_ms: int, model_calls: List[Dict[str, Any]]) -> None:
+    future = speculation["future"]
+    calls = speculation["calls"]
+    if future.done():
+        # Speculative calls cost tokens whether kept or not, so they stay visible in model_calls.
+        model_calls.extend(dict(call, speculative=True) for call in calls)
+    if not speculation["confirmed"]:
+        # A rejected call may still be running; its cost lands in the process-wide counters
+        # once it finishes (immediately, if it already has).
+        future.add_done_callback(lambda _: _count_discarded(calls))
+    if speculation["confirmed"]:
+        speculation["saved_ms"] = max(0, generation_ms - speculation.get("wait_ms", generation_ms))
+    with _speculation_lock:
+        _speculation_stats["attempted"] += 1
+        _speculation_stats["confirmed"] += int(speculation["confirmed"])
+        _speculation_stats["saved_ms"] += speculation["saved_ms"]
+        attempted, confirmed = _speculation_stats["attempted"], _speculation_stats["confirmed"]
+    logger.debug("Speculative generation | confirm_rate=%.2f (%s/%s)", confirmed / attempted, confirmed, attempted)
+
+
+def speculation_stats() -> Dict[str, Any]:
+    """Process-wide speculative generation counters: confirm rate, latency saved, cost of discarded calls."""
+    with _speculation_lock:
+        stats = dict(_speculation_stats)
+    stats["confirm_rate"] = round(stats["confirmed"] / stats["attempted"], 4) if stats["attempted"] else None
+    return stats
+
+
+def _answer_meta(state: Dict[str, Any], **extra: Any) -> Dict[str, Any]:
+    confidence = state["confidence"]
+    tone_guide = state["tone_guide"]
+    meta = {
+        "accuracy_level": state["accuracy_level"].value,
+        "answer_tone": state["answer_tone"].value,
+        "evidence_level": state["evidence_level"],
+        "tone_reference": tone_guide.reference_summary,
+        "tone_preview": tone_guide.preview,
+        "confidence_percent": confidence["percent"],
+        "confidence_label": confidence["label"],
+        "confidence_explanation": confidence["explanation"],
+        "accuracy_percent": state["accuracy_percent"],
+        "timings": state["timings"],
+        "pipeline": state["pipeline"],
+        "model_calls": state["model_calls"],
+        "degraded": state["degraded"] is not None,
+        "degraded_reason": state["degraded"],
+        "followup_pool": state["followup_pool"],
+        "areas": [
+            {"id": c.get("area_id"), "name": c.get("area_name"), "color": c.get("area_color")}
+            for c in state["top_context"]
+            if c.get("area_id") is not None
+        ],
+    }
+    meta.update(extra)
+    return meta
+
+
+def _result(state: Dict[str, Any], answer: str, usage: Optional[Dict[str, Any]] = None, **meta_extra: Any) -> Dict[str, Any]:
+    return {
+        "answer": answer,
+        "sources": state["sources"],
+        "matches": state["sources"],  # backward compatibility
+        "best_score": float(state["best_score"]),
+        "usage": usage or {"prompt_tokens": None, "completion_tokens": None, "total_tokens": None, "cached_tokens": None},
+        "meta": _answer_meta(state, **meta_extra),
+    }
+
+
+ACCURACY_PERCENT = {AccuracyLevel.HIGH: 92, AccuracyLevel.MEDIUM: 85, AccuracyLevel.LOW: 75}
+RERANK_TARGET = {AccuracyLevel.HIGH: 8, AccuracyLevel.MEDIUM: 6, AccuracyLevel.LOW: 4}
+
+
+def _retrieval_cache_key(normalized_query: str, area_ids: List[int], accuracy_level: AccuracyLevel) -> str:
+    return f"{normalized_query}::{'|'.join(map(str, sorted(area_ids)))}::{accuracy_level.value}"
+
+
+def _cached_candidates(cache_key: str) -> Optional[List[Dict[str, Any]]]:
     cached = _retrieval_cache.get(cache_key)
     if cached and (time.time() - cached["ts"]) < RETRIEVAL_CACHE_TTL:
-        candidates = cached["candidates"]
-    else:
-        candidates = retrieve_candidates(db, normalized_query, area_ids, vec_top_k=max(20, top_k * 3))
-        _retrieval_cache[cache_key] = {"ts": time.time(), "candidates": candidates}
+        return cached["candidates"]
+    return None
 
-    retrieval_ms = int((time.time() - retrieval_start) * 1000)
 
-    rerank_ms = 0
-    ranked: List[Dict[str, Any]]
-    if settings.openai_api_key:
-        client = _client()
-        rerank_target = {AccuracyLevel.HIGH: 8, AccuracyLevel.MEDIUM: 6, AccuracyLevel.LOW: 4}[accuracy_level]
-        rerank_start = time.time()
-        rerank_scores = rerank_candidates(client, normalized_query, candidates, rerank_target)
-        rerank_ms = int((time.time() - rerank_start) * 1000)
-        ranked = _apply_rerank(list(candidates), rerank_scores)
-    else:
-        ranked = list(candidates)
-        for c in ranked:
-            c["score"] = c.get("hybrid_score", 0.0)
-        ranked.sort(key=lambda c: c.get("score", 0.0), reverse=True)
-
-    ranked = _dedupe_ranked(ranked)
-    top_context = ranked[:top_k]
-    best_score = top_context[0]["score"] if top_context else 0.0
-    evidence_level = _evidence_level(best_score, len(top_context))
-    tone_guide = get_tone_guide(answer_tone, locale=locale)
+def _answer_state(
+    query: str,
+    normalized_query: str,
+    top_k: int,
+    accuracy_level: AccuracyLevel,
+    answer_tone: AnswerTone,
+    locale: str,
+    chat_history: Optional[List[Dict[str, str]]],
+    client: Any,
+    ranked: List[Dict[str, Any]],
+    speculation: Optional[Dict[str, Any]],
+    pipeline: Dict[str, Any],
+    model_calls: List[Dict[str, Any]],
+    timings: Dict[str, int],
+    deadline: Deadline,
+    degraded: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Source selection over the ranked pool and the answer state shared by the sync and
+    async paths. The state carries a finished "result" when no generation is needed
+    (ungrounded question, no API key, or degraded: the provider breaker is open or a
+    provider call already failed for this request).
+    """
+    top_context = _with_highlights(normalized_query, _mmr_select(ranked, top_k, MMR_LAMBDA[accuracy_level]))
+    if speculation is not None:
+        top_context = _confirm_speculation(speculation, top_context, ranked)
+    best_score = max((c["score"] for c in top_context), default=0.0)
 
     sources = [
         {
@@ -651,177 +1332,559 @@ def answer_with_rag(
         }
         for c in top_context
     ]
-    confidence = _confidence_from_evidence(sources, best_score)
+    state: Dict[str, Any] = {
+        "query": query,
+        "normalized_query": normalized_query,
+        "accuracy_level": accuracy_level,
+        "answer_tone": answer_tone,
+        "locale": locale,
+        "chat_history": chat_history,
+        "client": client,
+        "top_context": top_context,
+        "sources": sources,
+        "best_score": best_score,
+        "evidence_level": _evidence_level(best_score, len(top_context)),
+        "confidence": _confidence_from_evidence(sources, best_score),
+        "accuracy_percent": ACCURACY_PERCENT.get(accuracy_level, 85),
+        "tone_guide": get_tone_guide(answer_tone, locale=locale),
+        "timings": timings,
+        "pipeline": pipeline,
+        "model_calls": model_calls,
+        "speculation": speculation,
+        "deadline": deadline,
+        "degraded": degraded,
+        # Stored with the answer so the next turn can re-score this pool first.
+        "followup_pool": {
+            "query": normalized_query,
+            "chunk_ids": [c["chunk_id"] for c in ranked[:FOLLOWUP_POOL_SIZE]],
+        },
+        "result": None,
+    }
 
-    if not top_context or best_score < MIN_GROUNDED_SCORE:
+    if not top_context or best_score < MIN_GROUNDED_SCORE or pipeline["path"] == "ungrounded":
+        if speculation is not None:
+            speculation["future"].cancel()
+            speculation["confirmed"] = False
+            _record_speculation(speculation, 0, model_calls)
+            pipeline["speculation"] = {"confirmed": False, "saved_ms": 0}
         msg = (
             "I couldn’t find enough relevant information in the knowledge base to answer that. "
             "Try naming the area, document title, or a specific keyword, and I’ll search again."
         )
-        return {
-            "answer": f"{msg}\n\n{_render_sources_section(sources, locale=locale)}",
-            "sources": sources,
-            "matches": sources,
-            "best_score": float(best_score),
-            "usage": {"prompt_tokens": None, "completion_tokens": None, "total_tokens": None},
-            "meta": {
-                "accuracy_level": accuracy_level.value,
-                "answer_tone": answer_tone.value,
-                "evidence_level": evidence_level,
-                "tone_reference": tone_guide.reference_summary,
-                "tone_preview": tone_guide.preview,
-                "confidence_percent": confidence["percent"],
-                "confidence_label": confidence["label"],
-                "confidence_explanation": confidence["explanation"],
-                "accuracy_percent": accuracy_percent,
-                "timings": {"retrieval_ms": retrieval_ms, "rerank_ms": rerank_ms},
-                "areas": [
-                    {
-                        "id": c.get("area_id"),
-                        "name": c.get("area_name"),
-                        "color": c.get("area_color"),
-                    }
-                    for c in top_context
-                    if c.get("area_id") is not None
-                ],
-            },
-        }
+        state["result"] = _result(state, f"{msg}\n\n{_render_sources_section(sources, locale=locale)}")
+        return state
+
+    if client is None:
+        state["result"] = _extractive_result(state)
+    return state
+
+
+def _extractive_result(state: Dict[str, Any], degraded: Optional[str] = None) -> Dict[str, Any]:
+    """Answer from the top source excerpts without a model call."""
+    if degraded is not None:
+        state["degraded"] = degraded
+    sources = state["sources"]
+    excerpts = []
+    for s in sources[: min(3, len(sources))]:
+        excerpt = (s.get("chunk_text") or "").strip()
+        if excerpt:
+            excerpts.append(excerpt[:420])
+    answer = "Based on the retrieved snippets:" if excerpts else "No excerpt text available."
+    if excerpts:
+        answer = answer + "\n" + "\n".join([f"- {e}" for e in excerpts])
+    state["timings"]["generation_ms"] = 0
+    return _result(state, f"{answer}\n\n{_render_sources_section(sources, locale=state['locale'])}")
+
+
+def _prepare_answer(
+    db: Session,
+    query: str,
+    area_ids: List[int],
+    top_k: int,
+    accuracy_level: AccuracyLevel,
+    answer_tone: AnswerTone,
+    locale: str,
+    chat_history: Optional[List[Dict[str, str]]],
+    speculate: bool = True,
+    deadline: Optional[Deadline] = None,
+    candidates: Optional[List[Dict[str, Any]]] = None,
+    followup: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Retrieval and rerank, then _answer_state. Every call shares one deadline budget.
+    Stage-1 candidates retrieved up front (batch QA) skip retrieval and its cache. A
+    followup pool (previous turn's meta.followup_pool) is re-scored first and, when it
+    covers the question, replaces retrieval and is ranked by the local reranker.
+    """
+    deadline = deadline or request_deadline()
+    retrieval_start = time.time()
+    normalized_query = normalize_query(query)
+    cache_key = _retrieval_cache_key(normalized_query, area_ids, accuracy_level)
+
+    client = _client() if settings.openai_api_key else None
+    degraded: Optional[str] = None
+    if client is not None and not provider_breaker.allow():
+        client, degraded = None, "circuit_open"
+
+    stage_timings: Dict[str, int] = {}
+    qvec: Optional[np.ndarray] = None
+    reused = False
+    if candidates is None and followup and followup.get("chunk_ids"):
+        if client is not None:
+            try:
+                qvec, _ = embed_query(db, normalized_query, deadline)
+            except PROVIDER_ERRORS:
+                logger.warning("Query embedding failed; answering from lexical retrieval", exc_info=True)
+                client, degraded = None, "provider_error"
+        candidates = _followup_candidates(db, normalized_query, followup, area_ids, top_k, qvec)
+        reused = candidates is not None
+    if candidates is None:
+        candidates = _cached_candidates(cache_key)
+    if candidates is None:
+        retrieve = partial(
+            retrieve_candidates,
+            db,
+            normalized_query,
+            area_ids,
+            vec_top_k=max(20, top_k * 3),
+            timings=stage_timings,
+            qvec=qvec,
+            deadline=deadline,
+        )
+        try:
+            candidates = retrieve(use_vectors=client is not None)
+        except PROVIDER_ERRORS:
+            logger.warning("Query embedding failed; answering from lexical retrieval", exc_info=True)
+            client, degraded = None, "provider_error"
+            candidates = retrieve(use_vectors=False)
+        # Lexical-only pools are worse than what a healthy provider gives; don't cache them.
+        if degraded is None:
+            _retrieval_cache[cache_key] = {"ts": time.time(), "candidates": candidates}
+    # Ranking writes score/rerank_score/highlights; keep the shared cached dicts untouched.
+    candidates = [dict(c) for c in candidates]
 
-    if not settings.openai_api_key:
-        excerpts = []
-        for s in sources[: min(3, len(sources))]:
-            excerpt = (s.get("chunk_text") or "").strip()
-            if excerpt:
-                excerpts.append(excerpt[:420])
-        answer = "Based on the retrieved snippets:" if excerpts else "No excerpt text available."
-        if excerpts:
-            answer = answer + "\n" + "\n".join([f"- {e}" for e in excerpts])
-        return {
-            "answer": f"{answer}\n\n{_render_sources_section(sources, locale=locale)}",
-            "sources": sources,
-            "matches": sources,
-            "best_score": float(best_score),
-            "usage": {"prompt_tokens": None, "completion_tokens": None, "total_tokens": None},
-            "meta": {
-                "accuracy_level": accuracy_level.value,
-                "answer_tone": answer_tone.value,
-                "evidence_level": evidence_level,
-                "tone_reference": tone_guide.reference_summary,
-                "tone_preview": tone_guide.preview,
-                "confidence_percent": confidence["percent"],
-                "confidence_label": confidence["label"],
-                "confidence_explanation": confidence["explanation"],
-                "accuracy_percent": accuracy_percent,
-                "timings": {"retrieval_ms": retrieval_ms, "rerank_ms": rerank_ms, "generation_ms": 0},
-                "areas": [
-                    {"id": c.get("area_id"), "name": c.get("area_name"), "color": c.get("area_color")}
-                    for c in top_context
-                    if c.get("area_id") is not None
-                ],
-            },
-        }
+    retrieval_ms = int((time.time() - retrieval_start) * 1000)
 
-    context_blocks = []
-    for idx, c in enumerate(top_context, start=1):
-        heading_label = f" • {c['heading_path']}" if c.get("heading_path") else ""
-        context_blocks.append(
-            f"[{idx}] Doc {c['document_title'] or c['document_id']} (v{c.get('version_id') or '-'})"
-            f"{heading_label} — chunk {c['chunk_index']}\n{c['chunk_text']}"
+    rerank_ms = 0
+    ranked: List[Dict[str, Any]]
+    model_calls: List[Dict[str, Any]] = []
+    speculation: Optional[Dict[str, Any]] = None
+    # Without an API key there is no reranker to gate; keyword ranking is final.
+    pipeline = _rerank_gate(candidates, accuracy_level) if client else {"path": "keyword_only"}
+    if followup:
+        pipeline["followup"] = "reused" if reused else "retrieved"
+    if client and pipeline["path"] == "rerank":
+        rerank_start = time.time()
+        # A reused pool already went through this conversation's rerank last turn.
+        reranker = (
+            LocalReranker() if reused else get_reranker(accuracy_level, client, calls=model_calls, deadline=deadline)
         )
-    context = "\n\n".join(context_blocks).strip() or "(no context retrieved)"
-
-    fmt = tone_guide.formatting
-    sources_label = "Fonti" if (locale or "").lower().startswith("it") else "Sources"
-    language_rule = (
-        "Respond in Italian. " if (locale or "").lower().startswith("it") else "Respond in English. "
+        # Only an LLM rerank is slow enough for overlapping generation to pay off.
+        if speculate and settings.speculative_generation and reranker.name == "llm":
+            speculation = _start_speculation(
+                client,
+                _speculation_draft(
+                    query, normalized_query, candidates, top_k, accuracy_level, answer_tone, locale, chat_history
+                ),
+                accuracy_level,
+                deadline,
+            )
+        rerank_scores = reranker.score(normalized_query, candidates, RERANK_TARGET[accuracy_level])
+        pipeline["reranker"] = reranker.name
+        rerank_ms = int((time.time() - rerank_start) * 1000)
+        ranked = _apply_rerank(list(candidates), rerank_scores)
+    else:
+        ranked = _hybrid_ranked(candidates)
+
+    return _answer_state(
+        query,
+        normalized_query,
+        top_k,
+        accuracy_level,
+        answer_tone,
+        locale,
+        chat_history,
+        client,
+        ranked,
+        speculation,
+        pipeline,
+        model_calls,
+        {"retrieval_ms": retrieval_ms, **stage_timings, "rerank_ms": rerank_ms},
+        deadline,
+        degraded,
     )
-    heading_guard = ""
-    if (locale or "").lower().startswith("it"):
-        heading_guard = (
-            "Hard rule: section headings must be in Italian. "
-            "Do NOT use these English headings: Quick answer, How to do it, Watch out for, Next steps, Sources. "
-            "If you include those sections, use exactly: Risposta rapida:, Come fare:, Attenzione:, Prossimi passi:, Fonti:."
+
+
+def _read_and_release(db: Session, read: Callable[[], Any]) -> Any:
+    """Run a DB read and end its transaction, so no pooled connection is held while the model is awaited."""
+    try:
+        return read()
+    finally:
+        db.rollback()
+
+
+async def _prepare_answer_async(
+    db: Session,
+    query: str,
+    area_ids: List[int],
+    top_k: int,
+    accuracy_level: AccuracyLevel,
+    answer_tone: AnswerTone,
+    locale: str,
+    chat_history: Optional[List[Dict[str, str]]],
+    deadline: Optional[Deadline] = None,
+    followup: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    _prepare_answer without holding a thread across network calls: the query embedding
+    and the LLM rerank are awaited on an AsyncOpenAI client, and only the DB/FAISS part of
+    retrieval is offloaded to a worker thread (the vector stage itself keeps using the
+    dedicated retrieval executor).
+    """
+    deadline = deadline or request_deadline()
+    retrieval_start = time.time()
+    normalized_query = normalize_query(query)
+    cache_key = _retrieval_cache_key(normalized_query, area_ids, accuracy_level)
+    client = _async_client() if settings.openai_api_key else None
+    degraded: Optional[str] = None
+    if client is not None and not provider_breaker.allow():
+        client, degraded = None, "circuit_open"
+
+    stage_timings: Dict[str, int] = {}
+    qvec: Optional[np.ndarray] = None
+    embedded = False
+
+    async def embed() -> None:
+        nonlocal qvec, client, degraded, embedded
+        embedded = True
+        if client is None:
+            return
+        embed_start = time.time()
+        try:
+            qvec = await embed_query_async(client, normalized_query, deadline)
+        except PROVIDER_ERRORS:
+            logger.warning("Query embedding failed; answering from lexical retrieval", exc_info=True)
+            client, degraded = None, "provider_error"
+        stage_timings["embed_ms"] = int((time.time() - embed_start) * 1000)
+
+    candidates: Optional[List[Dict[str, Any]]] = None
+    if followup and followup.get("chunk_ids"):
+        await embed()
+        candidates = await anyio.to_thread.run_sync(
+            _read_and_release, db, partial(_followup_candidates, db, normalized_query, followup, area_ids, top_k, qvec)
         )
-    system = (
-        "You are the Studio Knowledge Copilot. Use ONLY the provided context; do not invent facts. "
-        + language_rule
-        + heading_guard
-        + " "
-        "If the question cannot be answered from context, say so clearly. "
-        f"Use headings in this order: {', '.join(fmt.headings)}. "
-        f"Keep bullets to {fmt.max_bullets} or fewer, sentences {fmt.max_sentences} or fewer, and use {fmt.sentence_length}. "
-        f"Always end with a '{sources_label}' section listing the referenced docs/chunks."
-        + build_prompt_style(accuracy_level, answer_tone, locale=locale)
-        + f"\n\nAppend this final section:\n{sources_label}:\n- <document title> (chunk N)\n"
+    reused = candidates is not None
+    if candidates is None:
+        candidates = _cached_candidates(cache_key)
+    if candidates is None:
+        if not embedded:
+            await embed()
+        candidates = await anyio.to_thread.run_sync(
+            _read_and_release,
+            db,
+            partial(
+                retrieve_candidates,
+                db,
+                normalized_query,
+                area_ids,
+                vec_top_k=max(20, top_k * 3),
+                timings=stage_timings,
+                qvec=qvec,
+                use_vectors=client is not None,
+            )
+        )
+        if degraded is None:
+            _retrieval_cache[cache_key] = {"ts": time.time(), "candidates": candidates}
+    candidates = [dict(c) for c in candidates]
+
+    retrieval_ms = int((time.time() - retrieval_start) * 1000)
+
+    rerank_ms = 0
+    ranked: List[Dict[str, Any]]
+    model_calls: List[Dict[str, Any]] = []
+    speculation: Optional[Dict[str, Any]] = None
+    pipeline = _rerank_gate(candidates, accuracy_level) if client else {"path": "keyword_only"}
+    if followup:
+        pipeline["followup"] = "reused" if reused else "retrieved"
+    if client and pipeline["path"] == "rerank":
+        rerank_start = time.time()
+        reranker = (
+            LocalReranker()
+            if reused
+            else get_reranker(accuracy_level, None, calls=model_calls, async_client=client, deadline=deadline)
+        )
+        if settings.speculative_generation and reranker.name == "llm":
+            speculation = _start_speculation_async(
+                client,
+                _speculation_draft(
+                    query, normalized_query, candidates, top_k, accuracy_level, answer_tone, locale, chat_history
+                ),
+                accuracy_level,
+                deadline,
+            )
+        rerank_scores = await reranker.ascore(normalized_query, candidates, RERANK_TARGET[accuracy_level])
+        pipeline["reranker"] = reranker.name
+        rerank_ms = int((time.time() - rerank_start) * 1000)
+        ranked = _apply_rerank(list(candidates), rerank_scores)
+    else:
+        ranked = _hybrid_ranked(candidates)
+
+    return _answer_state(
+        query,
+        normalized_query,
+        top_k,
+        accuracy_level,
+        answer_tone,
+        locale,
+        chat_history,
+        client,
+        ranked,
+        speculation,
+        pipeline,
+        model_calls,
+        {"retrieval_ms": retrieval_ms, **stage_timings, "rerank_ms": rerank_ms},
+        deadline,
+        degraded,
     )
-    user_msg = f"Question: {query}\n\nContext:\n{context}"
 
-    messages = [{"role": "system", "content": system}]
-    history = chat_history or []
-    for msg in history[-12:]:
-        role = msg.get("role")
-        content = (msg.get("content") or "").strip()
-        if role not in ("user", "assistant", "system") or not content:
-            continue
-        messages.append({"role": role, "content": content[:2000]})
-    messages.append({"role": "user", "content": user_msg})
 
-    gen_start = time.time()
-    resp = client.chat.completions.create(
-        model=settings.openai_chat_model,
-        messages=messages,
-        temperature=0.15 if accuracy_level == AccuracyLevel.HIGH else (0.25 if accuracy_level == AccuracyLevel.MEDIUM else 0.35),
+def _finalize_answer(
+    state: Dict[str, Any],
+    answer: str,
+    usage: Optional[Dict[str, Any]],
+    generation_ms: int,
+    context_stats: Dict[str, int],
+) -> Dict[str, Any]:
+    """Append the sources section when the model left it out and assemble the result."""
+    locale = state["locale"]
+    sources_label = "Fonti" if (locale or "").lower().startswith("it") else "Sources"
+    if sources_label.lower() not in answer.lower():
+        answer = f"{answer}\n\n{_render_sources_section(state['sources'], locale=locale)}"
+    state["timings"]["generation_ms"] = generation_ms
+    state["timings"]["deadline_left_ms"] = int(state["deadline"].remaining() * 1000)
+
+    logger.debug(
+        "RAG timings | retrieval=%sms rerank=%sms generation=%sms evidence=%s",
+        state["timings"]["retrieval_ms"],
+        state["timings"]["rerank_ms"],
+        generation_ms,
+        state["evidence_level"],
     )
-    generation_ms = int((time.time() - gen_start) * 1000)
+    return _result(state, answer, usage, context=context_stats)
+
+
+def _messages_for(state: Dict[str, Any]) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+    return _build_messages(
+        state["query"],
+        state["normalized_query"],
+        state["top_context"],
+        state["accuracy_level"],
+        state["answer_tone"],
+        state["locale"],
+        state["chat_history"],
+    )
+
+
+def _completed_answer(state: Dict[str, Any], resp: Any, generation_ms: int, context_stats: Dict[str, int]) -> Dict[str, Any]:
+    """Record speculation, apply localized headings and assemble the result for a finished completion."""
+    speculation = state["speculation"]
+    if speculation is not None:
+        _record_speculation(speculation, generation_ms, state["model_calls"])
+        state["pipeline"]["speculation"] = {"confirmed": speculation["confirmed"], "saved_ms": speculation["saved_ms"]}
 
     answer = (resp.choices[0].message.content or "").strip()
-    answer = _enforce_localized_headings(answer, locale=locale)
-    if (sources_label.lower() not in answer.lower()):
-        answer = f"{answer}\n\n{_render_sources_section(sources, locale=locale)}"
+    answer = _enforce_localized_headings(answer, locale=state["locale"])
     usage = getattr(resp, "usage", None)
     usage_block = {
         "prompt_tokens": getattr(usage, "prompt_tokens", None) if usage else None,
         "completion_tokens": getattr(usage, "completion_tokens", None) if usage else None,
         "total_tokens": getattr(usage, "total_tokens", None) if usage else None,
+        "cached_tokens": cached_tokens(usage),
     }
+    return _finalize_answer(state, answer, usage_block, generation_ms, context_stats)
 
-    logger.debug(
-        "RAG timings | retrieval=%sms rerank=%sms generation=%sms evidence=%s",
-        retrieval_ms,
-        rerank_ms,
-        generation_ms,
-        evidence_level,
+
+def answer_with_rag(
+    db: Session,
+    query: str,
+    area_ids: List[int],
+    top_k: int = 6,
+    accuracy_level: AccuracyLevel = AccuracyLevel.MEDIUM,
+    answer_tone: AnswerTone = AnswerTone.C_EXECUTIVE,
+    locale: str = "en",
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    deadline: Optional[Deadline] = None,
+    candidates: Optional[List[Dict[str, Any]]] = None,
+    followup: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Grounded answer for one question. candidates (from retrieve_candidates_batch) replace
+    stage-1 retrieval; `db` is not used then. followup is the previous turn's
+    meta.followup_pool in the same conversation (see _prepare_answer).
+    """
+    state = _prepare_answer(
+        db,
+        query,
+        area_ids,
+        top_k,
+        accuracy_level,
+        answer_tone,
+        locale,
+        chat_history,
+        deadline=deadline,
+        candidates=candidates,
+        followup=followup,
     )
+    if state["result"] is not None:
+        return state["result"]
+
+    speculation = state["speculation"]
+    model_calls = state["model_calls"]
+    if speculation is not None and speculation["confirmed"]:
+        wait_start = time.time()
+        try:
+            resp, generation_ms = speculation["future"].result()
+            speculation["wait_ms"] = int((time.time() - wait_start) * 1000)
+        except Exception:
+            logger.warning("Speculative generation failed; regenerating", exc_info=True)
+            speculation["confirmed"] = False
+    if speculation is None or not speculation["confirmed"]:
+        messages, context_stats = _messages_for(state)
+        try:
+            resp, generation_ms = _generate(state["client"], messages, accuracy_level, model_calls, state["deadline"])
+        except PROVIDER_ERRORS:
+            logger.warning("Generation failed; serving an extractive answer", exc_info=True)
+            return _extractive_result(state, "provider_error")
+    else:
+        context_stats = speculation["context_stats"]
+    return _completed_answer(state, resp, generation_ms, context_stats)
 
-    return {
-        "answer": answer,
-        "sources": sources,
-        "matches": sources,  # backward compatibility
-        "best_score": float(best_score),
-        "usage": usage_block,
-        "meta": {
-            "accuracy_level": accuracy_level.value,
-            "answer_tone": answer_tone.value,
-            "evidence_level": evidence_level,
-            "tone_reference": tone_guide.reference_summary,
-            "tone_preview": tone_guide.preview,
-            "confidence_percent": confidence["percent"],
-            "confidence_label": confidence["label"],
-            "confidence_explanation": confidence["explanation"],
-            "timings": {
-                "retrieval_ms": retrieval_ms,
-                "rerank_ms": rerank_ms,
-                "generation_ms": generation_ms,
-            },
-            "accuracy_percent": accuracy_percent,
-            "areas": [
-                {
-                    "id": c.get("area_id"),
-                    "name": c.get("area_name"),
-                    "color": c.get("area_color"),
-                }
-                for c in top_context
-                if c.get("area_id") is not None
-            ],
-        },
-    }
+
+async def answer_with_rag_async(
+    db: Session,
+    query: str,
+    area_ids: List[int],
+    top_k: int = 6,
+    accuracy_level: AccuracyLevel = AccuracyLevel.MEDIUM,
+    answer_tone: AnswerTone = AnswerTone.C_EXECUTIVE,
+    locale: str = "en",
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    deadline: Optional[Deadline] = None,
+    followup: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    answer_with_rag for async callers. Embedding, rerank and generation are awaited, so a
+    request only occupies a worker thread for its short DB/FAISS section and concurrency is
+    bounded by the provider, not the thread pool. `db` must not be used concurrently by the
+    caller while this runs; its transaction is rolled back once retrieval is done, so
+    callers commit their writes first.
+    """
+    state = await _prepare_answer_async(
+        db, query, area_ids, top_k, accuracy_level, answer_tone, locale, chat_history, deadline, followup
+    )
+    if state["result"] is not None:
+        return state["result"]
+
+    speculation = state["speculation"]
+    model_calls = state["model_calls"]
+    if speculation is not None and speculation["confirmed"]:
+        wait_start = time.time()
+        try:
+            resp, generation_ms = await speculation["future"]
+            speculation["wait_ms"] = int((time.time() - wait_start) * 1000)
+        except Exception:
+            logger.warning("Speculative generation failed; regenerating", exc_info=True)
+            speculation["confirmed"] = False
+    if speculation is None or not speculation["confirmed"]:
+        messages, context_stats = _messages_for(state)
+        try:
+            resp, generation_ms = await _generate_async(
+                state["client"], messages, accuracy_level, model_calls, state["deadline"]
+            )
+        except PROVIDER_ERRORS:
+            logger.warning("Generation failed; serving an extractive answer", exc_info=True)
+            return _extractive_result(state, "provider_error")
+    else:
+        context_stats = speculation["context_stats"]
+    return _completed_answer(state, resp, generation_ms, context_stats)
+
+
+def stream_answer_with_rag(
+    db: Session,
+    query: str,
+    area_ids: List[int],
+    top_k: int = 6,
+    accuracy_level: AccuracyLevel = AccuracyLevel.MEDIUM,
+    answer_tone: AnswerTone = AnswerTone.C_EXECUTIVE,
+    locale: str = "en",
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    deadline: Optional[Deadline] = None,
+    followup: Optional[Dict[str, Any]] = None,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming answer_with_rag. Yields ("sources", {sources, meta}) once retrieval and
+    rerank finish, then ("token", {text}) deltas with localized headings already applied,
+    then ("done", result) with the same shape answer_with_rag returns.
+    Speculation is off here: streaming already starts output right after rerank.
+    A provider failure before the first token falls back to the extractive answer.
+    """
+    state = _prepare_answer(
+        db,
+        query,
+        area_ids,
+        top_k,
+        accuracy_level,
+        answer_tone,
+        locale,
+        chat_history,
+        speculate=False,
+        deadline=deadline,
+        followup=followup,
+    )
+    yield "sources", {"sources": state["sources"], "meta": _answer_meta(state)}
+    if state["result"] is not None:
+        yield "token", {"text": state["result"]["answer"]}
+        yield "done", state["result"]
+        return
+
+    messages, context_stats = _messages_for(state)
+    headings = LocalizedHeadingStream(locale)
+    usage_block: Dict[str, Any] = {"prompt_tokens": None, "completion_tokens": None, "total_tokens": None, "cached_tokens": None}
+    parts: List[str] = []
+    gen_start = time.time()
+    deltas = chat_completion_stream(
+        state["client"],
+        GENERATE,
+        accuracy_level,
+        messages=messages,
+        calls=state["model_calls"],
+        usage_out=usage_block,
+        deadline=state["deadline"],
+        temperature=GENERATION_TEMPERATURE[accuracy_level],
+    )
+    try:
+        for delta in deltas:
+            text = headings.feed(delta)
+            if text:
+                parts.append(text)
+                yield "token", {"text": text}
+    except PROVIDER_ERRORS:
+        # Once tokens went out the answer cannot be swapped; let the caller report the error.
+        if parts:
+            raise
+        logger.warning("Generation stream failed; serving an extractive answer", exc_info=True)
+        result = _extractive_result(state, "provider_error")
+        yield "token", {"text": result["answer"]}
+        yield "done", result
+        return
+    tail = headings.flush()
+    if tail:
+        parts.append(tail)
+        yield "token", {"text": tail}
+    generation_ms = int((time.time() - gen_start) * 1000)
+
+    answer = "".join(parts).strip()
+    result = _finalize_answer(state, answer, usage_block, generation_ms, context_stats)
+    if len(result["answer"]) > len(answer):
+        yield "token", {"text": result["answer"][len(answer):]}
+    yield "done", result
@@ -0,0 +1,248 @@
+import json
+import logging
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Protocol
+
+from openai import AsyncOpenAI, OpenAI
+
+from app.db.models import AccuracyLevel
+from app.services.deadlines import Deadline
+from app.services.model_routing import RERANK, chat_completion, chat_completion_async
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Local score mix; cosine is taken from the retrieval vector_score (0..1 mapped back to -1..1).
+LOCAL_WEIGHTS = {"cosine": 0.5, "bm25": 0.3, "proximity": 0.2}
+# Local scores move a candidate's hybrid_score by this much per unit of deviation from the
+# pool's mean local score, so the output stays on the hybrid scale that MIN_GROUNDED_SCORE,
+# _evidence_level and the confidence estimate are calibrated for.
+LOCAL_RERANK_SPREAD = 0.3
+# Which reranker each accuracy level uses; only HIGH waits on an LLM round trip.
+RERANKER_BY_ACCURACY = {
+    AccuracyLevel.HIGH: "llm",
+    AccuracyLevel.MEDIUM: "local",
+    AccuracyLevel.LOW: "local",
+}
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class Reranker(Protocol):
+    name: str
+
+    def score(self, query: str, candidates: List[Dict[str, Any]], target_n: int) -> Optional[Dict[int, float]]:
+        """Returns chunk_id -> relevance in 0..1, or None to keep hybrid ordering."""
+        ...
+
+    async def ascore(self, query: str, candidates: List[Dict[str, Any]], target_n: int) -> Optional[Dict[int, float]]:
+        """score() for the async request path."""
+        ...
+
+
+def _rerank_messages(query: str, candidates: List[Dict[str, Any]], target_n: int) -> List[Dict[str, str]]:
+    snippets = []
+    for idx, cand in enumerate(candidates[: max(target_n * 2, target_n + 2)]):
+        text = cand["chunk_text"]
+        snippets.append(f"[{cand['chunk_id']}] {text[:400].strip()}")
+
+    prompt = (
+        "Rank the following snippets by relevance to the query. "
+        "Return a JSON array of objects with keys 'id' and 'score' (0-1). "
+        f"Keep only the top {target_n}."
+    )
+    user_msg = f"Query: {query}\nSnippets:\n" + "\n\n".join(snippets)
+    return [{"role": "system", "content": prompt}, {"role": "user", "content": user_msg}]
+
+
+def _parse_rerank(content: str) -> Dict[int, float]:
+    match = re.search(r"\[.*\]", content, re.DOTALL)
+    data = json.loads(match.group(0) if match else content)
+    scores = {}
+    for item in data:
+        cid = int(item.get("id"))
+        score = float(item.get("score", 0))
+        scores[cid] = max(0.0, min(1.0, score))
+    return scores
+
+
+def rerank_candidates(
+    client: OpenAI,
+    query: str,
+    candidates: List[Dict[str, Any]],
+    target_n: int,
+    accuracy_level: AccuracyLevel = AccuracyLevel.HIGH,
+    calls: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+) -> Optional[Dict[int, float]]:
+    """
+    Lightweight LLM reranker. Returns map of chunk_id -> score. The call is idempotent,
+    so it is hedged; a timeout falls back to hybrid ordering like any other failure.
+    """
+    if not candidates:
+        return None
+    try:
+        resp = chat_completion(
+            client,
+            RERANK,
+            accuracy_level,
+            messages=_rerank_messages(query, candidates, target_n),
+            calls=calls,
+            deadline=deadline,
+            hedge=True,
+            temperature=0,
+        )
+        return _parse_rerank(resp.choices[0].message.content or "")
+    except Exception:
+        logger.debug("Rerank failed; falling back to hybrid scores", exc_info=True)
+        return None
+
+
+async def rerank_candidates_async(
+    client: AsyncOpenAI,
+    query: str,
+    candidates: List[Dict[str, Any]],
+    target_n: int,
+    accuracy_level: AccuracyLevel = AccuracyLevel.HIGH,
+    calls: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+) -> Optional[Dict[int, float]]:
+    """rerank_candidates on an AsyncOpenAI client."""
+    if not candidates:
+        return None
+    try:
+        resp = await chat_completion_async(
+            client,
+            RERANK,
+            accuracy_level,
+            messages=_rerank_messages(query, candidates, target_n),
+            calls=calls,
+            deadline=deadline,
+            hedge=True,
+            temperature=0,
+        )
+        return _parse_rerank(resp.choices[0].message.content or "")
+    except Exception:
+        logger.debug("Rerank failed; falling back to hybrid scores", exc_info=True)
+        return None
+
+
+class LLMReranker:
+    name = "llm"
+
+    def __init__(
+        self,
+        client: Optional[OpenAI],
+        accuracy_level: AccuracyLevel = AccuracyLevel.HIGH,
+        calls: Optional[List[Dict[str, Any]]] = None,
+        async_client: Optional[AsyncOpenAI] = None,
+        deadline: Optional[Deadline] = None,
+    ):
+        self.client = client
+        self.accuracy_level = accuracy_level
+        self.calls = calls
+        self.async_client = async_client
+        self.deadline = deadline
+
+    def score(self, query: str, candidates: List[Dict[str, Any]], target_n: int) -> Optional[Dict[int, float]]:
+        return rerank_candidates(
+            self.client, query, candidates, target_n, self.accuracy_level, self.calls, self.deadline
+        )
+
+    async def ascore(self, query: str, candidates: List[Dict[str, Any]], target_n: int) -> Optional[Dict[int, float]]:
+        return await rerank_candidates_async(
+            self.async_client, query, candidates, target_n, self.accuracy_level, self.calls, self.deadline
+        )
+
+
+def _min_window(positions: Dict[str, List[int]]) -> Optional[int]:
+    """Smallest token window containing at least one occurrence of every term in positions."""
+    if len(positions) < 2:
+        return None
+    events = sorted((pos, term) for term, plist in positions.items() for pos in plist)
+    need = len(positions)
+    counts: Dict[str, int] = {}
+    best: Optional[int] = None
+    left = 0
+    for pos, term in events:
+        counts[term] = counts.get(term, 0) + 1
+        while len(counts) == need:
+            lpos, lterm = events[left]
+            width = pos - lpos + 1
+            best = width if best is None else min(best, width)
+            counts[lterm] -= 1
+            if not counts[lterm]:
+                del counts[lterm]
+            left += 1
+    return best
+
+
+class LocalReranker:
+    """
+    CPU-only reranker: BM25 over the candidate pool, query-term proximity, and the
+    cosine similarity retrieval already computed. No network, so it never fails to parse.
+    The local signal re-orders candidates around their hybrid_score instead of replacing it.
+    """
+
+    name = "local"
+
+    def score(self, query: str, candidates: List[Dict[str, Any]], target_n: int) -> Optional[Dict[int, float]]:
+        if not candidates:
+            return None
+        terms = list(dict.fromkeys(t for t in _WORD_RE.findall(query.lower()) if len(t) > 2))
+        docs = [_WORD_RE.findall((c.get("chunk_text") or "").lower()) for c in candidates]
+        n = len(docs)
+        avg_len = (sum(len(d) for d in docs) / n) or 1.0
+        df = Counter(t for d in docs for t in set(d) if t in terms)
+        idf = {t: math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5)) for t in terms}
+        # BM25 of a pool-wide perfect match, to saturate scores into 0..1 comparably across queries.
+        ceiling = sum(idf.values()) * (BM25_K1 + 1) or 1.0
+
+        local: Dict[int, float] = {}
+        for cand, tokens in zip(candidates, docs):
+            tf = Counter(t for t in tokens if t in idf)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / avg_len)
+            bm25 = sum(idf[t] * tf[t] * (BM25_K1 + 1) / (tf[t] + norm) for t in tf)
+
+            positions: Dict[str, List[int]] = {}
+            for i, tok in enumerate(tokens):
+                if tok in idf:
+                    positions.setdefault(tok, []).append(i)
+            window = _min_window(positions)
+            proximity = (len(positions) / window) if window else 0.0
+
+            cosine = max(0.0, 2.0 * float(cand.get("vector_score") or 0.0) - 1.0)
+            raw = (
+                LOCAL_WEIGHTS["cosine"] * cosine
+                + LOCAL_WEIGHTS["bm25"] * min(1.0, bm25 / ceiling)
+                + LOCAL_WEIGHTS["proximity"] * min(1.0, proximity)
+            )
+            local[cand["chunk_id"]] = max(0.0, min(1.0, raw))
+
+        mean_local = sum(local.values()) / len(local)
+        scores: Dict[int, float] = {}
+        for cand in candidates:
+            hybrid = float(cand.get("hybrid_score", cand.get("vector_score")) or 0.0)
+            shifted = hybrid + LOCAL_RERANK_SPREAD * (local[cand["chunk_id"]] - mean_local)
+            scores[cand["chunk_id"]] = max(0.0, min(1.0, shifted))
+        return scores
+
+    async def ascore(self, query: str, candidates: List[Dict[str, Any]], target_n: int) -> Optional[Dict[int, float]]:
+        # A few dozen candidates score in well under a millisecond; not worth a thread hop.
+        return self.score(query, candidates, target_n)
+
+
+def get_reranker(
+    accuracy_level: AccuracyLevel,
+    client: Optional[OpenAI],
+    calls: Optional[List[Dict[str, Any]]] = None,
+    async_client: Optional[AsyncOpenAI] = None,
+    deadline: Optional[Deadline] = None,
+) -> Reranker:
+    """Reranker for an accuracy level; pass async_client instead of client for ascore()."""
+    if RERANKER_BY_ACCURACY.get(accuracy_level) == "llm" and (client is not None or async_client is not None):
+        return LLMReranker(client, accuracy_level, calls, async_client=async_client, deadline=deadline)
+    return LocalReranker()
@@ -1,5 +1,5 @@
 import os
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 import numpy as np
 import faiss
 from sqlalchemy.orm import Session
@@ -40,16 +40,31 @@ class FaissVectorStore:
         return list(range(start_id, start_id + vectors.shape[0]))
 
     def search(self, query_vec: np.ndarray, top_k: int = 6) -> List[Tuple[int, float]]:
-        q = query_vec.astype("float32")
+        return self.search_many(query_vec[:1], top_k=top_k)[0]
+
+    def search_many(self, query_vecs: np.ndarray, top_k: int = 6) -> List[List[Tuple[int, float]]]:
+        """One FAISS search for a matrix of queries; hits per query row, best first."""
+        q = query_vecs.astype("float32")
         q = _normalize(q)
         scores, ids = self.index.search(q, top_k)
         out = []
-        for vid, score in zip(ids[0].tolist(), scores[0].tolist()):
-            if vid == -1:
+        for row_ids, row_scores in zip(ids.tolist(), scores.tolist()):
+            out.append([(vid, float(score)) for vid, score in zip(row_ids, row_scores) if vid != -1])
+        return out
+
+    def reconstruct_ids(self, vector_ids: List[int]) -> Dict[int, np.ndarray]:
+        """
+        Stored (normalized) vectors for specific rows, e.g. to score hits found by
+        the lexical stage or to diversify candidates without a DB round trip.
+        """
+        out: Dict[int, np.ndarray] = {}
+        for vid in vector_ids:
+            if vid is None or vid < 0 or vid >= self.index.ntotal:
                 continue
-            out.append((vid, float(score)))
+            out[vid] = self.index.reconstruct(int(vid))
         return out
 
+
 def build_vector_store_if_needed(db: Session, dim: int) -> Optional[FaissVectorStore]:
     """
     Local dev fallback: FAISS on disk (SQLite).
@@ -0,0 +1,107 @@
+from datetime import timedelta
+from unittest import mock
+
+import faiss
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import AccuracyLevel, AnswerTone, BatchQAJob, Base, utcnow
+from app.services import batch_qa
+from app.services.vector_store import FaissVectorStore
+import app.services.rag as rag
+
+
+def _store(vectors):
+    store = FaissVectorStore.__new__(FaissVectorStore)
+    store.dim = vectors.shape[1]
+    store.index = faiss.IndexFlatIP(store.dim)
+    store.index.add(vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+    return store
+
+
+def test_search_many_matches_one_search_per_query():
+    rng = np.random.default_rng(7)
+    store = _store(rng.normal(size=(50, 8)).astype("float32"))
+    queries = rng.normal(size=(5, 8)).astype("float32")
+    many = store.search_many(queries, top_k=4)
+    assert len(many) == 5
+    for i, hits in enumerate(many):
+        single = store.search(queries[i : i + 1], top_k=4)
+        assert [vid for vid, _ in hits] == [vid for vid, _ in single]
+
+
+def test_batch_retrieval_embeds_once_and_searches_once():
+    store = _store(np.eye(4, dtype="float32"))
+    qvecs = np.eye(4, dtype="float32")[:3]
+    retrieve = mock.Mock(return_value=[])
+    with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+        rag, "embed_texts", return_value=(qvecs, store)
+    ) as embed, mock.patch.object(rag, "retrieve_candidates", retrieve), mock.patch.object(
+        store, "search_many", wraps=store.search_many
+    ) as search:
+        pools = rag.retrieve_candidates_batch(None, ["Alpha?", "beta", "gamma"], [1])
+    assert pools == [[], [], []]
+    embed.assert_called_once_with(None, ["alpha?", "beta", "gamma"])
+    search.assert_called_once()
+    stages = [c.kwargs["vector"] for c in retrieve.call_args_list]
+    assert [max(s["scores"], key=s["scores"].get) for s in stages] == [0, 1, 2]
+    assert all(s["key"] == "vector_id" for s in stages)
+
+
+def test_batch_retrieval_without_api_key_is_lexical_only():
+    retrieve = mock.Mock(return_value=[])
+    with mock.patch.object(rag.settings, "openai_api_key", ""), mock.patch.object(
+        rag, "embed_texts"
+    ) as embed, mock.patch.object(rag, "retrieve_candidates", retrieve):
+        rag.retrieve_candidates_batch(None, ["one", "two"], [1])
+    embed.assert_not_called()
+    assert [c.kwargs["vector"] for c in retrieve.call_args_list] == [None, None]
+
+
+def _job_db(tmp_path):
+    # a file, not :memory:, so the job thread and the readers get their own connections
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine)
+
+
+def test_batch_job_streams_results_and_counts_failures(tmp_path):
+    def answer(db, question, area_ids, candidates=None, **kwargs):
+        if question == "broken":
+            raise RuntimeError("boom")
+        return {"answer": f"A: {question}", "sources": candidates, "best_score": 0.9, "meta": {"evidence_level": "high"}}
+
+    pools = [[{"chunk_id": 1}], [], [{"chunk_id": 3}]]
+    engine, Session = _job_db(tmp_path)
+    with mock.patch.object(batch_qa, "SessionLocal", Session), mock.patch.object(
+        batch_qa, "retrieve_candidates_batch", return_value=pools
+    ), mock.patch.object(batch_qa, "answer_with_rag", side_effect=answer):
+        view = batch_qa.submit_batch(
+            1, ["first", "broken", "third"], [1], AccuracyLevel.MEDIUM, AnswerTone.TECHNICAL, "en"
+        )
+        job = batch_qa.get_job(view["job_id"])
+        events = [e for e in batch_qa.job_events(job, poll_s=0.01, heartbeat_s=0.05) if e is not None]
+        final = batch_qa.job_view(batch_qa.get_job(view["job_id"]))
+
+    assert view["total"] == 3 and job["user_id"] == 1
+    results = {payload["index"]: payload for kind, payload in events if kind == "result"}
+    assert results[0]["answer"] == "A: first" and results[0]["sources"] == [{"chunk_id": 1}]
+    assert results[1]["error"] == "Answer generation failed"
+    assert events[-1] == ("done", {**events[-1][1], "status": "done", "completed": 3, "failed": 1})
+    assert [r["index"] for r in final["results"]] == [0, 1, 2]
+    engine.dispose()
+
+
+def test_batch_job_cut_off_by_a_restart_reads_as_failed(tmp_path):
+    engine, Session = _job_db(tmp_path)
+    with Session() as db:
+        db.add(BatchQAJob(id="stale", user_id=1, status="answering", total=2, updated_at=utcnow() - timedelta(hours=1)))
+        db.commit()
+    with mock.patch.object(batch_qa, "SessionLocal", Session):
+        job = batch_qa.get_job("stale")
+        events = list(batch_qa.job_events(job, poll_s=0.01))
+        assert batch_qa.get_job("missing") is None
+    assert job["status"] == "failed" and job["error"]
+    assert events == [("done", {k: v for k, v in job.items() if k != "user_id"})]
+    engine.dispose()
@@ -0,0 +1,73 @@
+import os
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Base, Blob
+from app.services.blobs import content_hash, release_blob, store_blob
+from app.utils import files
+
+
+def test_identical_uploads_share_one_stored_file_until_the_last_reference_goes(tmp_path):
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, expire_on_commit=False)()
+
+    with mock.patch.object(files.settings, "data_dir", str(tmp_path)), mock.patch.object(
+        files.settings, "storage_provider", "local"
+    ):
+        first = store_blob(db, b"same bytes", "a.PDF", "application/pdf")
+        second = store_blob(db, b"same bytes", "b.pdf", "application/pdf")
+        assert first.sha256 == second.sha256 == content_hash(b"same bytes")
+        assert second.storage_path == f"{first.sha256}.pdf"
+        assert db.get(Blob, first.sha256).ref_count == 2
+        assert os.listdir(tmp_path / "uploads") == [first.storage_path]
+
+        release_blob(db, first.sha256)
+        assert db.get(Blob, first.sha256).ref_count == 1
+        assert os.path.exists(files.file_path(first.storage_path))
+
+        release_blob(db, first.sha256)
+        assert db.get(Blob, first.sha256) is None
+        assert os.listdir(tmp_path / "uploads") == []
+    db.close()
+    engine.dispose()
+
+
+def test_deleting_a_document_releases_its_versions_blobs(tmp_path):
+    from app.db.models import Document, DocumentVersion, Role, User
+    from app.routers.documents import delete_document
+
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, expire_on_commit=False)()
+    admin = User(email="root@studio.local", password_hash="-", role=Role.SUPER_ADMIN.value)
+    db.add(admin)
+    db.commit()
+
+    with mock.patch.object(files.settings, "data_dir", str(tmp_path)), mock.patch.object(
+        files.settings, "storage_provider", "local"
+    ):
+        shared = store_blob(db, b"v1", "a.txt", "text/plain")
+        store_blob(db, b"v1", "copy.txt", "text/plain")  # held by another document
+        only = store_blob(db, b"v2", "a.txt", "text/plain")
+        doc = Document(area_id=1, title="A", filename=only.storage_path, original_name="a.txt", created_by=admin.id)
+        db.add(doc)
+        db.commit()
+        for n, blob in ((1, shared), (2, only)):
+            db.add(
+                DocumentVersion(
+                    document_id=doc.id, version=n, file_path=blob.storage_path, content_hash=blob.sha256, original_name="a.txt"
+                )
+            )
+        db.commit()
+
+        delete_document(doc.id, db=db, user=admin)
+        delete_document(doc.id, db=db, user=admin)  # already deleted: nothing released twice
+
+        assert db.get(Blob, shared.sha256).ref_count == 1
+        assert db.get(Blob, only.sha256) is None
+        assert os.listdir(tmp_path / "uploads") == [shared.storage_path]
+    db.close()
+    engine.dispose()
@@ -0,0 +1,186 @@
+import json
+import os
+from unittest import mock
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Area, Base, Chunk, Document, DocumentVersion, IngestionJob, User
+from app.services import bulk_ingest
+from app.utils import files
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _text(title, changed=None):
+    return "\n\n".join(
+        (f"{title} section {i} was rewritten. " if i == changed else f"{title} section {i}. ") + "word " * 600
+        for i in range(3)
+    )
+
+
+def test_bulk_ingest_maps_folders_to_areas_and_resumes_from_the_manifest(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    with Session() as db:
+        db.add_all([Area(key="sales", name="Sales"), Area(key="technical", name="Technical")])
+        db.add(User(email="admin@studio.local", password_hash="-"))
+        db.commit()
+
+    root = tmp_path / "documents"
+    _write(str(root / "sales" / "faq.md"), _text("FAQ"))
+    _write(str(root / "sales" / "pricing" / "offer.txt"), _text("Offer"))
+    _write(str(root / "docs" / "api.md"), _text("API"))
+    _write(str(root / "misc" / "notes.md"), _text("Notes"))
+    embedded = []
+
+    def embed(db, texts):
+        embedded.append(len(texts))
+        return np.ones((len(texts), 4), dtype="float32"), None
+
+    def run():
+        return bulk_ingest.run_bulk_ingest(
+            str(root), 1, Session, area_map={"docs": "technical"}, extract_threads=2, embed_threads=1, queue_size=2
+        )
+
+    with mock.patch.object(files.settings, "data_dir", str(tmp_path / "data")), mock.patch.object(
+        files.settings, "storage_provider", "local"
+    ), mock.patch.object(bulk_ingest, "embed_texts", side_effect=embed):
+        first = run()
+        assert first["indexed"] == 3 and first["skipped"] == 1 and first["failed"] == 0
+        assert first["chunks"] == first["embedded"] == sum(embedded) == 9
+
+        # one file edited, one only touched
+        _write(str(root / "sales" / "faq.md"), _text("FAQ", changed=1))
+        os.utime(root / "docs" / "api.md", ns=(1, 1))
+        embedded.clear()
+        second = run()
+        assert second["indexed"] == 1 and second["unchanged"] == 2
+        assert second["embedded"] == sum(embedded) == 1 and second["reused"] == 2
+        assert run()["unchanged"] == 3
+
+    with Session() as db:
+        by_area = {a.key: a.id for a in db.query(Area)}
+        docs = {d.original_name: d for d in db.query(Document)}
+        assert set(docs) == {"faq.md", "offer.txt", "api.md"}
+        assert docs["api.md"].area_id == by_area["technical"]
+        assert docs["faq.md"].latest_version == 2
+        latest = db.query(Chunk).filter(Chunk.document_id == docs["faq.md"].id, Chunk.is_latest.is_(True)).all()
+        assert len(latest) == 3 and all(c.version_id == docs["faq.md"].latest_version_id for c in latest)
+        assert db.query(IngestionJob).count() == 4
+    engine.dispose()
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """(root, Session, run) over a file sqlite with a "sales" area; run() ingests root once."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    with Session() as db:
+        db.add(Area(key="sales", name="Sales"))
+        db.add(User(email="admin@studio.local", password_hash="-"))
+        db.commit()
+    root = tmp_path / "documents"
+
+    def embed(db, texts):
+        return np.ones((len(texts), 4), dtype="float32"), None
+
+    def run():
+        return bulk_ingest.run_bulk_ingest(str(root), 1, Session, extract_threads=1, embed_threads=1)
+
+    with mock.patch.object(files.settings, "data_dir", str(tmp_path / "data")), mock.patch.object(
+        files.settings, "storage_provider", "local"
+    ), mock.patch.object(bulk_ingest, "embed_texts", side_effect=embed):
+        yield root, Session, run
+    engine.dispose()
+
+
+def _entry(root, rel):
+    manifest = bulk_ingest.Manifest(str(root / bulk_ingest.MANIFEST_NAME))
+    manifest.close()
+    return manifest.get(rel)
+
+
+def test_files_outside_known_area_folders_are_skipped(tree):
+    root, Session, run = tree
+    _write(str(root / "misc" / "notes.md"), _text("Notes"))
+    _write(str(root / "readme.md"), _text("Readme"))
+    stats = run()
+    assert stats["scanned"] == stats["skipped"] == 2 and stats["indexed"] == 0
+    with Session() as db:
+        assert db.query(Document).count() == 0
+
+
+def test_matching_size_and_mtime_skips_the_file_without_reading_it(tree):
+    root, _, run = tree
+    _write(str(root / "sales" / "faq.md"), _text("FAQ"))
+    assert run()["indexed"] == 1
+    with mock.patch.object(bulk_ingest, "content_hash", wraps=bulk_ingest.content_hash) as hashed:
+        stats = run()
+    assert stats["unchanged"] == 1 and stats["indexed"] == 0
+    hashed.assert_not_called()
+
+
+def test_touched_file_with_the_same_hash_is_not_reindexed(tree):
+    root, Session, run = tree
+    path = root / "sales" / "faq.md"
+    _write(str(path), _text("FAQ"))
+    run()
+    os.utime(path, ns=(1, 1))
+    stats = run()
+    assert stats["unchanged"] == 1 and stats["indexed"] == 0
+    assert _entry(root, os.path.join("sales", "faq.md"))["mtime_ns"] == 1
+    with mock.patch.object(bulk_ingest, "content_hash", wraps=bulk_ingest.content_hash) as hashed:
+        assert run()["unchanged"] == 1
+    hashed.assert_not_called()
+    with Session() as db:
+        assert db.query(DocumentVersion).count() == 1
+
+
+def test_edited_file_becomes_a_new_version_of_its_document(tree):
+    root, Session, run = tree
+    path = root / "sales" / "faq.md"
+    _write(str(path), _text("FAQ"))
+    run()
+    _write(str(path), _text("FAQ", changed=2))
+    stats = run()
+    assert stats["indexed"] == 1 and stats["embedded"] == 1 and stats["reused"] == 2
+    with Session() as db:
+        doc = db.query(Document).one()
+        assert doc.latest_version == 2
+        assert _entry(root, os.path.join("sales", "faq.md"))["version_id"] == doc.latest_version_id
+        versions = {v.version: v.id for v in db.query(DocumentVersion)}
+        for version_id in versions.values():
+            assert db.query(Chunk).filter(Chunk.version_id == version_id).count() == 3
+
+
+@pytest.mark.parametrize("status", [bulk_ingest.REGISTERED, bulk_ingest.FAILED])
+def test_file_registered_by_an_unfinished_run_reuses_its_version(tree, status):
+    root, Session, run = tree
+    rel = os.path.join("sales", "faq.md")
+    _write(str(root / rel), _text("FAQ"))
+    with mock.patch.object(bulk_ingest, "store_chunks", side_effect=RuntimeError("disk full")):
+        assert run()["failed"] == 1
+    manifest_path = root / bulk_ingest.MANIFEST_NAME
+    lines = manifest_path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["status"] for line in lines] == [bulk_ingest.REGISTERED, bulk_ingest.FAILED]
+    if status == bulk_ingest.REGISTERED:
+        # interrupted after registering, before the failure was written
+        manifest_path.write_text(lines[0] + "\n", encoding="utf-8")
+    registered = _entry(root, rel)
+    assert registered["status"] == status
+
+    assert run()["indexed"] == 1
+    with Session() as db:
+        doc = db.query(Document).one()
+        assert db.query(DocumentVersion).count() == 1
+        assert doc.latest_version_id == registered["version_id"]
+    assert _entry(root, rel)["status"] == bulk_ingest.INDEXED
@@ -0,0 +1,55 @@
+from app.utils.chunking import chunk_text, iter_chunks
+
+
+def test_headings_carry_across_segments():
+    chunks = list(iter_chunks(["# Policy\n\nIntro text.", "## Refunds\nWithin 30 days."], max_chars=20, overlap=0))
+    assert [(c["heading_path"], c["text"]) for c in chunks] == [
+        ("Policy", "Intro text."),
+        ("Policy > Refunds", "Within 30 days."),
+    ]
+
+
+def test_segments_are_consumed_lazily():
+    pulled = []
+
+    def segments():
+        for i in range(100):
+            pulled.append(i)
+            yield f"Page {i} " + "word " * 200
+
+    chunks = iter_chunks(segments(), max_chars=1500, overlap=0)
+    first = next(chunks)
+    assert first["text"].startswith("Page 0") and len(pulled) <= 3
+
+
+def test_chunk_text_packs_paragraphs_with_overlap():
+    text = "\n\n".join(f"p{i} " + "x" * 50 for i in range(6))
+    chunks = chunk_text(text, max_chars=120, overlap=10)
+    assert chunks[0]["text"].startswith("p0") and "p1" in chunks[0]["text"]
+    assert all(len(c["text"]) <= 120 + 10 + 2 for c in chunks)
+    assert "p5" in chunks[-1]["text"]
+
+
+def test_each_paragraph_is_tokenized_once_and_counts_add_up():
+    from unittest import mock
+
+    from app.utils import chunking
+    from app.utils.tokenization import estimate_tokens
+
+    paragraphs = [f"Paragraph {i}. " + "word " * (50 + 40 * i) for i in range(8)]
+    with mock.patch.object(chunking, "token_offsets", wraps=chunking.token_offsets) as offsets:
+        chunks = chunk_text("\n\n".join(paragraphs), max_chars=10_000, overlap=0, max_tokens=300)
+    assert offsets.call_count == len(paragraphs)
+    for c in chunks:
+        assert c["token_count"] <= 300
+        assert abs(c["token_count"] - estimate_tokens(c["text"])) <= 2
+
+
+def test_long_paragraph_is_cut_at_breakpoints_within_the_token_limit():
+    sentence = "The refund window is thirty days. "
+    chunks = chunk_text(sentence * 200, max_chars=100_000, max_tokens=200, overlap_tokens=20)
+    assert len(chunks) > 1
+    assert all(c["token_count"] <= 200 for c in chunks)
+    assert all(c["text"].endswith("days.") for c in chunks)
+    # consecutive slices overlap by about overlap_tokens
+    assert chunks[1]["text"][:30] in chunks[0]["text"]
@@ -0,0 +1,137 @@
+from unittest import mock
+
+import openai
+import pytest
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CLOSED, OPEN, CircuitBreaker, provider_breaker
+import app.services.rag as rag
+
+
+def _breaker():
+    probe = mock.Mock()
+    breaker = CircuitBreaker("test", probe=probe)
+    return breaker, probe
+
+
+@pytest.fixture(autouse=True)
+def _no_probe_thread():
+    with mock.patch.object(circuit_breaker.threading, "Thread") as thread:
+        yield thread
+    provider_breaker.reset()
+
+
+def test_trips_on_error_rate_and_starts_one_probe(_no_probe_thread):
+    breaker, _ = _breaker()
+    for i in range(circuit_breaker.BREAKER_MIN_CALLS - 1):
+        breaker.record(ok=i % 2 == 0, latency_s=0.1, timeout_s=10)
+    assert breaker.allow()  # too few calls to judge
+    breaker.record(ok=False, latency_s=0.1, timeout_s=10)
+    assert breaker.state == OPEN and not breaker.allow()
+    breaker.record(ok=False, latency_s=0.1, timeout_s=10)
+    assert _no_probe_thread.call_count == 1
+
+
+def test_trips_on_slow_calls_even_when_they_succeed():
+    breaker, _ = _breaker()
+    for _ in range(circuit_breaker.BREAKER_MIN_CALLS):
+        breaker.record(ok=True, latency_s=9.0, timeout_s=10)
+    assert breaker.state == OPEN
+
+
+def test_healthy_traffic_keeps_breaker_closed():
+    breaker, _ = _breaker()
+    for i in range(50):
+        breaker.record(ok=i % 5 != 0, latency_s=1.0, timeout_s=10)
+    assert breaker.state == CLOSED
+
+
+def test_probe_closes_breaker_after_cooldown():
+    breaker, probe = _breaker()
+    probe.side_effect = [RuntimeError("still down"), None]
+    for _ in range(circuit_breaker.BREAKER_MIN_CALLS):
+        breaker.record(ok=False, latency_s=0.1, timeout_s=10)
+    with mock.patch.object(circuit_breaker.time, "sleep") as sleep:
+        breaker._probe_until_closed()
+    assert probe.call_count == 2
+    assert [c.args[0] for c in sleep.call_args_list] == [
+        circuit_breaker.BREAKER_COOLDOWN_S,
+        circuit_breaker.BREAKER_PROBE_INTERVAL_S,
+    ]
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["trips"] == 1
+
+
+def _status_error(cls, status):
+    response = mock.Mock(status_code=status, headers={})
+    return cls("error", response=response, body=None)
+
+
+def test_client_errors_do_not_count_as_provider_failures():
+    breaker, _ = _breaker()
+    for _ in range(circuit_breaker.BREAKER_MIN_CALLS):
+        breaker.record_error(_status_error(openai.BadRequestError, 400), latency_s=0.1, timeout_s=10)
+    assert breaker.state == CLOSED
+    for error in (
+        openai.APITimeoutError(request=mock.Mock()),
+        openai.APIConnectionError(request=mock.Mock()),
+        _status_error(openai.RateLimitError, 429),
+        _status_error(openai.InternalServerError, 503),
+    ):
+        assert circuit_breaker.is_provider_failure(error)
+    for _ in range(circuit_breaker.BREAKER_MIN_CALLS):
+        breaker.record_error(_status_error(openai.InternalServerError, 502), latency_s=0.1, timeout_s=10)
+    assert breaker.state == OPEN
+
+
+def _trip_provider_breaker():
+    for _ in range(circuit_breaker.BREAKER_MIN_CALLS):
+        provider_breaker.record(ok=False, latency_s=0.1, timeout_s=10)
+    assert provider_breaker.state == OPEN
+
+
+def test_open_breaker_serves_extractive_answer_without_provider_calls():
+    _trip_provider_breaker()
+    client = mock.Mock()
+    retrieve = mock.Mock(return_value=[_candidate(1, 0.9), _candidate(2, 0.5)])
+    rag._retrieval_cache.clear()
+    with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+        rag, "_client", return_value=client
+    ), mock.patch.object(rag, "retrieve_candidates", retrieve):
+        result = rag.answer_with_rag(db=None, query="breaker question", area_ids=[1])
+    assert client.chat.completions.create.call_count == 0
+    assert retrieve.call_args.kwargs["use_vectors"] is False
+    assert result["answer"].startswith("Based on the retrieved snippets:")
+    assert result["meta"]["degraded"] is True
+    assert result["meta"]["degraded_reason"] == "circuit_open"
+    assert result["meta"]["pipeline"]["path"] == "keyword_only"
+    assert not rag._retrieval_cache  # lexical-only pools are not cached
+
+
+def test_generation_failure_degrades_to_extractive_answer():
+    client = mock.Mock()
+    client.chat.completions.create.side_effect = openai.APIConnectionError(request=mock.Mock())
+    rag._retrieval_cache.clear()
+    with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+        rag, "_client", return_value=client
+    ), mock.patch.object(rag, "retrieve_candidates", return_value=[_candidate(1, 0.9), _candidate(2, 0.5)]):
+        result = rag.answer_with_rag(db=None, query="failing question", area_ids=[1])
+    assert result["answer"].startswith("Based on the retrieved snippets:")
+    assert result["meta"]["degraded_reason"] == "provider_error"
+    assert result["meta"]["model_calls"][0]["ok"] is False
+
+
+def _candidate(chunk_id, hybrid):
+    return {
+        "chunk_id": chunk_id,
+        "chunk_index": 0,
+        "chunk_text": f"Snippet {chunk_id}",
+        "heading_path": "",
+        "document_id": chunk_id,
+        "document_title": f"Doc {chunk_id}",
+        "version_id": 1,
+        "area_id": 1,
+        "vector_score": hybrid,
+        "keyword_score": 0.0,
+        "hybrid_score": hybrid,
+    }
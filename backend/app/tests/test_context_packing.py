@@ -0,0 +1,34 @@
+from app.services.context_packing import ELISION, pack_context
+from app.utils.term_matcher import TermMatcher
+
+
+def _cand(cid, text, token_count):
+    return {"chunk_id": cid, "chunk_text": text, "token_count": token_count}
+
+
+def test_pack_keeps_matching_sentences_and_citation_indices():
+    filler = " ".join(f"Filler sentence number {i}." for i in range(40))
+    long_text = f"{filler} Refunds are issued within 30 days. Keep the receipt. {filler}"
+    candidates = [
+        _cand(1, long_text, 600),
+        _cand(2, "Short note about refunds.", 10),
+    ]
+    blocks = pack_context(candidates, TermMatcher(["refunds"]), budget_tokens=200)
+
+    assert [b.index for b in blocks] == [1, 2]
+    first = blocks[0]
+    assert first.trimmed
+    assert "Refunds are issued within 30 days." in first.text
+    assert "Keep the receipt." in first.text  # neighbour sentence kept
+    assert ELISION in first.text
+    assert "Filler sentence number 0." not in first.text
+    assert sum(b.tokens for b in blocks) <= 200
+
+
+def test_pack_stops_when_budget_is_exhausted():
+    candidates = [_cand(i, f"Pricing tier {i} costs money.", 90) for i in range(1, 6)]
+    blocks = pack_context(candidates, TermMatcher(["pricing"]), budget_tokens=200)
+
+    assert [b.index for b in blocks] == [1, 2]
+    assert not any(b.trimmed for b in blocks)
+    assert sum(b.tokens for b in blocks) == 180
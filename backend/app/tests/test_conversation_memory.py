@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Base, Conversation, ConversationMessage
+from app.services import conversation_memory
+from app.services.conversation_memory import SUMMARY_PREFIX, load_history, refresh_summary, trim_history
+
+T0 = datetime(2026, 1, 1, 9, 0, 0)
+
+
+def _session():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine, expire_on_commit=False)
+
+
+def _conversation(session, n_messages, words=100):
+    conversation = Conversation(id="c1", title="Chat", workspace_id=1, created_by_user_id=1)
+    session.add(conversation)
+    for i in range(n_messages):
+        session.add(
+            ConversationMessage(
+                conversation_id="c1",
+                role="user" if i % 2 == 0 else "assistant",
+                content=f"message {i} " + "word " * words,
+                created_at=T0 + timedelta(minutes=i),
+            )
+        )
+    session.commit()
+    return conversation
+
+
+def test_trim_history_keeps_summary_and_newest_turns_within_budget():
+    history = [{"role": "system", "content": f"{SUMMARY_PREFIX}\nearlier"}] + [
+        {"role": "user", "content": f"turn {i} " + "word " * 100} for i in range(10)
+    ]
+    trimmed = trim_history(history, budget=350)
+    assert trimmed[0] == history[0]
+    assert [m["content"].split()[1] for m in trimmed[1:]] == ["8", "9"]
+    # the newest message is kept even when it alone is over budget
+    assert len(trim_history(history[1:], budget=10)) == 1
+
+
+def test_load_history_skips_summarized_messages():
+    engine, Session = _session()
+    session = Session()
+    conversation = _conversation(session, 6, words=3)
+    conversation.summary = "User asked about refunds."
+    conversation.summary_through = T0 + timedelta(minutes=3)
+    history = load_history(session, conversation)
+    assert history[0] == {"role": "system", "content": f"{SUMMARY_PREFIX}\nUser asked about refunds."}
+    assert [m["content"].split()[1] for m in history[1:]] == ["4", "5"]
+    session.close()
+    engine.dispose()
+
+
+def test_refresh_summary_folds_oldest_turns_until_recent_ones_fit_half_the_budget():
+    engine, Session = _session()
+    session = Session()
+    _conversation(session, 12)
+    session.close()
+    resp = mock.Mock(choices=[mock.Mock(message=mock.Mock(content="Refunds take 30 days."))])
+    with mock.patch.object(conversation_memory.settings, "openai_api_key", "test"), mock.patch.object(
+        conversation_memory.settings, "history_token_budget", 800
+    ), mock.patch.object(conversation_memory, "SessionLocal", Session), mock.patch.object(
+        conversation_memory, "chat_completion", return_value=resp
+    ) as chat:
+        refresh_summary("c1")
+        folded_prompt = chat.call_args.kwargs["messages"][1]["content"]
+        chat.reset_mock()
+        refresh_summary("c1")  # recent turns fit now: no call
+    chat.assert_not_called()
+
+    session = Session()
+    conversation = session.get(Conversation, "c1")
+    assert conversation.summary == "Refunds take 30 days."
+    kept = load_history(session, conversation)[1:]
+    assert kept and sum(conversation_memory._message_tokens(m["content"]) for m in kept) <= 400
+    assert "message 0 " in folded_prompt and f"message {11 - len(kept)} " in folded_prompt
+    session.close()
+    engine.dispose()
+
+
+def test_refresh_summary_is_skipped_without_api_key():
+    with mock.patch.object(conversation_memory.settings, "openai_api_key", ""), mock.patch.object(
+        conversation_memory, "SessionLocal"
+    ) as session_factory:
+        refresh_summary("c1")
+    session_factory.assert_not_called()
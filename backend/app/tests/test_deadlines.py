@@ -0,0 +1,90 @@
+import asyncio
+import itertools
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from app.db.models import AccuracyLevel
+from app.services import deadlines
+from app.services.deadlines import Deadline, DeadlineExceeded, call_timeout, hedged_call, hedged_call_async
+from app.services.model_routing import RERANK, chat_completion
+
+
+def _prime(key, latency_ms=10):
+    for _ in range(deadlines.HEDGE_MIN_SAMPLES):
+        deadlines.observe_latency(key, latency_ms)
+
+
+def test_call_timeout_is_capped_by_remaining_budget():
+    assert call_timeout(30.0, None) == 30.0
+    assert call_timeout(30.0, Deadline.after(5.0)) <= 5.0
+    assert call_timeout(1.0, Deadline.after(5.0)) == 1.0
+    with pytest.raises(DeadlineExceeded):
+        call_timeout(30.0, Deadline.after(0.1))
+
+
+def test_no_hedge_until_enough_latency_history():
+    attempts = []
+
+    def attempt(record):
+        attempts.append(1)
+        record.append({"latency_ms": 5})
+        return "ok"
+
+    calls = []
+    assert hedged_call("test.cold", attempt, calls) == "ok"
+    assert len(attempts) == 1
+    assert calls == [{"latency_ms": 5}]
+
+
+def test_slow_call_is_hedged_after_p95_and_fast_duplicate_wins():
+    _prime("test.sync")
+    counter = itertools.count()
+    release = threading.Event()
+
+    def attempt(record):
+        n = next(counter)
+        if n == 0:
+            release.wait(timeout=5)  # the primary hangs until the test lets it go
+        record.append({"attempt": n, "latency_ms": 1})
+        return n
+
+    before = deadlines.hedge_stats()
+    calls = []
+    try:
+        assert hedged_call("test.sync", attempt, calls, Deadline.after(10)) == 1
+    finally:
+        release.set()
+    assert calls == [{"attempt": 1, "latency_ms": 1, "hedged": True}]
+    stats = deadlines.hedge_stats()
+    assert stats["hedged"] == before["hedged"] + 1
+    assert stats["hedge_won"] == before["hedge_won"] + 1
+
+
+def test_async_hedge_cancels_the_losing_attempt():
+    _prime("test.async")
+    counter = itertools.count()
+    cancelled = []
+
+    async def attempt(record):
+        n = next(counter)
+        try:
+            await asyncio.sleep(5 if n == 0 else 0)
+        except asyncio.CancelledError:
+            cancelled.append(n)
+            raise
+        return n
+
+    start = time.monotonic()
+    assert asyncio.run(hedged_call_async("test.async", attempt)) == 1
+    assert time.monotonic() - start < 2
+    assert cancelled == [0]
+
+
+def test_chat_completion_timeout_follows_the_deadline():
+    create = mock.Mock(return_value=mock.Mock(usage=None))
+    client = mock.Mock(chat=mock.Mock(completions=mock.Mock(create=create)))
+    chat_completion(client, RERANK, AccuracyLevel.HIGH, messages=[], deadline=Deadline.after(3.0), hedge=True)
+    assert create.call_args.kwargs["timeout"] <= 3.0
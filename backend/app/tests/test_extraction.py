@@ -0,0 +1,123 @@
+import io
+import time
+from unittest import mock
+
+import pytest
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from app.services import extraction
+from app.services.extraction import ExtractionLimitExceeded, extract_text
+from app.utils.text_extract import extract_text_from_bytes
+
+
+def _pdf(pages):
+    writer = PdfWriter()
+    font = DictionaryObject(
+        {
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+        }
+    )
+    for i in range(pages):
+        page = writer.add_blank_page(612, 792)
+        page[NameObject("/Resources")] = DictionaryObject({NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})})
+        stream = DecodedStreamObject()
+        stream.set_data(f"BT /F1 12 Tf 72 712 Td (Page {i}) Tj ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(stream)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def pool():
+    with mock.patch.object(extraction.settings, "extract_workers", 2):
+        yield
+    if extraction._pool is not None:
+        extraction._discard_pool(extraction._pool)
+
+
+def test_pdf_page_ranges_are_extracted_in_parallel_and_reassembled_in_order(pool):
+    data = _pdf(7)
+    with mock.patch.object(extraction, "PDF_PAGES_PER_TASK", 2):
+        text = extract_text(data, "report.PDF")
+    assert text == extract_text_from_bytes(data, "report.pdf")
+    assert text.split("\n\n") == [f"Page {i}" for i in range(7)]
+
+
+def test_plain_text_is_decoded_in_process():
+    with mock.patch.object(extraction.settings, "extract_workers", 2), mock.patch.object(extraction, "_get_pool") as get_pool:
+        assert extract_text(b"hello  world", "notes.md") == "hello world"
+    get_pool.assert_not_called()
+
+
+def test_page_ranges_cover_every_page_once():
+    assert extraction._page_ranges(0) == []
+    assert extraction._page_ranges(5, per_task=2) == [(0, 2), (2, 4), (4, 5)]
+
+
+def test_run_limited_interrupts_a_slow_parser():
+    started = time.monotonic()
+    with pytest.raises(ExtractionLimitExceeded):
+        extraction._run_limited(0.05, time.sleep, 5)
+    assert time.monotonic() - started < 1
+
+
+def test_run_limited_reports_memory_errors_as_limit_exceeded():
+    def boom():
+        raise MemoryError
+
+    with pytest.raises(ExtractionLimitExceeded):
+        extraction._run_limited(5, boom)
+
+
+def test_iter_text_keeps_a_bounded_number_of_page_ranges_in_flight(pool):
+    data = _pdf(9)
+    executor = extraction._get_pool()
+    with mock.patch.object(extraction, "PDF_PAGES_PER_TASK", 1), mock.patch.object(
+        extraction, "PDF_RANGES_IN_FLIGHT", 1
+    ), mock.patch.object(executor, "submit", wraps=executor.submit) as submit:
+        pages = extraction.iter_text(data, "report.pdf")
+        assert next(pages) == "Page 0"
+        # page count + 2 workers * 1 range ahead + the one refilled after the first result
+        assert submit.call_count == 4
+        assert list(pages) == [f"Page {i}" for i in range(1, 9)]
+
+
+def test_ingest_embeds_batches_while_streaming_chunks():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    import numpy as np
+
+    from app.db.models import Base, Chunk, Document, DocumentVersion
+    from app.services import ingest
+
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, expire_on_commit=False)()
+    doc = Document(area_id=1, title="T", filename="t.txt", original_name="t.txt", mime_type="text/plain", created_by=1)
+    db.add(doc)
+    db.commit()
+    version = DocumentVersion(document_id=doc.id, version=1, file_path="t.txt", original_name="t.txt")
+    db.add(version)
+    db.commit()
+
+    text = "\n\n".join(f"Paragraph {i} " + "word " * 600 for i in range(5)).encode()
+    embedded = []
+
+    def embed(db, texts):
+        embedded.append(len(texts))
+        return np.ones((len(texts), 4), dtype="float32"), None
+
+    with mock.patch.object(ingest, "INGEST_EMBED_BATCH", 2), mock.patch.object(ingest, "embed_texts", side_effect=embed):
+        result = ingest.ingest_document(db, doc, version, text)
+
+    rows = db.query(Chunk).order_by(Chunk.chunk_index).all()
+    assert result["chunks"] == 5 and embedded == [2, 2, 1]
+    assert [r.chunk_index for r in rows] == [0, 1, 2, 3, 4]
+    assert "Paragraph 3" in rows[3].content
+    db.close()
+    engine.dispose()
@@ -0,0 +1,182 @@
+from unittest import mock
+
+import numpy as np
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Area, Base, Chunk, Document, Role, User
+import app.services.rag as rag
+
+
+class FakeStore:
+    """FAISS stand-in: vector search only ever finds vector_id 0."""
+
+    def search(self, query_vec, top_k=6):
+        return [(0, 0.8)]
+
+    def reconstruct_ids(self, vector_ids):
+        # dot with the unit query below is 0.1
+        return {vid: np.array([0.2, 0.0, 0.0, 0.0], dtype="float32") for vid in vector_ids}
+
+
+class TravelStore(FakeStore):
+    def search(self, query_vec, top_k=6):
+        return [(2, 0.8)]
+
+
+def _setup_db():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    TestingSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.create_all(engine)
+    session = TestingSession()
+
+    session.add(User(id=1, email="owner@test.local", full_name="Owner", password_hash="hash", role=Role.ADMIN.value))
+    session.add(Area(id=1, key="sales", name="Sales", color="#16a34a"))
+    session.add(Document(id=1, area_id=1, title="Pricing", filename="p.md", original_name="p.md", created_by=1))
+    session.add_all(
+        [
+            Chunk(id=1, document_id=1, area_id=1, chunk_index=0, content="Our packages are priced per seat.", vector_id=0),
+            Chunk(id=2, document_id=1, area_id=1, chunk_index=1, content="Bundle SKU-4411 includes onboarding.", vector_id=1),
+            Chunk(id=3, document_id=1, area_id=1, chunk_index=2, content="Unrelated travel policy.", vector_id=2),
+        ]
+    )
+    session.commit()
+    return engine, session
+
+
+def _count_queries(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, stmt, *args: statements.append(stmt))
+    return statements
+
+
+def test_lexical_stage_recovers_exact_terms_missed_by_vectors():
+    engine, session = _setup_db()
+    try:
+        with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+            rag, "embed_query", return_value=(np.ones((1, 4), dtype="float32"), FakeStore())
+        ):
+            timings = {}
+            ranked = rag.retrieve_candidates(session, "price of sku-4411", [1], timings=timings)
+
+        by_id = {c["chunk_id"]: c for c in ranked}
+        assert set(by_id) == {1, 2}
+        assert by_id[2]["keyword_score"] > 0
+        assert abs(by_id[2]["vector_score"] - (0.1 + 1.0) / 2.0) < 1e-6
+        assert by_id[2]["vector"] is not None
+        assert by_id[1]["vector_score"] == (0.8 + 1.0) / 2.0
+        assert {"vector_ms", "vector_queue_ms", "lexical_ms", "hydrate_ms"} <= set(timings)
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def test_keyword_only_when_embeddings_unavailable():
+    engine, session = _setup_db()
+    try:
+        with mock.patch.object(rag.settings, "openai_api_key", ""):
+            ranked = rag.retrieve_candidates(session, "travel policy", [1])
+        assert [c["chunk_id"] for c in ranked] == [3]
+        assert ranked[0]["hybrid_score"] == ranked[0]["keyword_score"] == 1.0
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def test_hydration_query_count_is_constant_and_skips_embeddings():
+    engine, session = _setup_db()
+    session.add_all(
+        [
+            Chunk(id=10 + i, document_id=1, area_id=1, chunk_index=10 + i, content=f"Seat price tier {i}.", vector_id=10 + i)
+            for i in range(15)
+        ]
+    )
+    session.commit()
+    session.expunge_all()
+    rag._area_cache = {"ts": 0.0, "areas": {}}
+    statements = _count_queries(engine)
+    try:
+        with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+            rag, "embed_query", return_value=(np.ones((1, 4), dtype="float32"), TravelStore())
+        ):
+            ranked = rag.retrieve_candidates(session, "seat price", [1])
+
+        assert len(ranked) == 17
+        assert all(c["area_name"] == "Sales" and c["document_title"] == "Pricing" for c in ranked)
+        # lexical stage + vector-only hydration + area map, independent of candidate count
+        assert len(statements) == 3
+        assert not any("embedding" in stmt for stmt in statements)
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def test_mmr_skips_near_duplicates_and_caps_per_document():
+    def cand(cid, doc_id, score, vec):
+        return {"chunk_id": cid, "document_id": doc_id, "chunk_text": f"text {cid}", "score": score, "vector": np.array(vec, dtype="float32")}
+
+    candidates = [
+        cand(1, 1, 0.90, [1.0, 0.0]),
+        cand(2, 1, 0.89, [0.99, 0.05]),  # near-duplicate of 1
+        cand(3, 2, 0.70, [0.0, 1.0]),
+    ]
+    picked = rag._mmr_select(candidates, 2, lambda_=0.7)
+    assert [c["chunk_id"] for c in picked] == [1, 3]
+
+    same_doc = [cand(i, 1, 1.0 - i / 10, [1.0, i]) for i in range(5)]
+    assert len(rag._mmr_select(same_doc, 5, lambda_=0.7)) == rag.MAX_CHUNKS_PER_DOCUMENT
+
+
+def test_local_reranker_prefers_bm25_and_proximity():
+    from app.services.reranking import LocalReranker
+
+    candidates = [
+        {"chunk_id": 1, "chunk_text": "Refunds are rare. Our policy covers shipping.", "vector_score": 0.7},
+        {"chunk_id": 2, "chunk_text": "Refund policy: customers get refunds within 30 days.", "vector_score": 0.7},
+        {"chunk_id": 3, "chunk_text": "Office travel guidelines.", "vector_score": 0.55},
+    ]
+    scores = LocalReranker().score("refund policy", candidates, target_n=2)
+    assert scores[2] > scores[1] > scores[3]
+    assert all(0.0 <= s <= 1.0 for s in scores.values())
+
+
+def test_lexical_stage_ranks_before_limit_and_ignores_stopwords():
+    engine, session = _setup_db()
+    session.add_all(
+        [
+            Chunk(id=100 + i, document_id=1, area_id=1, chunk_index=100 + i, content=f"What is the plan for team {i}?")
+            for i in range(rag.LEXICAL_SCAN_LIMIT + 100)
+        ]
+    )
+    session.commit()
+    try:
+        assert rag._query_terms("what is the price for sku-4411?") == ["price", "sku-4411"]
+        with mock.patch.object(rag.settings, "openai_api_key", ""):
+            ranked = rag.retrieve_candidates(session, "what is the price for sku-4411", [1])
+        # the two term matches rank ahead of the stopword-only rows before the LIMIT
+        assert {c["chunk_id"] for c in ranked[:2]} == {1, 2}
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def test_rescore_uses_previous_question_terms_and_stored_vectors():
+    engine, session = _setup_db()
+    try:
+        with mock.patch.object(rag, "build_vector_store_if_needed", return_value=FakeStore()):
+            ranked = rag.rescore_candidates(
+                session,
+                "shorter please",
+                [1, 2, 99],
+                [1],
+                qvec=np.array([[1.0, 0.0, 0.0, 0.0]], dtype="float32"),
+                previous_query="price of sku-4411",
+            )
+        by_id = {c["chunk_id"]: c for c in ranked}
+        assert set(by_id) == {1, 2}  # unknown ids are dropped
+        assert by_id[2]["keyword_score"] > 0  # "sku-4411" comes from the previous question
+        assert abs(by_id[2]["vector_score"] - (0.2 + 1.0) / 2.0) < 1e-6
+        assert by_id[2]["vector"] is not None
+    finally:
+        session.close()
+        engine.dispose()
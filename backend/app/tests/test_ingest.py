@@ -0,0 +1,127 @@
+from unittest import mock
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Base, Chunk, Document, DocumentVersion
+from app.services import ingest
+
+
+def _paragraphs(changed=None):
+    return "\n\n".join(
+        (f"Section {i} was rewritten. " if i == changed else f"Section {i}. ") + "word " * 600 for i in range(6)
+    ).encode()
+
+
+def _version(db, doc, number):
+    version = DocumentVersion(document_id=doc.id, version=number, file_path=f"h{number}.txt", original_name="h.txt")
+    db.add(version)
+    db.commit()
+    doc.latest_version, doc.latest_version_id = number, version.id
+    db.commit()
+    return version
+
+
+def test_new_version_reuses_unchanged_chunks_and_embeds_only_changed_ones():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, expire_on_commit=False)()
+    doc = Document(area_id=1, title="Handbook", filename="h.txt", original_name="h.txt", created_by=1)
+    db.add(doc)
+    db.commit()
+    embedded = []
+
+    def embed(db, texts):
+        embedded.append(texts)
+        return np.ones((len(texts), 4), dtype="float32"), None
+
+    with mock.patch.object(ingest, "embed_texts", side_effect=embed):
+        first = ingest.ingest_document(db, doc, _version(db, doc, 1), _paragraphs())
+        v1_ids = {c.chunk_index: c.id for c in db.query(Chunk).filter(Chunk.is_latest.is_(True))}
+        embedded.clear()
+        v2 = _version(db, doc, 2)
+        second = ingest.ingest_document(db, doc, v2, _paragraphs(changed=3))
+
+    assert first == {"chunks": 6, "reused": 0, "embedded": 6}
+    assert second == {"chunks": 6, "reused": 5, "embedded": 1}
+    assert len(embedded[0]) == 1 and "Section 3 was rewritten." in embedded[0][0]
+
+    latest = db.query(Chunk).filter(Chunk.is_latest.is_(True)).order_by(Chunk.chunk_index).all()
+    assert [c.chunk_index for c in latest] == list(range(6))
+    assert all(c.version_id == v2.id for c in latest)
+    assert not set(c.id for c in latest) & set(v1_ids.values())
+    # v1 keeps its own rows, so earlier citations still resolve to the text they quoted
+    stale = db.query(Chunk).filter(Chunk.is_latest.is_(False)).order_by(Chunk.chunk_index).all()
+    assert [c.id for c in stale] == [v1_ids[i] for i in range(6)]
+    assert all(c.version_id != v2.id for c in stale)
+    for old, new in zip(stale, latest):
+        if new.chunk_index != 3:
+            assert new.content == old.content
+            assert list(new.embedding) == list(old.embedding) and new.vector_id == old.vector_id
+    db.close()
+    engine.dispose()
+
+
+def test_file_already_indexed_for_another_document_copies_its_chunks():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, expire_on_commit=False)()
+    first_doc = Document(area_id=1, title="Handbook", filename="h.txt", original_name="h.txt", created_by=1)
+    copy_doc = Document(area_id=2, title="Handbook copy", filename="h.txt", original_name="h.txt", created_by=1)
+    db.add_all([first_doc, copy_doc])
+    db.commit()
+
+    def embed(db, texts):
+        return np.ones((len(texts), 4), dtype="float32"), None
+
+    with mock.patch.object(ingest, "embed_texts", side_effect=embed):
+        original = _version(db, first_doc, 1)
+        original.content_hash = "f" * 64
+        ingest.ingest_document(db, first_doc, original, _paragraphs())
+    duplicate = _version(db, copy_doc, 1)
+    duplicate.content_hash = "f" * 64
+    db.commit()
+
+    with mock.patch.object(ingest, "embed_texts") as embed_texts, mock.patch.object(ingest, "iter_text") as iter_text:
+        result = ingest.ingest_document(db, copy_doc, duplicate, b"")
+    embed_texts.assert_not_called()
+    iter_text.assert_not_called()
+
+    assert result == {"chunks": 6, "reused": 6, "embedded": 0}
+    source = db.query(Chunk).filter(Chunk.document_id == first_doc.id).order_by(Chunk.chunk_index).all()
+    copied = db.query(Chunk).filter(Chunk.document_id == copy_doc.id).order_by(Chunk.chunk_index).all()
+    assert [c.content for c in copied] == [c.content for c in source]
+    assert all(c.area_id == 2 and c.is_latest and c.version_id == duplicate.id for c in copied)
+    assert copied[0].embedding == source[0].embedding
+    db.close()
+    engine.dispose()
+
+
+def test_copy_payload_is_pg_binary_copy_with_pgvector_vectors():
+    import struct
+    from datetime import datetime, timezone
+
+    row = {
+        "document_id": 7,
+        "area_id": 2,
+        "version_id": 3,
+        "chunk_index": 0,
+        "content": "Intro",
+        "page": None,
+        "section": "A > B",
+        "token_count": 1,
+        "content_hash": "f" * 64,
+        "vector_id": None,
+        "embedding": np.array([0.5, -1.0], dtype="float32"),
+        "is_latest": True,
+        "created_at": datetime(2000, 1, 1, 0, 0, 1, tzinfo=timezone.utc),
+    }
+    payload = ingest._copy_payload([row])
+
+    assert payload.startswith(b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0))
+    assert payload.endswith(struct.pack("!h", -1))
+    assert struct.unpack("!h", payload[19:21]) == (len(ingest._COPY_COLUMNS),)
+    assert struct.pack("!i", 12) + struct.pack("!hh", 2, 0) + struct.pack("!ff", 0.5, -1.0) in payload
+    assert struct.pack("!i", 8) + struct.pack("!q", 1_000_000) in payload
+    assert payload.count(struct.pack("!i", -1)) >= 2  # page and vector_id are NULL
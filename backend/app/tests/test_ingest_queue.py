@@ -0,0 +1,113 @@
+from datetime import timedelta
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Base, Document, DocumentVersion, IngestionJob, IngestionStatus, utcnow
+from app.services import ingest_queue
+
+
+def _session():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine, expire_on_commit=False)()
+
+
+def _document(db):
+    doc = Document(area_id=1, title="Policy", filename="p.txt", original_name="p.txt", mime_type="text/plain", created_by=1)
+    db.add(doc)
+    db.commit()
+    version = DocumentVersion(document_id=doc.id, version=1, file_path="p.txt", original_name="p.txt")
+    db.add(version)
+    db.commit()
+    doc.latest_version_id = version.id
+    db.commit()
+    return doc, version
+
+
+def _make_due(db, job):
+    job.next_attempt_at = utcnow() - timedelta(seconds=1)
+    db.commit()
+
+
+def test_job_runs_through_the_stages_to_indexed():
+    engine, db = _session()
+    doc, version = _document(db)
+    job = ingest_queue.enqueue_ingestion(db, doc, version, None)
+    assert job.status == IngestionStatus.QUEUED.value
+    seen = []
+
+    def ingest(db, doc, version, data, on_stage=None):
+        on_stage(IngestionStatus.EXTRACTING, None)
+        on_stage(IngestionStatus.EMBEDDING, 4)
+        seen.append((data, db.get(IngestionJob, job.id).status))
+        return {"chunks": 4, "reused": 1, "embedded": 3}
+
+    with mock.patch.object(ingest_queue, "ingest_document", side_effect=ingest), mock.patch.object(
+        ingest_queue, "_read_version_bytes", return_value=b"text"
+    ):
+        claimed = ingest_queue.claim_next_job(db, "w1")
+        assert ingest_queue.claim_next_job(db, "w2") is None
+        ingest_queue.run_job(db, claimed)
+
+    db.refresh(job)
+    assert seen == [(b"text", IngestionStatus.EMBEDDING.value)]
+    assert (job.status, job.attempts, job.chunks_total, job.chunks_reused, job.locked_by) == ("INDEXED", 1, 4, 1, None)
+    assert job.finished_at is not None and doc.ingestion.id == job.id
+    db.close()
+    engine.dispose()
+
+
+def test_failed_attempts_back_off_then_fail():
+    engine, db = _session()
+    doc, version = _document(db)
+    job = ingest_queue.enqueue_ingestion(db, doc, version, None)
+    with mock.patch.object(ingest_queue.settings, "ingest_max_attempts", 2), mock.patch.object(
+        ingest_queue, "_read_version_bytes", side_effect=OSError("storage down")
+    ):
+        ingest_queue.run_job(db, ingest_queue.claim_next_job(db, "w1"))
+        db.refresh(job)
+        assert job.status == "QUEUED" and job.next_attempt_at > utcnow().replace(tzinfo=None) + timedelta(seconds=20)
+        assert ingest_queue.claim_next_job(db, "w1") is None  # not due yet
+
+        _make_due(db, job)
+        ingest_queue.run_job(db, ingest_queue.claim_next_job(db, "w1"))
+    db.refresh(job)
+    assert (job.status, job.attempts) == ("FAILED", 2)
+    assert job.error == "OSError: storage down"
+    db.close()
+    engine.dispose()
+
+
+def test_superseded_version_fails_without_retry():
+    engine, db = _session()
+    doc, version = _document(db)
+    job = ingest_queue.enqueue_ingestion(db, doc, version, None)
+    newer = DocumentVersion(document_id=doc.id, version=2, file_path="p2.txt", original_name="p.txt")
+    db.add(newer)
+    db.commit()
+    doc.latest_version, doc.latest_version_id = 2, newer.id
+    db.commit()
+    with mock.patch.object(ingest_queue, "ingest_document") as ingest:
+        ingest_queue.run_job(db, ingest_queue.claim_next_job(db, "w1"))
+    ingest.assert_not_called()
+    db.refresh(job)
+    assert (job.status, job.attempts) == ("FAILED", 1)
+    db.close()
+    engine.dispose()
+
+
+def test_stale_running_jobs_are_requeued():
+    engine, db = _session()
+    doc, version = _document(db)
+    job = ingest_queue.enqueue_ingestion(db, doc, version, None)
+    ingest_queue.claim_next_job(db, "dead-worker")
+    job.locked_at = utcnow() - timedelta(seconds=ingest_queue.INGEST_STALE_AFTER_S + 1)
+    db.commit()
+    assert ingest_queue.requeue_stale_jobs(db) == 1
+    db.refresh(job)
+    assert (job.status, job.locked_by) == ("QUEUED", None)
+    assert ingest_queue.claim_next_job(db, "w1").attempts == 2
+    db.close()
+    engine.dispose()
@@ -1,12 +1,15 @@
 import asyncio
 import io
+import tempfile
 import unittest
+from unittest import mock
 
 from fastapi import HTTPException
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from starlette.datastructures import UploadFile
 
+from app.core.config import settings
 from app.db.models import Base, LegalAuditLog, LegalDocument, Role, User
 from app.routers.legal import (
     create_legal_document,
@@ -23,6 +26,13 @@ from app.schemas.legal_examples import LegalTemplateGenerateWithExamplesIn
 
 class LegalExamplesFlowTests(unittest.TestCase):
     def setUp(self):
+        # Uploaded examples are stored under DATA_DIR; keep them out of the real data dir.
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        data_dir_patch = mock.patch.object(settings, "data_dir", data_dir.name)
+        data_dir_patch.start()
+        self.addCleanup(data_dir_patch.stop)
+
         self.engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
         TestingSession = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
         Base.metadata.create_all(self.engine)
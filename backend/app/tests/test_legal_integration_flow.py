@@ -1,8 +1,11 @@
+import tempfile
 import unittest
+from unittest import mock
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+from app.core.config import settings
 from app.db.models import Base, LegalApproval, LegalDocument, Role, User
 from app.routers.legal import create_legal_document, create_template, generate_from_template, submit_for_review
 from app.schemas.legal import (
@@ -15,6 +18,13 @@ from app.schemas.legal_examples import LegalTemplateGenerateWithExamplesIn
 
 class LegalIntegrationFlowTests(unittest.TestCase):
     def setUp(self):
+        # Uploaded examples are stored under DATA_DIR; keep them out of the real data dir.
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        data_dir_patch = mock.patch.object(settings, "data_dir", data_dir.name)
+        data_dir_patch.start()
+        self.addCleanup(data_dir_patch.stop)
+
         self.engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
         TestingSession = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
         Base.metadata.create_all(self.engine)
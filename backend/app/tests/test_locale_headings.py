@@ -1,7 +1,13 @@
 import unittest
 
 from app.db.models import AccuracyLevel, AnswerTone
-from app.services.rag import build_prompt_style
+from app.services.rag import (
+    LocalizedHeadingStream,
+    _build_messages,
+    _enforce_localized_headings,
+    build_prompt_style,
+    system_prompt,
+)
 
 
 class LocaleHeadingTests(unittest.TestCase):
@@ -10,6 +16,28 @@ class LocaleHeadingTests(unittest.TestCase):
         self.assertIn("Risposta rapida:", prompt)
         self.assertNotIn("Quick answer:", prompt)
 
+    def test_streamed_headings_match_batch_rewrite(self):
+        answer = "  Quick answer:\n- yes\nNot Sources: here\nNext steps:  call\nSources:\n- Doc (chunk 1)"
+        for size in (1, 2, 3, 7, len(answer)):
+            stream = LocalizedHeadingStream("it")
+            out = "".join(stream.feed(answer[i : i + size]) for i in range(0, len(answer), size)) + stream.flush()
+            self.assertEqual(out.strip(), _enforce_localized_headings(answer.strip(), "it").strip())
+
+    def test_system_prompt_is_a_stable_shared_prefix(self):
+        it = system_prompt(AccuracyLevel.HIGH, AnswerTone.TECHNICAL, locale="it-IT")
+        self.assertIs(it, system_prompt(AccuracyLevel.HIGH, AnswerTone.TECHNICAL, locale="it"))
+        en = system_prompt(AccuracyLevel.HIGH, AnswerTone.TECHNICAL, locale="en")
+        preamble = en.split("\n")[0]
+        self.assertTrue(it.startswith(preamble))  # shared across locales, tones and accuracy levels
+        self.assertIn("Respond in Italian.", it)
+
+        chunk = {"chunk_id": 1, "chunk_index": 0, "chunk_text": "Refunds within 30 days.", "document_id": 1, "document_title": "Doc"}
+        history = [{"role": "user", "content": "earlier question"}]
+        first, _ = _build_messages("q1", "q1", [chunk], AccuracyLevel.HIGH, AnswerTone.TECHNICAL, "it", history)
+        second, _ = _build_messages("q2", "q2", [], AccuracyLevel.HIGH, AnswerTone.TECHNICAL, "it", history)
+        self.assertEqual(first[:2], second[:2])  # system + history precede everything per-request
+        self.assertEqual(first[0]["content"], it)
+
 
 if __name__ == "__main__":
     unittest.main()
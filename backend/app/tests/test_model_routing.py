@@ -0,0 +1,53 @@
+from unittest import mock
+
+from app.db.models import AccuracyLevel
+from app.services import model_routing
+from app.services.model_routing import DRAFT, GENERATE, RERANK, chat_completion, resolve_route
+
+
+def _patched_settings(**overrides):
+    values = {"openai_chat_model": "big-model", "openai_fast_chat_model": "small-model", "chat_model_routes": ""}
+    values.update(overrides)
+    return mock.patch.multiple(model_routing.settings, **values)
+
+
+def test_low_accuracy_routes_to_fast_model():
+    with _patched_settings():
+        assert resolve_route(GENERATE, AccuracyLevel.LOW).model == "small-model"
+        assert resolve_route(GENERATE, AccuracyLevel.HIGH).model == "big-model"
+        assert resolve_route(RERANK, AccuracyLevel.MEDIUM).model == "small-model"
+        assert resolve_route(DRAFT).max_tokens == 700
+
+
+def test_model_routes_override_single_fields():
+    overrides = '{"generate.HIGH": {"model": "huge-model", "timeout_s": 90}}'
+    with _patched_settings(chat_model_routes=overrides):
+        route = resolve_route(GENERATE, AccuracyLevel.HIGH)
+    assert route.model == "huge-model"
+    assert route.timeout_s == 90
+    assert route.max_tokens == 1200
+
+
+def test_chat_completion_records_route_usage():
+    create = mock.Mock(return_value=mock.Mock(usage=mock.Mock(prompt_tokens=120, completion_tokens=30)))
+    client = mock.Mock(chat=mock.Mock(completions=mock.Mock(create=create)))
+    calls = []
+    with _patched_settings():
+        chat_completion(client, GENERATE, AccuracyLevel.LOW, messages=[], calls=calls, temperature=0.3)
+
+    kwargs = create.call_args.kwargs
+    assert kwargs["model"] == "small-model"
+    assert kwargs["max_tokens"] == 600 and kwargs["timeout"] == 30.0
+    assert calls[0]["route"] == "generate.LOW"
+    assert (calls[0]["tokens_in"], calls[0]["tokens_out"], calls[0]["ok"]) == (120, 30, True)
+    assert calls[0]["tokens_cached"] is None  # no prompt_tokens_details reported
+
+
+def test_chat_completion_records_cached_prompt_tokens():
+    usage = mock.Mock(prompt_tokens=1500, completion_tokens=40, prompt_tokens_details=mock.Mock(cached_tokens=1280))
+    create = mock.Mock(return_value=mock.Mock(usage=usage))
+    client = mock.Mock(chat=mock.Mock(completions=mock.Mock(create=create)))
+    calls = []
+    with _patched_settings():
+        chat_completion(client, GENERATE, AccuracyLevel.HIGH, messages=[], calls=calls)
+    assert calls[0]["tokens_cached"] == 1280
@@ -1,3 +1,6 @@
+import asyncio
+import threading
+import time
 from unittest import mock
 
 from fastapi.testclient import TestClient
@@ -10,6 +13,8 @@ from app.db.models import (
     AccessGrantSource,
     Area,
     Base,
+    ConversationMessage,
+    ConversationRole,
     Role,
     User,
     UserAreaAccess,
@@ -114,7 +119,7 @@ def test_sources_are_scoped_to_allowed_area():
 
     try:
         with mock.patch("app.routers.copilot.get_allowed_area_ids", return_value=[5]), mock.patch.object(
-            copilot, "answer_with_rag", side_effect=stub_answer
+            copilot, "answer_with_rag_async", new=mock.AsyncMock(side_effect=stub_answer)
         ):
             resp = client.post("/copilot/ask", json={"question": "hello", "area_id": 5})
             assert resp.status_code == 200
@@ -141,3 +146,317 @@ def test_high_accuracy_refuses_with_no_evidence():
         )
         assert "Not enough info" in result["answer"]
         assert result.get("meta", {}).get("evidence_level") == "low"
+
+
+def _candidate(chunk_id, hybrid):
+    return {
+        "chunk_id": chunk_id,
+        "chunk_index": 0,
+        "chunk_text": f"Snippet {chunk_id}",
+        "heading_path": "",
+        "document_id": chunk_id,
+        "document_title": f"Doc {chunk_id}",
+        "version_id": 1,
+        "area_id": 1,
+        "vector_score": hybrid,
+        "keyword_score": 0.0,
+        "hybrid_score": hybrid,
+    }
+
+
+class _FakeChat:
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+
+    def create(self, **kwargs):
+        self.calls += 1
+        self.started.set()
+        message = mock.Mock(content="Quick answer: ok\n\nSources:\n- Doc 1 (chunk 0)")
+        return mock.Mock(choices=[mock.Mock(message=message)], usage=None)
+
+
+def _fake_client():
+    chat = _FakeChat()
+    return mock.Mock(chat=mock.Mock(completions=chat)), chat
+
+
+def test_decisive_margin_skips_rerank():
+    client, chat = _fake_client()
+    rag._retrieval_cache.clear()
+    with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+        rag, "_client", return_value=client
+    ), mock.patch.object(rag, "retrieve_candidates", return_value=[_candidate(1, 0.9), _candidate(2, 0.5)]), mock.patch.object(
+        rag, "get_reranker"
+    ) as rerank:
+        result = rag.answer_with_rag(db=None, query="decisive question", area_ids=[1])
+    rerank.assert_not_called()
+    assert chat.calls == 1
+    assert result["meta"]["pipeline"]["path"] == "decisive"
+
+
+def test_far_below_threshold_short_circuits_to_ungrounded():
+    client, chat = _fake_client()
+    rag._retrieval_cache.clear()
+    with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+        rag, "_client", return_value=client
+    ), mock.patch.object(rag, "retrieve_candidates", return_value=[_candidate(1, 0.3), _candidate(2, 0.29)]), mock.patch.object(
+        rag, "get_reranker"
+    ) as rerank:
+        result = rag.answer_with_rag(db=None, query="unknown topic", area_ids=[1])
+    rerank.assert_not_called()
+    assert chat.calls == 0
+    assert result["meta"]["pipeline"]["path"] == "ungrounded"
+    assert "couldn’t find enough" in result["answer"]
+
+
+def test_medium_accuracy_uses_local_reranker_without_llm_call():
+    client, chat = _fake_client()
+    rag._retrieval_cache.clear()
+    candidates = [_candidate(1, 0.62), _candidate(2, 0.6)]
+    candidates[1]["chunk_text"] = "Refund policy: refunds within 30 days."
+    with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+        rag, "_client", return_value=client
+    ), mock.patch.object(rag, "retrieve_candidates", return_value=candidates):
+        result = rag.answer_with_rag(db=None, query="refund policy", area_ids=[1], accuracy_level=AccuracyLevel.MEDIUM)
+    assert chat.calls == 1  # generation only
+    assert result["meta"]["pipeline"]["path"] == "rerank"
+    assert result["meta"]["pipeline"]["reranker"] == "local"
+    assert result["sources"][0]["chunk_id"] == 2
+
+
+class _FixedReranker:
+    name = "llm"
+
+    def __init__(self, scores, wait_for=None):
+        self.scores = scores
+        self.wait_for = wait_for
+
+    def score(self, query, candidates, target_n):
+        if self.wait_for is not None:
+            self.wait_for.wait(timeout=5)  # let the speculative call start so it cannot be cancelled
+        return self.scores
+
+
+def _speculative_answer(rerank_scores, top_k, wait_for_speculation=False):
+    client, chat = _fake_client()
+    reranker = _FixedReranker(rerank_scores, chat.started if wait_for_speculation else None)
+    rag._retrieval_cache.clear()
+    candidates = [_candidate(1, 0.62), _candidate(2, 0.6), _candidate(3, 0.58)]
+    with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+        rag.settings, "speculative_generation", True
+    ), mock.patch.object(rag, "_client", return_value=client), mock.patch.object(
+        rag, "retrieve_candidates", return_value=candidates
+    ), mock.patch.object(rag, "get_reranker", return_value=reranker):
+        result = rag.answer_with_rag(
+            db=None, query="speculative question", area_ids=[1], top_k=top_k, accuracy_level=AccuracyLevel.HIGH
+        )
+    return result, chat
+
+
+def test_speculative_answer_kept_when_rerank_confirms_context():
+    result, chat = _speculative_answer({1: 0.5, 2: 0.9, 3: 0.1}, top_k=2)
+    assert chat.calls == 1
+    assert result["meta"]["pipeline"]["speculation"]["confirmed"] is True
+    # speculative (hybrid) order is kept so citations match the prompt that was sent
+    assert [s["chunk_id"] for s in result["sources"]] == [1, 2]
+    assert result["best_score"] == 0.9
+
+
+def test_speculative_answer_regenerated_when_rerank_changes_context():
+    result, chat = _speculative_answer({1: 0.1, 2: 0.5, 3: 0.9}, top_k=2)
+    assert chat.calls == 2
+    assert result["meta"]["pipeline"]["speculation"] == {"confirmed": False, "saved_ms": 0}
+    assert [s["chunk_id"] for s in result["sources"]] == [3, 2]
+    assert rag.speculation_stats()["attempted"] >= 1
+
+
+class _FakeStreamChat:
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.kwargs = None
+
+    def create(self, **kwargs):
+        self.kwargs = kwargs
+        chunks = [mock.Mock(usage=None, choices=[mock.Mock(delta=mock.Mock(content=d))]) for d in self.deltas]
+        chunks.append(mock.Mock(usage=mock.Mock(prompt_tokens=50, completion_tokens=7, total_tokens=57), choices=[]))
+        return iter(chunks)
+
+
+def test_stream_emits_sources_before_tokens_and_localizes_headings():
+    chat = _FakeStreamChat(["Quick ", "answer:\n- sì\nSour", "ces:\n- Doc 1 (chunk 0)"])
+    client = mock.Mock(chat=mock.Mock(completions=chat))
+    rag._retrieval_cache.clear()
+    with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+        rag, "_client", return_value=client
+    ), mock.patch.object(rag, "retrieve_candidates", return_value=[_candidate(1, 0.9), _candidate(2, 0.5)]):
+        events = list(rag.stream_answer_with_rag(db=None, query="stream question", area_ids=[1], locale="it"))
+
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "sources" and kinds[-1] == "done"
+    assert set(kinds[1:-1]) == {"token"}
+    streamed = "".join(payload["text"] for kind, payload in events if kind == "token")
+    result = events[-1][1]
+    assert streamed.strip() == result["answer"] == "Risposta rapida: - sì\nFonti: - Doc 1 (chunk 0)"
+    assert result["usage"]["completion_tokens"] == 7
+    assert chat.kwargs["stream"] is True
+    assert result["meta"]["model_calls"][0]["ttft_ms"] is not None
+
+
+def test_stream_failing_before_any_text_stores_no_empty_reply(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stream.db'}", connect_args={"check_same_thread": False})
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.create_all(engine)
+    with Session() as setup:
+        setup.add(User(id=999, email="dummy@test.local", full_name="Dummy", password_hash="hash", role=Role.USER.value))
+        setup.add(Area(id=5, key="area5", name="Area 5"))
+        setup.commit()
+
+    def failing_stream(*args, **kwargs):
+        raise RuntimeError("provider down")
+        yield  # pragma: no cover
+
+    request_db = Session()
+    app.dependency_overrides[copilot.current_user] = lambda: DummyUser()
+    app.dependency_overrides[copilot.get_db] = _db_override(request_db)
+    try:
+        with mock.patch("app.routers.copilot.get_allowed_area_ids", return_value=[5]), mock.patch.object(
+            copilot, "stream_answer_with_rag", failing_stream
+        ), mock.patch.object(copilot, "SessionLocal", Session), mock.patch.object(copilot, "schedule_summary_refresh"):
+            resp = TestClient(app).post("/copilot/ask/stream", json={"query": "hello", "area_id": 5})
+        assert resp.status_code == 200
+        assert "event: error" in resp.text and "event: done" not in resp.text
+        with Session() as check:
+            messages = check.query(ConversationMessage).all()
+            assert [m.role for m in messages] == [ConversationRole.USER.value]
+            assert messages[0].meta["answer_error"]["reason"] == "generation_failed"
+    finally:
+        request_db.close()
+        engine.dispose()
+        _reset_overrides()
+
+
+def test_rerank_gates_sit_above_the_unrelated_hybrid_floor():
+    unrelated = rag.VECTOR_WEIGHT * 0.5  # cosine 0, no keyword match
+    for level, gate in rag.RERANK_GATES.items():
+        assert gate.ungrounded_below > unrelated, level
+        assert rag._rerank_gate([_candidate(1, unrelated), _candidate(2, unrelated)], level)["path"] == "ungrounded"
+
+
+def test_medium_local_rerank_keeps_semantic_only_match_grounded():
+    client, chat = _fake_client()
+    rag._retrieval_cache.clear()
+    paraphrase = _candidate(1, 0.51)
+    paraphrase.update(vector_score=0.725, chunk_text="Customers may send goods back within a month for their money.")
+    other = _candidate(2, 0.45)
+    other.update(vector_score=0.6, keyword_score=0.1, chunk_text="Office travel guidelines.")
+    with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+        rag, "_client", return_value=client
+    ), mock.patch.object(rag, "retrieve_candidates", return_value=[paraphrase, other]):
+        result = rag.answer_with_rag(db=None, query="refund policy", area_ids=[1], accuracy_level=AccuracyLevel.MEDIUM)
+    assert result["meta"]["pipeline"]["reranker"] == "local"
+    assert chat.calls == 1
+    assert "couldn’t find enough" not in result["answer"]
+    assert result["best_score"] >= 0.45
+
+
+def test_speculation_leaves_cached_candidates_untouched_and_counts_discards():
+    before = rag.speculation_stats()["discarded_calls"]
+    result, chat = _speculative_answer({1: 0.1, 2: 0.5, 3: 0.9}, top_k=2, wait_for_speculation=True)
+    cached = next(iter(rag._retrieval_cache.values()))["candidates"]
+    assert all("score" not in c and "rerank_score" not in c for c in cached)
+    deadline = time.monotonic() + 5  # the discarded call is counted when it finishes
+    while rag.speculation_stats()["discarded_calls"] == before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert rag.speculation_stats()["discarded_calls"] == before + 1
+
+
+class _FakeAsyncChat:
+    def __init__(self, rerank_json):
+        self.rerank_json = rerank_json
+        self.tasks = []
+
+    async def create(self, **kwargs):
+        task = "rerank" if kwargs["messages"][0]["content"].startswith("Rank") else "generate"
+        self.tasks.append(task)
+        content = self.rerank_json if task == "rerank" else "Quick answer: ok\n\nSources:\n- Doc 1 (chunk 0)"
+        return mock.Mock(choices=[mock.Mock(message=mock.Mock(content=content))], usage=None)
+
+
+def _async_answer(rerank_json, speculative):
+    chat = _FakeAsyncChat(rerank_json)
+    embeddings = mock.Mock(create=mock.AsyncMock(return_value=mock.Mock(data=[mock.Mock(embedding=[0.1, 0.2])])))
+    client = mock.Mock(chat=mock.Mock(completions=chat), embeddings=embeddings)
+    retrieve = mock.Mock(return_value=[_candidate(1, 0.62), _candidate(2, 0.6), _candidate(3, 0.58)])
+    db = mock.Mock()
+    rag._retrieval_cache.clear()
+    with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+        rag.settings, "speculative_generation", speculative
+    ), mock.patch.object(rag, "_async_client", return_value=client), mock.patch.object(
+        rag, "retrieve_candidates", retrieve
+    ), mock.patch.dict(rag._embed_cache, clear=True), mock.patch.object(rag, "_persist_embed_cache"):
+        result = asyncio.run(
+            rag.answer_with_rag_async(
+                db=db, query="async question", area_ids=[1], top_k=2, accuracy_level=AccuracyLevel.HIGH
+            )
+        )
+    # the read transaction ends before rerank and generation are awaited
+    db.rollback.assert_called_once()
+    return result, chat, retrieve
+
+
+def test_async_answer_awaits_embedding_rerank_and_generation():
+    result, chat, retrieve = _async_answer('[{"id": 2, "score": 0.9}, {"id": 1, "score": 0.4}, {"id": 3, "score": 0.1}]', speculative=False)
+    assert chat.tasks == ["rerank", "generate"]
+    assert retrieve.call_args.kwargs["qvec"].shape == (1, 2)  # embedded on the async client
+    assert "embed_ms" in result["meta"]["timings"]
+    assert [s["chunk_id"] for s in result["sources"]] == [2, 1]
+    assert [c["route"] for c in result["meta"]["model_calls"]] == ["rerank.HIGH", "generate.HIGH"]
+
+
+def test_async_speculation_regenerates_when_rerank_changes_context():
+    result, chat, _ = _async_answer('[{"id": 3, "score": 0.9}, {"id": 2, "score": 0.5}, {"id": 1, "score": 0.1}]', speculative=True)
+    assert result["meta"]["pipeline"]["speculation"] == {"confirmed": False, "saved_ms": 0}
+    assert [s["chunk_id"] for s in result["sources"]] == [3, 2]
+    assert chat.tasks.count("generate") >= 1
+    assert not rag._speculation_tasks
+
+
+def _followup_answer(rescored):
+    client, chat = _fake_client()
+    rag._retrieval_cache.clear()
+    qvec = rag.np.ones((1, 2), dtype="float32")
+    retrieve = mock.Mock(return_value=[_candidate(7, 0.9), _candidate(8, 0.5)])
+    with mock.patch.object(rag.settings, "openai_api_key", "test"), mock.patch.object(
+        rag, "_client", return_value=client
+    ), mock.patch.object(rag, "embed_query", return_value=(qvec, None)) as embed, mock.patch.object(
+        rag, "rescore_candidates", return_value=rescored
+    ), mock.patch.object(rag, "retrieve_candidates", retrieve), mock.patch.object(rag, "get_reranker") as llm_reranker:
+        result = rag.answer_with_rag(
+            db=None,
+            query="and for the EU?",
+            area_ids=[1],
+            accuracy_level=AccuracyLevel.HIGH,
+            followup={"query": "refund policy", "chunk_ids": [1, 2, 3, 4]},
+        )
+    return result, chat, embed, retrieve, llm_reranker
+
+
+def test_followup_reuses_previous_pool_when_it_still_covers_the_question():
+    rescored = [_candidate(1, 0.62), _candidate(2, 0.6), _candidate(3, 0.58), _candidate(4, 0.3)]
+    result, chat, embed, retrieve, llm_reranker = _followup_answer(rescored)
+    retrieve.assert_not_called()
+    llm_reranker.assert_not_called()
+    assert chat.calls == 1  # generation only
+    assert result["meta"]["pipeline"]["followup"] == "reused"
+    assert result["meta"]["pipeline"]["reranker"] == "local"
+    assert result["meta"]["followup_pool"]["chunk_ids"][:3] == [1, 2, 3]
+
+
+def test_followup_falls_back_to_retrieval_with_the_same_embedding():
+    rescored = [_candidate(1, 0.45), _candidate(2, 0.4)]
+    result, _, embed, retrieve, _ = _followup_answer(rescored)
+    embed.assert_called_once()
+    assert retrieve.call_args.kwargs["qvec"] is embed.return_value[0]
+    assert result["meta"]["pipeline"]["followup"] == "retrieved"
+    assert result["sources"][0]["chunk_id"] == 7
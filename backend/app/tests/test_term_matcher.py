@@ -0,0 +1,15 @@
+from app.utils.term_matcher import TermMatcher
+
+
+def test_score_counts_each_term_once_including_overlaps():
+    matcher = TermMatcher(["sku", "sku-4411", "4411-eu"])
+    assert matcher.score("Order SKU-4411-EU today") == 1.0
+    assert matcher.score("sku only") == 1 / 3
+    assert matcher.score("") == 0.0
+
+
+def test_highlights_are_sorted_and_merged():
+    matcher = TermMatcher(["price", "pricing", "plan"])
+    text = "Pricing plan: price per seat."
+    spans = matcher.highlights(text)
+    assert [text[s["start"]:s["end"]] for s in spans] == ["Pricing", "plan", "price"]
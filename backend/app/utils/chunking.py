@@ -1,7 +1,8 @@
 import re
-from typing import Dict, List, Tuple
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, Iterator, List, Tuple
 
-from app.utils.tokenization import estimate_tokens, split_text_into_token_chunks
+from app.utils.tokenization import token_offsets
 
 DEFAULT_MAX_CHARS = 3600  # ≈ 850-900 tokens
 DEFAULT_OVERLAP = 480     # ≈ 110-120 tokens
@@ -9,151 +10,182 @@ DEFAULT_MAX_TOKENS = 1200
 DEFAULT_OVERLAP_TOKENS = 150
 
 
-def _is_markdown(source_name: str | None, text: str) -> bool:
-    return (source_name or "").lower().endswith(".md") or re.search(r"^#{1,6}\s+\S+", text, re.MULTILINE) is not None
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)")
 
 
-def _split_markdown_blocks(text: str) -> List[Tuple[str, str]]:
+# A slice is only cut at a natural breakpoint this far past its start.
+MIN_SLICE_CHARS = 200
+_BREAKPOINTS = ("\n\n", "\n", ". ")
+
+
+def _iter_blocks(segments: Iterable[str]) -> Iterator[Tuple[str, str]]:
     """
-    Split markdown into blocks keyed by heading path (H1/H2/H3).
-    Returns list of (heading_path, block_text).
+    (heading_path, paragraph) pairs from text segments, in order. Markdown headings (H1-H6)
+    set the heading path for the paragraphs under them, across segments; blank lines and
+    segment ends close a paragraph.
     """
-    lines = text.splitlines()
-    blocks: List[Tuple[str, str]] = []
     heading_stack: List[str] = []
     current: List[str] = []
 
-    def flush():
-        if current:
-            block_text = "\n".join(current).strip()
-            if block_text:
-                heading_path = " > ".join(heading_stack)
-                blocks.append((heading_path, block_text))
-            current.clear()
-
-    for line in lines:
-        m = re.match(r"^(#{1,6})\s+(.*)", line.strip())
-        if m:
-            flush()
-            level = len(m.group(1))
-            title = m.group(2).strip()
-            heading_stack = heading_stack[: level - 1] + [title]
-            continue
-        current.append(line)
-    flush()
-    return [(h, b) for h, b in blocks if b.strip()]
-
-
-def _split_paragraphs(text: str) -> List[Tuple[str, str]]:
-    return [("", p.strip()) for p in re.split(r"\n\s*\n", text) if p.strip()]
-
-
-def _slice_long(text: str, max_chars: int, overlap: int) -> List[str]:
+    def flush() -> Iterator[Tuple[str, str]]:
+        paragraph = "\n".join(current).strip()
+        current.clear()
+        if paragraph:
+            yield " > ".join(heading_stack), paragraph
+
+    for segment in segments:
+        for line in (segment or "").replace("\r\n", "\n").split("\n"):
+            stripped = line.strip()
+            m = _HEADING_RE.match(stripped) if stripped.startswith("#") else None
+            if m:
+                yield from flush()
+                level = len(m.group(1))
+                heading_stack = heading_stack[: level - 1] + [m.group(2).strip()]
+            elif stripped:
+                current.append(line)
+            else:
+                yield from flush()
+        yield from flush()
+
+
+def _slice_long(
+    text: str, offsets: List[int], max_chars: int, max_tokens: int, overlap_tokens: int
+) -> Iterator[Tuple[str, int]]:
     """
-    Slice a single long paragraph into smaller overlapping windows using natural breakpoints.
+    (piece, token_count) windows of one long paragraph, each within max_chars and max_tokens.
+    Windows end at the last natural breakpoint before the limit and the next one starts
+    overlap_tokens earlier, both on token boundaries taken from offsets.
     """
-    pieces: List[str] = []
-    start = 0
     n = len(text)
-    while start < n:
-        end = min(start + max_chars, n)
+    total = len(offsets)
+    start_tok = 0
+    while start_tok < total:
+        start = offsets[start_tok]
+        end_tok = start_tok + max_tokens
+        end = min(offsets[end_tok] if end_tok < total else n, start + max_chars)
         cut = end
-        for sep in ["\n\n", "\n", ". "]:
-            idx = text.rfind(sep, start, end)
-            if idx != -1 and idx > start + 200:
-                cut = idx + len(sep)
-                break
-        chunk = text[start:cut].strip()
-        if chunk:
-            pieces.append(chunk)
+        if end < n:
+            for sep in _BREAKPOINTS:
+                idx = text.rfind(sep, start, end)
+                if idx > start + MIN_SLICE_CHARS:
+                    cut = idx + len(sep)
+                    break
+        piece = text[start:cut].strip()
+        if piece:
+            yield piece, bisect_left(offsets, cut) - start_tok
         if cut >= n:
-            break
-        start = max(cut - overlap, cut)
-    return pieces
+            return
+        # the token containing cut, stepped back by the overlap
+        start_tok = max(bisect_right(offsets, cut) - 1 - overlap_tokens, start_tok + 1)
 
 
-def chunk_text(
-    text: str,
-    source_name: str | None = None,
+def iter_chunks(
+    segments: Iterable[str],
     max_chars: int = DEFAULT_MAX_CHARS,
     overlap: int = DEFAULT_OVERLAP,
     max_tokens: int | None = DEFAULT_MAX_TOKENS,
     overlap_tokens: int | None = DEFAULT_OVERLAP_TOKENS,
     token_model: str | None = None,
-) -> List[Dict[str, str]]:
+) -> Iterator[Dict[str, object]]:
     """
-    Headings-aware chunker:
-    - Markdown: group by H1/H2/H3 blocks
-    - Plain text: paragraph-based
-    - Target ~600–900 tokens with ~100 token overlap
-    Returns list of dicts: {text, heading_path}
+    Headings-aware, token-aware chunker over a stream of text segments (pages, slides, ...):
+    - Markdown headings (H1/H2/H3...) become the chunk's heading_path
+    - Paragraphs are packed while the chunk stays within max_chars and max_tokens; the next
+      chunk starts with up to `overlap` characters of the previous one
+    - Paragraphs over either limit are sliced at natural breakpoints (see _slice_long)
+    Each paragraph is tokenized once; chunk sizes are summed from those counts.
+    Yields dicts {text, heading_path, token_count} as soon as each chunk is complete.
     """
-    normalized = (text or "").replace("\r\n", "\n").strip()
-    if not normalized:
-        return []
+    token_limit = max_tokens if max_tokens and max_tokens > 0 else None
+    overlap_tokens = overlap_tokens or 0
 
-    blocks = _split_markdown_blocks(normalized) if _is_markdown(source_name, normalized) else _split_paragraphs(normalized)
-
-    chunks: List[Dict[str, str]] = []
-    buffer = ""
+    parts: List[str] = []
+    parts_chars = 0
+    # Each "\n\n" separator between parts counts as one token.
+    parts_tokens = 0
     buffer_heading = ""
     last_heading = ""
-
-    def flush():
-        nonlocal buffer, buffer_heading
-        if buffer.strip():
-            chunks.append({"text": buffer.strip(), "heading_path": buffer_heading.strip()})
-        buffer = ""
-        buffer_heading = last_heading
-
-    for heading_path, block_text in blocks:
+    # Token offsets of parts[-1], for counting the overlap tail's tokens.
+    last_offsets: List[int] = []
+
+    def fits(chars: int, tokens: int) -> bool:
+        return chars <= max_chars and (token_limit is None or tokens <= token_limit)
+
+    def emit() -> Dict[str, object]:
+        return {"text": "\n\n".join(parts), "heading_path": buffer_heading.strip(), "token_count": parts_tokens}
+
+    def tail() -> Tuple[str, int]:
+        if overlap <= 0 or not parts:
+            return "", 0
+        last = parts[-1]
+        # Start at a word boundary so the tail does not depend on the rest of the paragraph.
+        start = len(last) - overlap
+        if start > 0:
+            space = last.find(" ", start)
+            start = space if space != -1 else len(last)
+        text = last[max(start, 0):].strip()
+        return text, len(last_offsets) - bisect_left(last_offsets, max(start, 0)) if text else 0
+
+    for heading_path, paragraph in _iter_blocks(segments):
         if heading_path:
             last_heading = heading_path
         heading_for_block = heading_path or last_heading
-        paragraph = block_text.strip()
-        if not paragraph:
-            continue
-
-        if len(paragraph) > max_chars:
-            # split the long block and flush any buffered content first
-            flush()
-            for piece in _slice_long(paragraph, max_chars, overlap):
-                chunks.append({"text": piece, "heading_path": heading_for_block})
+        offsets = token_offsets(paragraph, model=token_model)
+
+        if not fits(len(paragraph), len(offsets)):
+            # slice the long block and flush any buffered content first
+            if parts:
+                yield emit()
+                parts, parts_chars, parts_tokens = [], 0, 0
+            for piece, tokens in _slice_long(
+                paragraph, offsets, max_chars, token_limit or len(offsets), overlap_tokens
+            ):
+                yield {"text": piece, "heading_path": heading_for_block.strip(), "token_count": tokens}
+            buffer_heading = last_heading
             continue
 
-        if not buffer:
-            buffer_heading = heading_for_block
-            buffer = paragraph
-            continue
-
-        if len(buffer) + len(paragraph) + 2 <= max_chars:
-            buffer = f"{buffer}\n\n{paragraph}"
+        if parts and fits(parts_chars + len(paragraph) + 2, parts_tokens + len(offsets) + 1):
+            parts.append(paragraph)
+            parts_chars += len(paragraph) + 2
+            parts_tokens += len(offsets) + 1
             buffer_heading = buffer_heading or heading_for_block
         else:
-            flush()
-            tail = buffer[-overlap:] if overlap > 0 else ""
-            buffer = f"{tail}\n\n{paragraph}".strip()
+            if parts:
+                tail_text, tail_tokens = tail()
+                yield emit()
+            else:
+                tail_text, tail_tokens = "", 0
+            if tail_text and fits(len(tail_text) + len(paragraph) + 2, tail_tokens + len(offsets) + 1):
+                parts, parts_chars, parts_tokens = [tail_text, paragraph], len(tail_text) + len(paragraph) + 2, tail_tokens + len(offsets) + 1
+            else:
+                parts, parts_chars, parts_tokens = [paragraph], len(paragraph), len(offsets)
             buffer_heading = heading_for_block
+        last_offsets = offsets
+
+    if parts:
+        yield emit()
 
-    flush()
-
-    # Final safeguard: ensure each chunk is reasonably sized in tokens.
-    if max_tokens and max_tokens > 0:
-        expanded: List[Dict[str, str]] = []
-        for c in chunks:
-            t = c.get("text", "")
-            est = estimate_tokens(t, model=token_model)
-            if est <= max_tokens:
-                expanded.append(c)
-                continue
-            pieces = split_text_into_token_chunks(
-                t,
-                model=token_model,
-                chunk_tokens=max_tokens,
-                overlap_tokens=overlap_tokens or 0,
-            )
-            for p in pieces:
-                expanded.append({"text": p.text, "heading_path": c.get("heading_path", "")})
-        chunks = expanded
-
-    return chunks
+
+def chunk_text(
+    text: str,
+    source_name: str | None = None,
+    max_chars: int = DEFAULT_MAX_CHARS,
+    overlap: int = DEFAULT_OVERLAP,
+    max_tokens: int | None = DEFAULT_MAX_TOKENS,
+    overlap_tokens: int | None = DEFAULT_OVERLAP_TOKENS,
+    token_model: str | None = None,
+) -> List[Dict[str, object]]:
+    """
+    iter_chunks over one string, as a list. source_name is accepted for older callers;
+    headings are recognized in any text.
+    """
+    return list(
+        iter_chunks(
+            [text or ""],
+            max_chars=max_chars,
+            overlap=overlap,
+            max_tokens=max_tokens,
+            overlap_tokens=overlap_tokens,
+            token_model=token_model,
+        )
+    )
@@ -5,6 +5,7 @@ from app.core.config import settings
 from app.services.supabase_storage import (
     SupabaseStorageError,
     build_document_object_path,
+    delete_object,
     upload_bytes,
 )
 
@@ -37,5 +38,39 @@ def save_upload_bytes(content: bytes, original_name: str, content_type: str = "a
         f.write(content)
     return safe_name
 
+def save_blob_bytes(content: bytes, sha256: str, original_name: str, content_type: str = "application/octet-stream") -> str:
+    """Like save_upload_bytes, but named by content hash; storing the same content again overwrites it."""
+    ext = ""
+    if "." in original_name:
+        ext = "." + original_name.split(".")[-1].lower()
+    stored_name = f"{sha256}{ext}"
+
+    if settings.storage_provider == "supabase":
+        try:
+            object_path = build_document_object_path(stored_name)
+            upload_bytes(object_path=object_path, data=content, content_type=content_type or "application/octet-stream")
+            return object_path
+        except SupabaseStorageError as e:
+            raise RuntimeError(str(e))
+
+    os.makedirs(uploads_dir(), exist_ok=True)
+    path = os.path.join(uploads_dir(), stored_name)
+    if not os.path.exists(path):
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+    return stored_name
+
+
+def delete_stored(stored_name: str) -> None:
+    if settings.storage_provider == "supabase":
+        delete_object(object_path=stored_name)
+        return
+    path = file_path(stored_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
 def file_path(stored_name: str) -> str:
     return os.path.join(uploads_dir(), stored_name)
@@ -0,0 +1,51 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Sequence
+
+
+class TermMatcher:
+    """
+    Multi-term matcher compiled once per query.
+
+    Scoring lowercases the text once and checks each distinct term with C-level
+    substring search (faster under CPython than a pure-Python automaton or a
+    regex alternation). Highlights use one longest-first alternation pass and
+    are meant to be computed only for the chunks returned as sources.
+    """
+
+    def __init__(self, terms: Sequence[str]):
+        self._weights = Counter(t.lower() for t in terms if t)
+        self._denom = len(terms) or 1
+        # Longest alternative first so each match reports its longest term.
+        unique = sorted(self._weights, key=len, reverse=True)
+        self._pattern = re.compile("|".join(re.escape(t) for t in unique)) if unique else None
+
+    def score(self, text: str) -> float:
+        """Weighted share of query terms present in text (0..1)."""
+        if not self._weights or not text:
+            return 0.0
+        text_lower = text.lower()
+        return sum(w for t, w in self._weights.items() if t in text_lower) / self._denom
+
+    def highlights(self, text: str) -> List[Dict[str, int]]:
+        """Sorted, merged {start, end} spans of term occurrences in text."""
+        if self._pattern is None or not text:
+            return []
+        spans: List[Dict[str, int]] = []
+        for m in self._pattern.finditer(text.lower()):
+            if spans and m.start() <= spans[-1]["end"]:
+                spans[-1]["end"] = max(spans[-1]["end"], m.end())
+            else:
+                spans.append({"start": m.start(), "end": m.end()})
+        return spans
+
+
+@lru_cache(maxsize=256)
+def _compile(terms: tuple) -> TermMatcher:
+    return TermMatcher(terms)
+
+
+def matcher_for_terms(terms: Sequence[str]) -> TermMatcher:
+    """Memoized TermMatcher, so repeated questions reuse the compiled pattern."""
+    return _compile(tuple(terms))
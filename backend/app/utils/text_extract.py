@@ -1,6 +1,6 @@
 import io
 import re
-from typing import Optional
+from typing import Iterator, List, Optional
 
 import docx
 from pypdf import PdfReader
@@ -18,31 +18,85 @@ def _clean_text(raw: str) -> str:
     return text.strip()
 
 
-def extract_text_from_bytes(data: bytes, filename: str) -> str:
-    lower = filename.lower()
+# Plain text is cleaned and yielded in pieces of about this many characters, cut at line breaks.
+TEXT_SEGMENT_CHARS = 64_000
+
+
+def is_plain_text(filename: str) -> bool:
+    return filename.lower().endswith((".txt", ".md"))
+
+
+def _plain_segments(text: str) -> Iterator[str]:
+    pos = 0
+    n = len(text)
+    while pos < n:
+        cut = n
+        if n - pos > TEXT_SEGMENT_CHARS:
+            cut = text.find("\n\n", pos + TEXT_SEGMENT_CHARS)
+            if cut == -1:
+                cut = text.find("\n", pos + TEXT_SEGMENT_CHARS)
+            if cut == -1:
+                cut = n
+        segment = _clean_text(text[pos:cut])
+        if segment:
+            yield segment
+        pos = cut
+
+
+def pdf_page_count(data: bytes) -> int:
+    return len(PdfReader(io.BytesIO(data)).pages)
+
+
+def extract_pdf_pages(data: bytes, start: int, stop: int) -> List[str]:
+    """Cleaned text of pages [start, stop), one entry per page ("" for pages without text)."""
+    reader = PdfReader(io.BytesIO(data))
+    return [_clean_text(reader.pages[i].extract_text() or "") for i in range(start, min(stop, len(reader.pages)))]
+
 
-    if lower.endswith(".txt") or lower.endswith(".md"):
-        return _clean_text(data.decode("utf-8", errors="ignore"))
+def _docx_segments(data: bytes) -> Iterator[str]:
+    # Empty paragraphs separate segments, as blank lines separate paragraphs in plain text.
+    lines: List[str] = []
+    for p in docx.Document(io.BytesIO(data)).paragraphs:
+        if p.text.strip():
+            lines.append(p.text)
+            continue
+        segment = _clean_text("\n".join(lines))
+        lines = []
+        if segment:
+            yield segment
+    segment = _clean_text("\n".join(lines))
+    if segment:
+        yield segment
+
+
+def _pptx_segments(data: bytes) -> Iterator[str]:
+    for slide in Presentation(io.BytesIO(data)).slides:
+        texts = [shape.text for shape in slide.shapes if hasattr(shape, "text") and shape.text]
+        segment = _clean_text("\n".join(texts))
+        if segment:
+            yield segment
+
+
+def iter_text_segments(data: bytes, filename: str) -> Iterator[str]:
+    """
+    Cleaned text of a file one segment at a time (a PDF page, a PPTX slide, a run of DOCX
+    paragraphs, a slice of plain text), skipping empty ones. Segments are separate paragraphs.
+    """
+    lower = filename.lower()
 
     if lower.endswith(".pdf"):
-        reader = PdfReader(io.BytesIO(data))
-        parts = []
-        for page in reader.pages:
-            parts.append(page.extract_text() or "")
-        return _clean_text("\n\n".join(parts))
-
-    if lower.endswith(".docx"):
-        d = docx.Document(io.BytesIO(data))
-        return _clean_text("\n".join([p.text for p in d.paragraphs]))
-
-    if lower.endswith(".pptx"):
-        prs = Presentation(io.BytesIO(data))
-        texts = []
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text") and shape.text:
-                    texts.append(shape.text)
-        return _clean_text("\n".join(texts))
-
-    # Fallback: treat as text
-    return _clean_text(data.decode("utf-8", errors="ignore"))
+        for page in PdfReader(io.BytesIO(data)).pages:
+            text = _clean_text(page.extract_text() or "")
+            if text:
+                yield text
+    elif lower.endswith(".docx"):
+        yield from _docx_segments(data)
+    elif lower.endswith(".pptx"):
+        yield from _pptx_segments(data)
+    else:
+        # .txt, .md and the fallback for unknown types
+        yield from _plain_segments(data.decode("utf-8", errors="ignore"))
+
+
+def extract_text_from_bytes(data: bytes, filename: str) -> str:
+    return "\n\n".join(iter_text_segments(data, filename))
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import List, Optional
 
 
+@lru_cache(maxsize=1)
 def _try_get_tiktoken():
     try:
         import tiktoken  # type: ignore
@@ -13,6 +15,8 @@ def _try_get_tiktoken():
         return None
 
 
+# Cached: a failed tiktoken import is retried by the import system on every call otherwise.
+@lru_cache(maxsize=None)
 def _get_tiktoken_encoding(model: Optional[str]):
     tiktoken = _try_get_tiktoken()
     if not tiktoken:
@@ -49,6 +53,23 @@ def estimate_tokens(text: str, model: Optional[str] = None) -> int:
     return max(1, (len(text) + 2) // 3)
 
 
+def token_offsets(text: str, model: Optional[str] = None) -> List[int]:
+    """
+    Character offset where each token of text starts; len() is the token count, consistent
+    with estimate_tokens. Tokenizes once with tiktoken, else one "token" per 3 characters.
+    """
+    if not text:
+        return []
+    enc = _get_tiktoken_encoding(model)
+    if enc:
+        try:
+            _, offsets = enc.decode_with_offsets(enc.encode(text))
+            return offsets
+        except Exception:
+            pass
+    return list(range(0, len(text), 3))
+
+
 @dataclass(frozen=True)
 class TokenChunk:
     text: str
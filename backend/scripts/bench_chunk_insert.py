@@ -0,0 +1,88 @@
+"""
+Chunk insertion benchmark: stores --chunks synthetic chunks through ingest._store_batch in
+INGEST_EMBED_BATCH batches, with embed_texts replaced by random vectors, and reports
+chunks/second for the insert alone. Uses a temporary SQLite file unless --database-url
+points at a Postgres database (with pgvector; rows are written under a throwaway document).
+
+Run:
+  python backend/scripts/bench_chunk_insert.py [--chunks 20000] [--database-url postgresql+psycopg2://...]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import EMBEDDING_DIM, Area, Base, Chunk, Document, DocumentVersion, User
+from app.services import ingest
+
+
+def run(database_url: str, total: int) -> float:
+    engine = create_engine(database_url)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, expire_on_commit=False)()
+    key = f"bench-{time.time_ns()}"
+    area = Area(key=key, name=key)
+    user = User(email=f"{key}@bench.local", full_name=key, password_hash="-")
+    db.add_all([area, user])
+    db.commit()
+    doc = Document(area_id=area.id, title="bench", filename="bench.txt", original_name="bench.txt", created_by=user.id)
+    db.add(doc)
+    db.commit()
+    version = DocumentVersion(document_id=doc.id, version=1, file_path="bench.txt", original_name="bench.txt")
+    db.add(version)
+    db.commit()
+
+    rng = np.random.default_rng(0)
+
+    def embed(db, texts):
+        return rng.random((len(texts), EMBEDDING_DIM), dtype=np.float32), None
+
+    chunks = (
+        {"text": f"Paragraph {i}. " + "lorem ipsum dolor sit amet " * 120, "heading_path": "Bench > Section", "token_count": 700}
+        for i in range(total)
+    )
+    elapsed = 0.0
+    with mock.patch.object(ingest, "embed_texts", side_effect=embed):
+        for n, batch in enumerate(ingest._batches(chunks, ingest.INGEST_EMBED_BATCH)):
+            started = time.perf_counter()
+            ingest._store_batch(db, doc, version, batch, n * ingest.INGEST_EMBED_BATCH, {})
+            elapsed += time.perf_counter() - started
+    started = time.perf_counter()
+    db.commit()
+    elapsed += time.perf_counter() - started
+
+    assert db.query(Chunk).filter(Chunk.version_id == version.id).count() == total
+    db.query(Chunk).filter(Chunk.document_id == doc.id).delete()
+    db.delete(version)
+    db.delete(doc)
+    db.delete(area)
+    db.delete(user)
+    db.commit()
+    db.close()
+    engine.dispose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--database-url", default="")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or "sqlite:///" + os.path.join(tmp, "bench.db")
+        elapsed = run(url, args.chunks)
+    print("dialect:", url.split(":", 1)[0])
+    print("chunks:", args.chunks)
+    print(f"seconds: {elapsed:.2f}  (embedding stubbed; insert + commit only)")
+    print(f"chunks_per_s: {args.chunks / elapsed:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Chunking benchmark over the sample corpus in documents/, each file repeated --scale times
+(default 1000, ~12 MB of text). No OpenAI calls; tiktoken is used when installed.
+
+Run:
+  python backend/scripts/bench_chunking.py [--scale 1000] [--repeat 3]
+"""
+
+import argparse
+import resource
+import time
+from pathlib import Path
+
+from app.core.config import settings
+from app.utils.chunking import iter_chunks
+from app.utils.text_extract import iter_text_segments
+
+CORPUS = Path(__file__).resolve().parents[2] / "documents"
+
+
+def load_corpus(scale: int):
+    for path in sorted(CORPUS.rglob("*")):
+        if path.is_file():
+            yield path.name, ("\n\n".join([path.read_text(encoding="utf-8")] * scale)).encode()
+
+
+def run(scale: int):
+    chars = chunks = tokens = max_tokens = 0
+
+    def counted(segments):
+        nonlocal chars
+        for segment in segments:
+            chars += len(segment)
+            yield segment
+
+    started = time.perf_counter()
+    for name, data in load_corpus(scale):
+        for chunk in iter_chunks(
+            counted(iter_text_segments(data, name + ".md")),
+            max_tokens=1200,
+            overlap_tokens=150,
+            token_model=settings.openai_embed_model,
+        ):
+            chunks += 1
+            tokens += chunk["token_count"]
+            max_tokens = max(max_tokens, chunk["token_count"])
+    return time.perf_counter() - started, chars, chunks, tokens, max_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    best = None
+    for _ in range(args.repeat):
+        result = run(args.scale)
+        best = result if best is None or result[0] < best[0] else best
+    elapsed, chars, chunks, tokens, max_tokens = best
+    print("corpus_chars:", chars)
+    print("chunks:", chunks)
+    print("tokens:", tokens)
+    print("max_chunk_tokens:", max_tokens)
+    print(f"best_seconds: {elapsed:.2f}  (extraction + chunking, best of {args.repeat})")
+    print(f"throughput_mb_s: {chars / elapsed / 1e6:.1f}")
+    print("peak_rss_mb:", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024)
+
+
+if __name__ == "__main__":
+    main()
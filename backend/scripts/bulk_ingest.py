@@ -0,0 +1,72 @@
+"""
+Bulk-load a directory tree into the knowledge base, one area per top-level folder
+(e.g. documents/sales/* -> area "sales"). Safe to interrupt and re-run: progress is kept
+in a manifest and unchanged files are skipped. Needs OPENAI_API_KEY for embeddings.
+
+Run from backend/:
+  PYTHONPATH=. python scripts/bulk_ingest.py ../documents --user admin@studio.local [--map docs=technical]
+      [--manifest PATH] [--extract-threads 4] [--embed-threads 2] [--queue-size 32]
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from app.db.init_db import init_db
+from app.db.models import Role, User
+from app.db.session import SessionLocal
+from app.services.bulk_ingest import run_bulk_ingest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root")
+    parser.add_argument("--user", default="", help="email of the user recorded as uploader (default: first admin)")
+    parser.add_argument("--map", action="append", default=[], metavar="FOLDER=AREA_KEY")
+    parser.add_argument("--manifest", default=None, help="default: ROOT/.bulk_ingest_manifest.jsonl")
+    parser.add_argument("--extract-threads", type=int, default=4)
+    parser.add_argument("--embed-threads", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=32)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    area_map = dict(item.split("=", 1) for item in args.map)
+    with SessionLocal() as db:
+        init_db(db)
+        query = db.query(User)
+        user = (
+            query.filter(User.email == args.user).first()
+            if args.user
+            else query.filter(User.is_admin.is_(True) | User.role.in_([Role.SUPER_ADMIN.value, Role.ADMIN.value]))
+            .order_by(User.id)
+            .first()
+        )
+        if user is None:
+            parser.error(f"no user {args.user!r}" if args.user else "no admin user; pass --user")
+        user_id = user.id
+
+    started = time.monotonic()
+
+    def progress(stats):
+        elapsed = time.monotonic() - started
+        done = stats["indexed"] + stats["unchanged"]
+        print(f"[{elapsed:6.0f}s] {stats}  files/hour: {done / elapsed * 3600:.0f}", flush=True)
+
+    stats = run_bulk_ingest(
+        args.root,
+        user_id,
+        SessionLocal,
+        manifest_path=args.manifest,
+        area_map=area_map,
+        extract_threads=args.extract_threads,
+        embed_threads=args.embed_threads,
+        queue_size=args.queue_size,
+        on_progress=progress,
+    )
+    progress(stats)
+    sys.exit(1 if stats["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()